@@ -769,7 +769,8 @@ class SQLiteGridBase(wx.grid.GridTableBase):
 
     def SaveChanges(self):
         """
-        Saves the rows that have been changed in this table. Drops undo-cache.
+        Saves the rows that have been changed in this table, in a single
+        transaction that is rolled back entirely on error. Drops undo-cache.
         Returns success.
         """
         result = False
@@ -778,22 +779,22 @@ class SQLiteGridBase(wx.grid.GridTableBase):
         rels = self.db.get_related("table", self.name, own=True, clone=False)
         actions = {x["meta"].get("action"): True for x in rels.get("trigger", {}).values()}
 
+        changed_idxs, new_idxs = list(self.idx_changed), self.idx_new[:]
+        updates = [(self.rows_all[idx], self.rows_backup[idx], self.rowids.get(idx))
+                   for idx in changed_idxs]
+        inserts = [self._GetInsertValues(self.rows_all[idx]) for idx in new_idxs]
+        deletes = [(row, self.rowids.get(idx)) for idx, row in self.rows_deleted.items()]
         try:
-            for idx in self.idx_changed.copy():
-                row = self.rows_all[idx]
-                refresh, reload = self._CommitRow(row, pks, actions)
-                if refresh: refresh_idxs.append(idx)
-                if reload:  reload_idxs.append(idx)
+            insert_ids = self.db.save_rows(self.name, updates, inserts, deletes)
 
-            for idx in self.idx_new[:]:
-                row = self.rows_all[idx]
-                refresh, reload = self._CommitRow(row, pks, actions)
+            insert_ids = [None] * len(changed_idxs) + insert_ids
+            for idx, insert_id in zip(changed_idxs + new_idxs, insert_ids):
+                refresh, reload = self._FinalizeRow(self.rows_all[idx], pks, actions, insert_id)
                 if refresh: refresh_idxs.append(idx)
                 if reload:  reload_idxs.append(idx)
 
-            # Delete all newly removed rows
-            for idx, row in self.rows_deleted.copy().items():
-                self.db.delete_row(self.name, row, self.rowids.get(idx))
+            # Drop all newly removed rows
+            for idx in list(self.rows_deleted):
                 del self.rows_deleted[idx]
                 del self.rows_all[idx]
                 self.idx_all.remove(idx)
@@ -894,12 +895,13 @@ class SQLiteGridBase(wx.grid.GridTableBase):
         """
         if not rowdatas or not self.rows_all or "table" != self.category: return
         rows_before = self.GetNumberRows()
+        has_rowid = self.db.has_rowid(self.name)
+        rowid_idxs = {v: k for k, v in self.rowids.items()} # {rowid: idx}
 
         for rowdata in rowdatas:
             idx = None
-            if self.rowid_name in rowdata and self.db.has_rowid(self.name):
-                idx = next((k for k, v in self.rowids.items()
-                            if v == rowdata[self.rowid_name]), None)
+            if self.rowid_name in rowdata and has_rowid:
+                idx = rowid_idxs.get(rowdata[self.rowid_name])
             else:
                 idx = next((i for i, x in self.rows_backup.items()
                             if all(v == x[k] for k, v in rowdata.items())), None)
@@ -1332,12 +1334,32 @@ class SQLiteGridBase(wx.grid.GridTableBase):
         Saves changes to the specified row, returns
         (whether should refresh data in grid, whether should reload data from db).
         """
+        row, idx, insert_id = rowdata, rowdata[self.KEY_ID], None
+        if idx in self.idx_changed:
+            self.db.update_row(self.name, row, self.rows_backup[idx],
+                               self.rowids.get(idx))
+        elif idx in self.idx_new:
+            insert_id = self.db.insert_row(self.name, self._GetInsertValues(row))
+        return self._FinalizeRow(row, pks, actions, insert_id)
+
+
+    def _GetInsertValues(self, rowdata):
+        """Returns {column: value} for inserting the specified new row, skipping NULLs."""
+        return {c["name"]: rowdata[c["name"]] for c in self.columns
+                if rowdata[c["name"]] is not None}
+
+
+    def _FinalizeRow(self, rowdata, pks, actions, insert_id=None):
+        """
+        Clears changed or new status of the specified row after saving, returns
+        (whether should refresh data in grid, whether should reload data from db).
+
+        @param   insert_id  ID of inserted row, if row was new
+        """
         refresh, reload = False, False
 
         row, idx = rowdata, rowdata[self.KEY_ID]
         if idx in self.idx_changed:
-            self.db.update_row(self.name, row, self.rows_backup[idx],
-                               self.rowids.get(idx))
             row[self.KEY_CHANGED] = False
             self.idx_changed.remove(idx)
             del self.rows_backup[idx]
@@ -1345,11 +1367,8 @@ class SQLiteGridBase(wx.grid.GridTableBase):
             if grammar.SQL.UPDATE in actions: reload = True
         elif idx in self.idx_new:
             col_map = dict((c["name"], c) for c in self.columns)
-            row0 = {c["name"]: row[c["name"]] for c in self.columns
-                    if row[c["name"]] is not None}
-            has_defaults = any("default" in x and x["name"] not in row0
+            has_defaults = any("default" in x and row[x["name"]] is None
                                for x in self.columns)
-            insert_id = self.db.insert_row(self.name, row0)
             if len(pks) == 1 and row[pks[0]] in (None, "") \
             and "INTEGER" == self.db.get_affinity(col_map[pks[0]]):
                 # Autoincremented row: update with new value
@@ -8478,9 +8497,13 @@ class DataDialog(wx.Dialog):
 
 class HistoryDialog(wx.Dialog):
     """
-    Dialog for showing SQL query history.
+    Dialog for showing SQL query history, loading older entries on request.
     """
 
+    """Number of log entries to load at a time."""
+    PAGE_SIZE = 500
+
+
     def __init__(self, parent, db, id=wx.ID_ANY,
                  title="Action history", pos=wx.DefaultPosition, size=(650, 400),
                  style=wx.CAPTION | wx.CLOSE_BOX | wx.MAXIMIZE_BOX | wx.RESIZE_BORDER,
@@ -8489,7 +8512,9 @@ class HistoryDialog(wx.Dialog):
         @param   db  database.Database instance
         """
         super(HistoryDialog, self).__init__(parent, id, title, pos, size, style, name)
-        self._log = [{k: self._Convert(v) for k, v in x.items()} for x in db.log]
+        self._db    = db
+        self._start = max(0, len(db.log) - self.PAGE_SIZE) # Index of first loaded entry
+        self._log = [{k: self._Convert(v) for k, v in x.items()} for x in db.log.get(self._start)]
         self._filter = "" # Current filter
         self._filter_timer  = None # Filter callback timer
         self._hovered_cell  = None # (row, col)
@@ -8504,9 +8529,11 @@ class HistoryDialog(wx.Dialog):
                                                         style=wx.TE_PROCESS_ENTER)
         grid   = self._grid = wx.grid.Grid(self)
         button = wx.Button(self, label="Close")
+        button_older = self._button_older = wx.Button(self, label="Load &older")
 
         sizer_top.Add(info, flag=wx.ALIGN_CENTER_VERTICAL)
         sizer_top.AddStretchSpacer()
+        sizer_top.Add(button_older, border=5, flag=wx.RIGHT)
         sizer_top.Add(search)
 
         sizer.Add(sizer_top, border=5, flag=wx.ALL | wx.GROW)
@@ -8514,6 +8541,7 @@ class HistoryDialog(wx.Dialog):
         sizer.Add(button,    border=5, flag=wx.ALL | wx.ALIGN_CENTER_HORIZONTAL)
 
         search.ToolTip = "Filter list (%s-F)" % controls.KEYS.NAME_CTRL
+        button_older.ToolTip = "Load %s older entries" % self.PAGE_SIZE
         grid.CreateGrid(0, 4)
         grid.SetDefaultCellOverflow(False)
         grid.SetDefaultEditor(wx.grid.GridCellAutoWrapStringEditor())
@@ -8534,6 +8562,7 @@ class HistoryDialog(wx.Dialog):
         search.Bind(wx.EVT_TEXT_ENTER, self._OnFilter)
         self.Bind(wx.EVT_SIZE,         self._OnSize)
         self.Bind(wx.EVT_BUTTON,       self._OnClose, button)
+        self.Bind(wx.EVT_BUTTON,       self._OnLoadOlder, button_older)
         self.Bind(wx.EVT_CLOSE,        self._OnClose)
         grid.Bind(wx.grid.EVT_GRID_CELL_CHANGED, lambda e: e.Veto())
         grid.Bind(wx.grid.EVT_GRID_ROW_SIZE,     self._OnGridSizeRow)
@@ -8583,6 +8612,16 @@ class HistoryDialog(wx.Dialog):
         else: do_filter(search)
 
 
+    def _OnLoadOlder(self, event=None):
+        """Handler for clicking to load older entries, prepends next page to list."""
+        if not self._start: return
+        start = max(0, self._start - self.PAGE_SIZE)
+        entries = self._db.log.get(start, self._start - start)
+        self._log[:0] = [{k: self._Convert(v) for k, v in x.items()} for x in entries]
+        self._start = start
+        self._Populate()
+
+
     def _OnGridHover(self, event):
         """
         Handler for hovering the mouse over a grid, shows cell value tooltip."""
@@ -8683,7 +8722,8 @@ class HistoryDialog(wx.Dialog):
                 grid.AppendRows(1)
                 i = grid.NumberRows - 1
                 grid.SetCellValue(i, 0, data["timestamp"])
-                grid.SetCellValue(i, 1, data["action"])
+                grid.SetCellValue(i, 1, data["action"] if not data.get("count") else
+                                        "%s (%s times)" % (data["action"], data["count"]))
                 grid.SetCellValue(i, 2, data["sql"])
                 if data.get("params"): grid.SetCellValue(i, 3, data["params"])
                 grid.SetCellFont(i, 2, font_mono)
@@ -8692,9 +8732,10 @@ class HistoryDialog(wx.Dialog):
             for i in range(grid.NumberRows):
                 grid.SetRowSize(i, min(grid.Size.height, grid.GetRowSize(i)))
             self._info.Label = util.plural("item", grid.NumberRows)
-            if grid.NumberRows != len(log):
+            if grid.NumberRows != len(log) or self._start:
                 self._info.Label = "%s visible (%s in total)" % \
-                                   (util.plural("item", grid.NumberRows), len(log))
+                                   (util.plural("item", grid.NumberRows), len(log) + self._start)
+            self._button_older.Enable(bool(self._start))
             self._OnSize()
         finally: self.Thaw()
         self.Refresh()
@@ -8708,6 +8749,274 @@ class HistoryDialog(wx.Dialog):
 
 
 
+class ProfileDialog(wx.Dialog):
+    """
+    Dialog for collecting and showing SQL statement profile.
+    """
+
+    COLUMNS = [("calls", "Calls"), ("statements", "Statements"), ("time", "Total ms"),
+               ("mean", "Mean ms"), ("p95", "P95 ms"), ("rows", "Rows"),
+               ("written", "Written"), ("sql", "SQL")]
+
+
+    def __init__(self, parent, db, id=wx.ID_ANY,
+                 title="SQL profile", pos=wx.DefaultPosition, size=(750, 400),
+                 style=wx.CAPTION | wx.CLOSE_BOX | wx.MAXIMIZE_BOX | wx.RESIZE_BORDER,
+                 name=wx.DialogNameStr):
+        """
+        @param   db  database.Database instance
+        """
+        super(ProfileDialog, self).__init__(parent, id, title, pos, size, style, name)
+        self._db = db
+        self._sort = "time" # Current sort field
+
+        sizer  = self.Sizer = wx.BoxSizer(wx.VERTICAL)
+        sizer_top     = wx.BoxSizer(wx.HORIZONTAL)
+        sizer_buttons = wx.BoxSizer(wx.HORIZONTAL)
+
+        cb_enable = self._cb_enable = wx.CheckBox(self, label="&Profile SQL statements")
+        info      = self._info      = wx.StaticText(self)
+        grid      = self._grid      = wx.grid.Grid(self)
+        button_refresh = wx.Button(self, label="&Refresh")
+        button_clear   = wx.Button(self, label="C&lear")
+        button_close   = wx.Button(self, label="Close")
+
+        sizer_top.Add(cb_enable, flag=wx.ALIGN_CENTER_VERTICAL)
+        sizer_top.AddStretchSpacer()
+        sizer_top.Add(info, flag=wx.ALIGN_CENTER_VERTICAL)
+        sizer_buttons.Add(button_refresh)
+        sizer_buttons.Add(button_clear, border=5, flag=wx.LEFT)
+        sizer_buttons.Add(button_close, border=5, flag=wx.LEFT)
+
+        sizer.Add(sizer_top,     border=5, flag=wx.ALL | wx.GROW)
+        sizer.Add(grid,          border=5, proportion=1, flag=wx.LEFT | wx.RIGHT | wx.GROW)
+        sizer.Add(sizer_buttons, border=5, flag=wx.ALL | wx.ALIGN_CENTER_HORIZONTAL)
+
+        cb_enable.Value = bool(db.profiler)
+        cb_enable.ToolTip = "Record timings of all SQL statements run in database"
+        button_clear.ToolTip = "Drop collected statistics"
+        grid.CreateGrid(0, len(self.COLUMNS))
+        grid.SetDefaultCellOverflow(False)
+        grid.EnableEditing(False)
+        for i, (_, label) in enumerate(self.COLUMNS): grid.SetColLabelValue(i, label)
+        grid.SetColLabelSize(20)
+        grid.SetRowLabelSize(50)
+        grid.SetMargins(0, 0)
+        ColourManager.Manage(grid, "DefaultCellBackgroundColour", wx.SYS_COLOUR_WINDOW)
+        ColourManager.Manage(grid, "DefaultCellTextColour",       wx.SYS_COLOUR_WINDOWTEXT)
+        ColourManager.Manage(grid, "LabelBackgroundColour",       wx.SYS_COLOUR_BTNFACE)
+        ColourManager.Manage(grid, "LabelTextColour",             wx.SYS_COLOUR_WINDOWTEXT)
+
+        self.Bind(wx.EVT_CHECKBOX, self._OnToggle,   cb_enable)
+        self.Bind(wx.EVT_BUTTON,   self._Populate,   button_refresh)
+        self.Bind(wx.EVT_BUTTON,   self._OnClear,    button_clear)
+        self.Bind(wx.EVT_BUTTON,   self._OnClose,    button_close)
+        self.Bind(wx.EVT_CLOSE,    self._OnClose)
+        grid.Bind(wx.grid.EVT_GRID_LABEL_LEFT_CLICK, self._OnSort)
+
+        wx_accel.accelerate(self)
+        self.Layout()
+        self._Populate()
+        self.CenterOnParent()
+        self.MinSize = (400, 300)
+
+
+    def _OnToggle(self, event):
+        """Handler for toggling profiling, starts or stops collecting statistics."""
+        profiler = (self._db.profiler or database.Profiler()) if event.IsChecked() else None
+        self._db.set_profiler(profiler)
+        self._Populate()
+
+
+    def _OnClear(self, event):
+        """Handler for clicking to clear statistics."""
+        if self._db.profiler: self._db.profiler.clear()
+        self._Populate()
+
+
+    def _OnSort(self, event):
+        """Handler for clicking a column label, sorts by column if numeric."""
+        if 0 <= event.Col < len(self.COLUMNS) - 1:
+            self._sort = self.COLUMNS[event.Col][0]
+            self._Populate()
+
+
+    def _Populate(self, event=None):
+        """Populates grid with current profile statistics."""
+        if not self: return
+        grid, profiler = self._grid, self._db.profiler
+        stats = profiler.get_stats(self._sort) if profiler else []
+        self.Freeze()
+        try:
+            if grid.NumberRows: grid.DeleteRows(0, grid.NumberRows)
+            if stats: grid.AppendRows(len(stats))
+            for i, data in enumerate(stats):
+                for j, (name, _) in enumerate(self.COLUMNS):
+                    value = data[name]
+                    if name in ("time", "mean", "p95"): value = "%.2f" % (value * 1000)
+                    grid.SetCellValue(i, j, util.to_unicode(value))
+                    if name != "sql": grid.SetCellAlignment(i, j, wx.ALIGN_RIGHT, wx.ALIGN_CENTER)
+            self._info.Label = "%s, %.3f seconds in total" % (
+                util.plural("statement shape", stats), sum(x["time"] for x in stats)
+            ) if profiler else "Profiling disabled"
+            grid.AutoSizeColumns(setAsMin=False)
+            self.Layout()
+        finally: self.Thaw()
+
+
+    def _OnClose(self, event=None):
+        """Handler for closing dialog."""
+        if event: event.Skip()
+        elif self.IsModal(): wx.CallAfter(self.EndModal, wx.OK)
+        if self.IsModal(): wx.CallAfter(lambda: self and self.Destroy())
+
+
+
+class DiffDialog(wx.Dialog):
+    """
+    Dialog for comparing database with another database file, showing
+    schema differences and row difference counts per table, with option
+    to save SQL patch changing database into the other.
+    """
+
+    COLUMNS = [("type", "Type"), ("name", "Name"), ("change", "Difference")]
+
+
+    def __init__(self, parent, db, filename, id=wx.ID_ANY,
+                 title="Compare databases", pos=wx.DefaultPosition, size=(600, 400),
+                 style=wx.CAPTION | wx.CLOSE_BOX | wx.MAXIMIZE_BOX | wx.RESIZE_BORDER,
+                 name=wx.DialogNameStr):
+        """
+        @param   db        database.Database instance
+        @param   filename  path of database file to compare against
+        """
+        super(DiffDialog, self).__init__(parent, id, title, pos, size, style, name)
+        self._db       = db
+        self._filename = filename
+        self._diff     = None  # database.DatabaseDiff when comparison completed
+        self._schema   = []    # [{category, name, change}] schema differences
+        self._tables   = util.CaselessDict() # {table name: grid row index}
+        self._worker   = workers.DiffThread(self._OnWorkerResult)
+
+        sizer  = self.Sizer = wx.BoxSizer(wx.VERTICAL)
+        sizer_buttons = wx.BoxSizer(wx.HORIZONTAL)
+
+        info   = wx.StaticText(self, label="Comparing %s\nwith %s" % (db, filename))
+        status = self._status = wx.StaticText(self, label="Comparing..")
+        grid   = self._grid   = wx.grid.Grid(self)
+        button_patch = self._button_patch = wx.Button(self, label="Save SQL &patch")
+        button_close = wx.Button(self, label="Close")
+
+        sizer_buttons.Add(button_patch)
+        sizer_buttons.Add(button_close, border=5, flag=wx.LEFT)
+
+        sizer.Add(info,          border=5, flag=wx.ALL | wx.GROW)
+        sizer.Add(status,        border=5, flag=wx.LEFT | wx.RIGHT | wx.BOTTOM | wx.GROW)
+        sizer.Add(grid,          border=5, proportion=1, flag=wx.LEFT | wx.RIGHT | wx.GROW)
+        sizer.Add(sizer_buttons, border=5, flag=wx.ALL | wx.ALIGN_CENTER_HORIZONTAL)
+
+        button_patch.ToolTip = "Save SQL script changing this database into the other"
+        button_patch.Enable(False)
+        grid.CreateGrid(0, len(self.COLUMNS))
+        grid.SetDefaultCellOverflow(False)
+        grid.EnableEditing(False)
+        for i, (_, label) in enumerate(self.COLUMNS): grid.SetColLabelValue(i, label)
+        grid.SetColLabelSize(20)
+        grid.SetRowLabelSize(0)
+        grid.SetMargins(0, 0)
+        ColourManager.Manage(grid, "DefaultCellBackgroundColour", wx.SYS_COLOUR_WINDOW)
+        ColourManager.Manage(grid, "DefaultCellTextColour",       wx.SYS_COLOUR_WINDOWTEXT)
+        ColourManager.Manage(grid, "LabelBackgroundColour",       wx.SYS_COLOUR_BTNFACE)
+        ColourManager.Manage(grid, "LabelTextColour",             wx.SYS_COLOUR_WINDOWTEXT)
+
+        self.Bind(wx.EVT_BUTTON, self._OnSavePatch, button_patch)
+        self.Bind(wx.EVT_BUTTON, self._OnClose,     button_close)
+        self.Bind(wx.EVT_CLOSE,  self._OnClose)
+
+        wx_accel.accelerate(self)
+        self.Layout()
+        self.CenterOnParent()
+        self.MinSize = (400, 300)
+        self._worker.work({"db": db, "filename": filename})
+
+
+    def _AddRow(self, values):
+        """Appends row to grid, returns row index."""
+        grid = self._grid
+        grid.AppendRows(1)
+        for i, value in enumerate(values):
+            grid.SetCellValue(grid.NumberRows - 1, i, util.to_unicode(value))
+        grid.AutoSizeColumns(setAsMin=False)
+        return grid.NumberRows - 1
+
+
+    def _OnWorkerResult(self, result):
+        """Handler for getting results from diff thread, populates grid."""
+        def after():
+            if not self: return
+            if "error" in result:
+                self._status.Label = "Error: %s" % result["error"]
+            elif "schema" in result:
+                self._schema = result["schema"]
+                for item in result["schema"]:
+                    self._AddRow([item["category"].capitalize(),
+                                  util.unprint(item["name"]), item["change"]])
+            elif "table" in result:
+                name = result["table"]
+                if name not in self._tables:
+                    self._tables[name] = self._AddRow(["Table data", util.unprint(name), ""])
+                counts = result.get("counts") or {}
+                if result.get("skipped"):
+                    text = "no common primary key or ROWID, not compared"
+                elif "count" in result:
+                    text = "comparing, %s scanned" % util.plural("row", result["count"])
+                elif not any(counts.values()):
+                    text = "identical"
+                else:
+                    text = ", ".join("%s %s" % (counts[k], label) for k, label in
+                                     (("-", "removed"), ("+", "added"), ("~", "changed"))
+                                     if counts[k])
+                    text += " %s" % util.plural("row", sum(counts.values()), numbers=False)
+                self._grid.SetCellValue(self._tables[name], 2, text)
+                self._grid.AutoSizeColumns(setAsMin=False)
+            elif "done" in result:
+                self._diff = result["diff"]
+                changes = bool(self._schema) or \
+                          any(any(x.values()) for x in self._diff.counts.values())
+                self._status.Label = "Databases differ." if changes else "Databases are identical."
+                self._button_patch.Enable(changes)
+            elif "patch" in result:
+                self._status.Label = "Saved SQL patch to %s." % result["patch"]
+                self._button_patch.Enable()
+                guibase.status("Saved SQL patch to %s.", result["patch"], log=True)
+            self.Layout()
+        wx.CallAfter(after)
+
+
+    def _OnSavePatch(self, event):
+        """Handler for clicking to save SQL patch, asks for file and starts writing."""
+        dialog = wx.FileDialog(self, message="Save SQL patch",
+            wildcard="SQL file (*.sql)|*.sql|All files|*.*",
+            defaultFile=util.safe_filename("%s differences.sql" % os.path.basename(self._db.name)),
+            style=wx.FD_OVERWRITE_PROMPT | wx.FD_SAVE | wx.FD_CHANGE_DIR | wx.RESIZE_BORDER
+        )
+        if wx.ID_OK != dialog.ShowModal(): return
+        filename = controls.get_dialog_path(dialog)
+        self._button_patch.Disable()
+        self._status.Label = "Writing SQL patch.."
+        self._worker.work({"diff": self._diff, "patch": filename})
+
+
+    def _OnClose(self, event=None):
+        """Handler for closing dialog, stops comparison and closes compared database."""
+        self._worker.stop()
+        if self._diff: util.try_ignore(self._diff.db2.close)
+        if event: event.Skip()
+        elif self.IsModal(): wx.CallAfter(self.EndModal, wx.OK)
+        if self.IsModal(): wx.CallAfter(lambda: self and self.Destroy())
+
+
+
 class ColumnDialog(wx.Dialog):
 
     IMAGE_FORMATS = {
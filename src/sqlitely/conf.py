@@ -58,21 +58,26 @@ ConfigFileStatic = False
 """List of attribute names that can be saved to and loaded from ConfigFile."""
 FileDirectives = ["AllowMultipleInstances", "ConsoleHistoryCommands", "DBFiles",
     "DBSort", "LastActivePages", "LastExportType", "LastSearchResults",
-    "LastSelectedFiles", "LastUpdateCheck", "ParseCache", "Plugins", "RecentFiles",
+    "LastSelectedFiles", "LastUpdateCheck", "Plugins", "RecentFiles",
     "SchemaDiagrams", "SearchHistory", "SearchInMeta", "SearchInData",
-    "SearchUseNewTab", "SearchCaseSensitive", "SQLWindowTexts", "TextLineNumbers",
+    "SearchUseNewTab", "SearchCaseSensitive", "SearchIndexKind", "SQLWindowTexts", "TextLineNumbers",
     "TextWordWraps", "TrayIconEnabled", "UpdateCheckAutomatic", "WindowMaximized",
     "WindowMinimizedToTray", "WindowPosition", "WindowSize",
 ]
 """List of user-modifiable attributes, saved if changed from default."""
 OptionalFileDirectives = [
     "DBExtensions", "ExportOptions", "LogSQL", "MinWindowSize",
+    "AnalysisLimit", "BackupPageStep", "BackupPause", "MaxActionLogEntries",
+    "CountCacheFile", "MaxCountCacheSize", "DiffChunkSize",
     "MaxConsoleHistory", "MaxDBSizeForFullCount", "MaxTableRowIDForFullCount",
     "MaxHistoryInitialMessages", "MaxImportFilesizeForCount", "MaxRecentFiles",
-    "MaxSearchHistory", "MaxSearchResults", "MaxParseCache", "PopupUnexpectedErrors",
-    "RunChecksums", "RunStatistics", "SchemaDiagramEnabled", "SearchResultsChunk",
-    "SeekLength", "SeekLeapLength", "StatisticsPlotWidth", "StatusFlashLength",
-    "UpdateCheckInterval",
+    "MaxSearchHistory", "MaxSearchResults", "MaxParseCacheSize", "MaxParseProcesses",
+    "MaxProfileStatements", "MaxReadConnections", "MinItemsForParallelParse",
+    "ParseCacheFile", "PopupUnexpectedErrors", "SnapshotPragmas",
+    "RunChecksums", "RunContentChecksums", "RunStatistics", "SchemaDiagramEnabled",
+    "SearchResultsChunk",
+    "SeekLength", "SeekLeapLength", "SpillActionLog", "StatisticsPlotWidth",
+    "StatusFlashLength", "UpdateCheckInterval",
 ]
 Defaults = {}
 
@@ -121,6 +126,18 @@ MaxDBSizeForFullCount = 500000000
 """Maximum table ROWID for doing full COUNT(*) if database size over MaxDBSizeForFullCount."""
 MaxTableRowIDForFullCount = 1000
 
+"""
+Path to persistent cache of exact table row counts, shared by GUI and command line,
+defaults to user-specific cache directory. None disables persistent cache.
+"""
+CountCacheFile = os.path.join(EtcDirectory, "%s.counts" % Title.lower())
+
+"""Maximum size of persistent cache of table row counts, in bytes."""
+MaxCountCacheSize = 10 * 1e6
+
+"""Approximate number of index rows examined per index in ANALYZE for row count statistics."""
+AnalysisLimit = 1000
+
 """Maximum import file size to do full row count for."""
 MaxImportFilesizeForCount = 10 * 1e6
 
@@ -130,9 +147,6 @@ SeekLength = 100
 """Number of rows to seek ahead on data grids, when scrolling freely or jumping to data grid bottom."""
 SeekLeapLength = 10000
 
-"""Cached parse results, as {CREATE SQL: {meta}}."""
-ParseCache = {}
-
 """
 User-defined plugins, as {category: [{..}]}.
 
@@ -146,6 +160,12 @@ RecentFiles = []
 """Run checksum calculations automatically (may take a while for large databases)."""
 RunChecksums = True
 
+"""
+Include content checksum over table rows in checksum calculations,
+independent of file layout (reads all table data).
+"""
+RunContentChecksums = False
+
 """Run statistics analysis automatically (may take a while for large databases)."""
 RunStatistics = True
 
@@ -173,6 +193,14 @@ SearchInMeta = False
 """Whether to search in all columns of all tables and views."""
 SearchInData = True
 
+"""
+Full-text index to narrow down data search with, kept in a file next to
+the database and updated before each search: "words" for matching words
+from word starts only, "trigram" for prefiltering exact substring matches,
+None for searching without index.
+"""
+SearchIndexKind = None
+
 """Texts in SQL window, loaded on reopening a database {filename: [(name, text), ], }."""
 SQLWindowTexts = {}
 
@@ -239,12 +267,60 @@ ConsoleSize = (800, 300)
 """Maximum number of console history commands to store."""
 MaxConsoleHistory = 1000
 
-"""Maximum number of cached SQL parse results."""
-MaxParseCache = 500
+"""
+Path to persistent cache of SQL parse results, shared by GUI and command line,
+defaults to user-specific cache directory. None disables persistent cache.
+"""
+ParseCacheFile = os.path.join(EtcDirectory, "%s.cache" % Title.lower())
+
+"""Maximum size of persistent cache of SQL parse results, in bytes."""
+MaxParseCacheSize = 100 * 1e6
+
+"""
+Maximum number of read-only connections a database keeps open
+for background workers, in addition to the main connection.
+"""
+MaxReadConnections = 4
+
+"""Maximum number of worker processes for parsing schema SQL, 0 disables."""
+MaxParseProcesses = 4
+
+"""Minimum number of unparsed schema items for parsing in worker processes."""
+MinItemsForParallelParse = 500
 
 """Maximum number of search texts to store."""
 MaxSearchHistory = 500
 
+"""
+PRAGMA settings for databases opened in read-only snapshot mode,
+as {name: value}, tuned for sequential reading.
+"""
+SnapshotPragmas = {"cache_size": -65536, "mmap_size": 268435456, "temp_store": "MEMORY"}
+
+"""Number of database pages to copy per step in online backup."""
+BackupPageStep = 4096
+
+"""Pause between online backup steps in seconds, letting other queries run."""
+BackupPause = 0.005
+
+"""
+Number of rows per key range hashed at once when comparing table data
+of two databases, differing ranges compared row by row.
+"""
+DiffChunkSize = 10000
+
+"""Maximum number of statements listed in SQL profile report."""
+MaxProfileStatements = 20
+
+"""Maximum number of database action log entries to keep in memory."""
+MaxActionLogEntries = 1000
+
+"""
+Whether to write database action log entries exceeding MaxActionLogEntries
+to a temporary file instead of discarding them.
+"""
+SpillActionLog = True
+
 """Days between automatic update checks."""
 UpdateCheckInterval = 7
 
@@ -356,7 +432,7 @@ def load(configfile=None):
 
     @param   configfile  name of configuration file to use from now if not module defaults
     """
-    global Defaults, ConfigFile, ConfigFileStatic
+    global Defaults, ConfigFile, ConfigFileStatic, CountCacheFile, ParseCacheFile
 
     try: VARTYPES = (basestring, bool, float, int, long, list, tuple, dict, type(None))        # Py2
     except Exception: VARTYPES = (bytes, str, float, bool, int, list, tuple, dict, type(None)) # Py3
@@ -378,6 +454,11 @@ def load(configfile=None):
             # Try user-specific path first, then path under application folder
             if userpath not in configpaths: configpaths.insert(0, userpath)
         except Exception: pass
+        try:
+            p = appdirs.user_cache_dir(Title, appauthor=False)
+            ParseCacheFile = os.path.join(p, "%s.cache" % Title.lower())
+            CountCacheFile = os.path.join(p, "%s.counts" % Title.lower())
+        except Exception: pass
 
     section = "*"
     module = sys.modules[__name__]
@@ -11,18 +11,27 @@ Released under the MIT License.
 @modified    09.06.2024
 ------------------------------------------------------------------------------
 """
-from collections import defaultdict, OrderedDict
+from collections import defaultdict, deque, OrderedDict
+try: from collections.abc import Mapping  # Py3
+except ImportError: from collections import Mapping  # Py2
 import copy
 import datetime
+import hashlib
 import itertools
 import json
 import logging
 import math
+import multiprocessing
 import os
+import pickle
+try: import Queue as queue        # Py2
+except ImportError: import queue  # Py3
 import re
 import sqlite3
 import sys
 import tempfile
+import threading
+import time
 
 import six
 import step
@@ -33,6 +42,15 @@ from . import conf
 from . import grammar
 from . import templates
 
+"""Persistent cache of exact table row counts, as util.DiskCache if set."""
+COUNT_CACHE = None
+
+"""SQL statement profiler for all opened databases, as Profiler if set."""
+PROFILER = None
+
+"""Resultset value types converted to strings in rows."""
+BINARY_TYPES = (six.binary_type, memoryview) + ((buffer, ) if sys.version_info < (3, ) else ())
+
 logger = logging.getLogger(__name__)
 
 
@@ -57,7 +75,9 @@ class Database(object):
 
     """SQLite features and the runtime library version they appeared in."""
     FEATURE_SUPPORT = {"full_rename_table": (3, 25), "rename_column": (3, 25),
-                       "strict":            (3, 37), "view_columns":  (3,  9)}
+                       "strict":            (3, 37), "view_columns":  (3,  9),
+                       "pragma_functions":  (3, 16), "analysis_limit": (3, 32),
+                       "row_values":        (3, 15), "vacuum_into":    (3, 27)}
 
     """
     SQLite PRAGMA settings, as {
@@ -470,12 +490,19 @@ WARNING: misuse can easily result in a corrupt database file.""",
         "shrink_memory", "soft_heap_limit", "table_info", "wal_checkpoint"
     ]
 
+    """Maximum number of modifying SQL statements to remember affected tables for."""
+    MAX_WRITE_STATEMENTS = 1000
+
+    """PRAGMA directives found unavailable as table-valued functions, like pragma_mmap_size()."""
+    PRAGMA_NONFUNCTIONS = set()
+
     """Temporary file name counter."""
     temp_counter = 1
 
 
 
-    def __init__(self, filename=None, log_error=True, parse=False):
+    def __init__(self, filename=None, log_error=True, parse=False,
+                 snapshot=False, immutable=False):
         """
         Initializes a new database object from the file.
 
@@ -484,6 +511,11 @@ WARNING: misuse can easily result in a corrupt database file.""",
         @param   log_error  if False, exceptions on opening the database
                             are not written to log (written by default)
         @param   parse      parse all CREATE statements in full, complete metadata
+        @param   snapshot   open database read-only and keep one read transaction
+                            for the lifetime of the connection, giving a consistent
+                            view of a database that other processes may be writing to
+        @param   immutable  in snapshot mode, assume database file is not changed
+                            by anyone while open, skipping all locking
         """
         self.filename = filename
         self.name = filename
@@ -499,7 +531,7 @@ WARNING: misuse can easily result in a corrupt database file.""",
         self.journalsizes = {} # {"wal" or "journal": size in bytes}
         self.date_created = None
         self.last_modified = None
-        self.log = [] # [{timestamp, action, sql: "" or [""], ?params: x or [x]}]
+        self.log = ActionLog() # [{timestamp, action, sql: "" or [""], ?params: x or [x]}]
         self.compile_options = []
         self.consumers = set() # Registered objects using this database
         # {category: {name.lower(): set(lock key, )}}
@@ -512,6 +544,19 @@ WARNING: misuse can easily result in a corrupt database file.""",
         #      ?meta: {full metadata}}}}
         self.schema = defaultdict(CaselessDict)
         self.connection = None
+        self.readers = {} # {threading.Thread: read-only sqlite3.Connection}
+        self.readerlock = threading.RLock()
+        self.schema_version = None # PRAGMA schema_version at last full schema populate
+        self.data_version   = None # PRAGMA data_version at last full table count
+        self.written = set() # Lowercase names of tables modified since last count
+        self.writesqls = OrderedDict() # {executed SQL: set(lowercase table names modified)}
+        self.writes = defaultdict(int) # {lowercase table name: number of writes registered}
+        self.sql_current = threading.local() # .sql: SQL being prepared in thread, if any
+        self.relations = None # Dependency graph of schema items, see get_relations()
+        self.rowkeys = (None, None) # (cursor.description, [column name, ]) of last row
+        self.profiler = PROFILER # Profiler collecting SQL statement statistics, if any
+        self.snapshot  = snapshot  # Whether database is open in one read-only transaction
+        self.immutable = immutable # Whether snapshot is opened without locking
         self.open(log_error=log_error, parse=parse)
 
 
@@ -523,12 +568,18 @@ WARNING: misuse can easily result in a corrupt database file.""",
         """Opens the database, if not already open."""
         if self.connection: return
         try:
-            self.connection = sqlite3.connect(self.filename, check_same_thread=False,
-                                              isolation_level=None) # Autocommit mode
+            if self.snapshot: self.connection = self.connect_snapshot()
+            else: self.connection = sqlite3.connect(self.filename, check_same_thread=False,
+                                                    isolation_level=None) # Autocommit mode
             self.connection.row_factory = self.row_factory
             self.connection.text_factory = six.binary_type
+            self.connection.set_authorizer(self.authorize)
+            self.set_profiler(self.profiler)
+            self.schema_version = self.data_version = None
+            self.written.clear(), self.writesqls.clear()
             self.compile_options = [next(iter(x.values())) for x in
                                     self.execute("PRAGMA compile_options", log=False).fetchall()]
+            if self.snapshot: self.execute("BEGIN", log=False)
             self.populate_schema(parse=parse)
             self.update_fileinfo()
         except Exception:
@@ -542,6 +593,7 @@ WARNING: misuse can easily result in a corrupt database file.""",
 
     def close(self):
         """Closes the database if open, and frees all allocated data."""
+        self.close_readers()
         if self.connection:
             try: self.connection.close()
             except Exception: pass
@@ -550,10 +602,13 @@ WARNING: misuse can easily result in a corrupt database file.""",
             try: os.unlink(self.filename)
             except Exception: pass
         self.schema.clear()
+        self.relations = None
+        self.log.close()
 
 
     def reopen(self, filename):
         """Opens the database with a new file, closing current connection if any."""
+        self.close_readers()
         if self.connection:
             try: self.connection.close()
             except Exception: pass
@@ -563,6 +618,245 @@ WARNING: misuse can easily result in a corrupt database file.""",
         self.open()
 
 
+    def connect_snapshot(self):
+        """
+        Returns a new read-only connection to database file, with settings from
+        conf.SnapshotPragmas for sequential reading.
+        """
+        target, kwargs = self.filename, {}
+        if sys.version_info >= (3, 4):
+            path = six.moves.urllib.request.pathname2url(os.path.abspath(self.filename))
+            target = "file:%s?mode=ro%s" % (path, "&immutable=1" if self.immutable else "")
+            kwargs = dict(uri=True)
+        connection = sqlite3.connect(target, check_same_thread=False,
+                                     isolation_level=None, **kwargs)
+        for name, value in conf.SnapshotPragmas.items():
+            try: connection.execute("PRAGMA %s = %s" % (name, value))
+            except Exception:
+                logger.warning("Error setting PRAGMA %s = %s on %s.",
+                               name, value, self.filename, exc_info=True)
+        return connection
+
+
+    def get_reader(self):
+        """
+        Returns a read-only connection for the current thread, opening a new one
+        if pool is not full. Returns main connection instead if database is not
+        in WAL mode, as readers would block writes, or if pool is full,
+        or if database is open in snapshot mode.
+        """
+        if not self.connection or self.snapshot or sys.version_info < (3, 4):
+            return self.connection
+        thread = threading.current_thread()
+        with self.readerlock:
+            if thread in self.readers: return self.readers[thread]
+
+            for t in [t for t in self.readers if not t.is_alive()]:
+                util.try_ignore(self.readers.pop(t).close)
+            if len(self.readers) >= conf.MaxReadConnections: return self.connection
+
+            if not self.is_wal():
+                self.close_readers()
+                return self.connection
+
+            connection = self.connect_reader()
+            if not connection: return self.connection
+            self.readers[thread] = connection
+            return connection
+
+
+    def is_wal(self):
+        """
+        Returns whether database is in WAL journal mode, where separate
+        read connections do not block writes on main connection.
+        """
+        mode = None
+        try:
+            row = self.execute("PRAGMA journal_mode", log=False).fetchone()
+            mode = next(iter(row.values()), None)
+        except Exception: pass
+        return "wal" == (mode or "").lower()
+
+
+    def connect_reader(self):
+        """
+        Returns a new read-only connection to database file, not part of
+        reader pool, or None if not possible or database is open in snapshot mode,
+        as other connections would not share its transaction.
+        """
+        if not self.connection or self.snapshot or sys.version_info < (3, 4): return None
+        try:
+            path = six.moves.urllib.request.pathname2url(os.path.abspath(self.filename))
+            connection = sqlite3.connect("file:%s?mode=ro" % path, uri=True,
+                                         check_same_thread=False, isolation_level=None)
+            connection.row_factory = self.row_factory
+            connection.text_factory = six.binary_type
+            if self.profiler and hasattr(connection, "set_trace_callback"):
+                connection.set_trace_callback(self.profiler.trace)
+            return connection
+        except Exception:
+            logger.warning("Error opening read connection to %s.", self.filename, exc_info=True)
+        return None
+
+
+    def set_profiler(self, profiler):
+        """
+        Sets SQL statement profiler for database connections.
+
+        @param   profiler  Profiler instance, or None to stop profiling
+        """
+        self.profiler = profiler
+        callback = profiler.trace if profiler else None
+        with self.readerlock:
+            connections = [self.connection] + list(self.readers.values())
+        for connection in filter(bool, connections):
+            if hasattr(connection, "set_trace_callback"): # Py3.3+
+                connection.set_trace_callback(callback)
+
+
+    def release_reader(self):
+        """Closes read-only connection of the current thread, if any."""
+        with self.readerlock:
+            connection = self.readers.pop(threading.current_thread(), None)
+        if connection: util.try_ignore(connection.close)
+
+
+    def close_readers(self):
+        """Closes all read-only connections."""
+        with self.readerlock:
+            connections = list(self.readers.values())
+            self.readers.clear()
+        for connection in connections: util.try_ignore(connection.close)
+
+
+    def backup(self, filename, progress=None, vacuum=False):
+        """
+        Copies the complete database to another file, replacing its content.
+
+        Uses SQLite online backup in steps of conf.BackupPageStep pages, pausing
+        conf.BackupPause seconds between steps to keep database usable meanwhile.
+        Uses VACUUM INTO instead if specified or if online backup is not available
+        (Python below 3.7), producing a compacted copy; target must be new or empty.
+        Falls back to copying the database file after a WAL checkpoint
+        if neither is available (SQLite below 3.27). Raises error if VACUUM INTO
+        is specified but not available.
+
+        @param   filename  path of database file to write
+        @param   progress  callback(index, total) with pages copied and pages in total,
+                           returning false if copy should cancel
+        @param   vacuum    whether to use VACUUM INTO
+        @return            True on success, None on cancel
+        """
+        result = True
+        if vacuum and not self.has_feature("vacuum_into"):
+            raise Exception("Compacted copy requires VACUUM INTO, not supported in SQLite %s "
+                            "(needs 3.27+)." % sqlite3.sqlite_version)
+        if not vacuum and not hasattr(self.connection, "backup") \
+        and not self.has_feature("vacuum_into"):
+            return self._copy_file(filename, progress)
+
+        if vacuum or not hasattr(self.connection, "backup"):
+            pagesize = self.execute("PRAGMA page_size", log=False).fetchone()["page_size"]
+            total = self.execute("PRAGMA page_count", log=False).fetchone()["page_count"]
+            state = {"cancel": False}
+            def on_progress():
+                if not progress: return
+                size = os.path.getsize(filename) if os.path.isfile(filename) else 0
+                state["cancel"] = not progress(index=min(size // pagesize, total), total=total)
+                return state["cancel"]
+            self.connection.set_progress_handler(on_progress, 100000)
+            try: self.execute("VACUUM INTO ?", [filename], log=False)
+            except sqlite3.OperationalError:
+                if not state["cancel"]: raise
+                result = None
+            finally: self.connection.set_progress_handler(None, 0)
+            if result and progress: progress(index=total, total=total)
+            return result
+
+        class Cancelled(Exception): pass
+        def on_step(status, remaining, total):
+            if progress and not progress(index=total - remaining, total=total):
+                raise Cancelled()
+        target = sqlite3.connect(filename)
+        try:
+            self.connection.backup(target, pages=conf.BackupPageStep,
+                                   progress=on_step, sleep=conf.BackupPause)
+        except Cancelled: result = None
+        finally: target.close()
+        return result
+
+
+    def _copy_file(self, filename, progress=None):
+        """
+        Copies database file to another file, after checkpointing WAL content
+        into database file.
+
+        @param   filename  path of database file to write
+        @param   progress  callback(index, total) with pages copied and pages in total,
+                           returning false if copy should cancel
+        @return            True on success, None on cancel
+        """
+        self.execute("PRAGMA wal_checkpoint(FULL)", log=False).fetchall()
+        pagesize = self.execute("PRAGMA page_size", log=False).fetchone()["page_size"]
+        total = self.execute("PRAGMA page_count", log=False).fetchone()["page_count"]
+        index, step = 0, pagesize * conf.BackupPageStep
+        with open(self.filename, "rb") as f1, open(filename, "wb") as f2:
+            for chunk in iter(lambda: f1.read(step), b""):
+                f2.write(chunk)
+                index = min(index + len(chunk) // pagesize, total)
+                if progress and not progress(index=index, total=total): return None
+        if progress: progress(index=total, total=total)
+        return True
+
+
+    def get_checksums(self, tables=None, progress=None):
+        """
+        Returns logical checksums of table contents, independent of file layout
+        and VACUUM state: SHA-1 over table column names and rows in primary key
+        order (or ordered by all columns if table has no primary key), and SHA-1
+        over all table checksums in table name order.
+
+        @param   tables    names of tables to checksum, defaults to all tables
+        @param   progress  callback(index, total, ?name) invoked periodically and
+                           after each table, returning false if calculation should cancel
+        @return            {"database": hexdigest, "tables": {name: hexdigest}},
+                           or None if cancelled
+        """
+        ROWSTEP = 10000
+        items = self.schema.get("table") or {}
+        names = [x for x in items if tables is None or any(util.lceq(x, y) for y in tables)]
+        names.sort(key=lambda x: x.lower())
+        result = {"tables": CaselessDict(insertorder=True)}
+        # Separate reader only in WAL mode, as it would block writes otherwise
+        connection = self.is_wal() and self.connect_reader() or self.connection
+        try:
+            for i, name in enumerate(names):
+                cols = [c["name"] for c in items[name]["columns"]]
+                pks, _ = self.get_keys(name, pks_only=True)
+                order = pks[0]["name"] if pks else cols
+                sql = "SELECT %s FROM %s ORDER BY %s" % (
+                    " || ',' || ".join("quote(%s)" % grammar.quote(c) for c in cols),
+                    grammar.quote(name), ", ".join(map(grammar.quote, order)))
+                digest = hashlib.sha1(json.dumps(cols).encode("utf-8"))
+                cursor = connection.cursor()
+                cursor.row_factory = None
+                for j, row in enumerate(cursor.execute(sql), 1):
+                    digest.update(row[0]), digest.update(b"\n")
+                    if progress and not j % ROWSTEP and not progress(index=i, total=len(names)):
+                        return None
+                cursor.close()
+                result["tables"][name] = digest.hexdigest()
+                if progress and not progress(index=i + 1, total=len(names), name=name):
+                    return None
+        finally:
+            if connection is not self.connection: util.try_ignore(connection.close)
+        digest = hashlib.sha1()
+        for name, value in result["tables"].items():
+            digest.update(("%s:%s\n" % (name.lower(), value)).encode("utf-8"))
+        result["database"] = digest.hexdigest()
+        return result
+
+
     def check_integrity(self):
         """Checks SQLite database integrity, returning a list of errors."""
         result = []
@@ -887,16 +1181,28 @@ WARNING: misuse can easily result in a corrupt database file.""",
         ) if mylimit else ""
 
 
-    def execute(self, sql, params=(), log=True, cursor=None):
+    def execute(self, sql, params=(), log=True, cursor=None, lazy=False):
         """
         Shorthand for self.connection.execute(), returns cursor.
         Uses given cursor else creates new.
+
+        @param   cursor  sqlite3.Cursor or sqlite3.Connection to use if not main connection
+        @param   lazy    whether cursor should yield read-only DataRow instances
+                         decoding values on access, instead of dictionaries
         """
         result = None
         if cursor or self.connection:
             if log and conf.LogSQL:
                 logger.info("SQL: %s%s", sql, "\nParameters: %s" % (params, ) if params else "")
-            result = (cursor or self.connection).execute(sql, params)
+            self.sql_current.sql = sql
+            target = cursor or self.connection
+            if lazy:
+                if not isinstance(target, sqlite3.Cursor): target = target.cursor()
+                target.row_factory = RowFactory()
+            mark = self.profiler and self.profiler.start(target)
+            try: result = target.execute(sql, params)
+            finally: mark and self.profiler.stop(mark, sql)
+            self.register_writes(sql)
         return result
 
 
@@ -910,19 +1216,51 @@ WARNING: misuse can easily result in a corrupt database file.""",
             if log and conf.LogSQL:
                 logger.info("SQL: %s%s", sql,
                             ("\nParameters: %s" % params) if params else "")
-            result = (cursor or self.connection).execute(sql, params).rowcount
+            self.sql_current.sql = sql
+            target = cursor or self.connection
+            mark = self.profiler and self.profiler.start(target)
+            try: result = target.execute(sql, params).rowcount
+            finally: mark and self.profiler.stop(mark, sql)
+            self.register_writes(sql)
             if name: self.log_query(name, sql, params)
             self.last_modified = datetime.datetime.now()
         return result
 
 
+    def executemany(self, sql, paramslist, log=True, name=None, cursor=None):
+        """
+        Executes the specified SQL INSERT/UPDATE/DELETE statement for each
+        parameter set in a single prepared batch, returns the number
+        of affected rows. Uses given cursor else creates new.
+        """
+        result = 0
+        paramslist = list(paramslist)
+        if (cursor or self.connection) and paramslist:
+            if log and conf.LogSQL:
+                logger.info("SQL: %s\nParameters: %s", sql, paramslist)
+            self.sql_current.sql = sql
+            target = cursor or self.connection
+            mark = self.profiler and self.profiler.start(target)
+            try: result = target.executemany(sql, paramslist).rowcount
+            finally: mark and self.profiler.stop(mark, sql)
+            self.register_writes(sql)
+            if name: self.log_query(name, sql, paramslist)
+            self.last_modified = datetime.datetime.now()
+        return result
+
+
     def executescript(self, sql, log=True, name=None, cursor=None):
         """
         Executes the specified SQL as script. Uses given cursor else creates new.
         """
         if cursor or self.connection:
             if log and conf.LogSQL: logger.info("SQL: %s", sql)
-            cursor = (cursor or self.connection).executescript(sql)
+            self.sql_current.sql = sql
+            target = cursor or self.connection
+            mark = self.profiler and self.profiler.start(target)
+            try: cursor = target.executescript(sql)
+            finally: mark and self.profiler.stop(mark, sql)
+            self.register_writes(sql)
             if name: self.log_query(name, sql)
             return cursor
 
@@ -934,6 +1272,53 @@ WARNING: misuse can easily result in a corrupt database file.""",
         self.log.append(item)
 
 
+    def authorize(self, action, arg1, arg2, dbname, source):
+        """
+        SQLite authorizer callback for main connection, registers tables
+        modified by statement being prepared, including modifications in triggers.
+        """
+        if action in (sqlite3.SQLITE_INSERT, sqlite3.SQLITE_UPDATE, sqlite3.SQLITE_DELETE) \
+        and arg1:
+            try:
+                self.written.add(arg1.lower())
+                self.writes[arg1.lower()] += 1
+                sql = getattr(self.sql_current, "sql", None)
+                if sql is not None:
+                    self.writesqls.setdefault(sql, set()).add(arg1.lower())
+            except Exception: pass
+        return sqlite3.SQLITE_OK
+
+
+    def register_writes(self, sql):
+        """
+        Registers tables modified by executed SQL as written, using tables seen
+        by authorizer when statement was first prepared, as sqlite3 reuses
+        cached statements without preparing them again.
+        """
+        self.sql_current.sql = None
+        tables = self.writesqls.pop(sql, None)
+        if tables is None: return
+        self.writesqls[sql] = tables # Move to end as most recently used
+        self.written.update(tables)
+        for table in tables: self.writes[table] += 1
+        while len(self.writesqls) > self.MAX_WRITE_STATEMENTS:
+            self.writesqls.popitem(last=False)
+
+
+    def get_versions(self):
+        """
+        Returns current (PRAGMA schema_version, PRAGMA data_version),
+        value as None if not available.
+        """
+        result = []
+        for pragma in ("schema_version", "data_version"):
+            try:
+                row = self.execute("PRAGMA %s" % pragma, log=False).fetchone()
+                result.append(next(iter(row.values())))
+            except Exception: result.append(None)
+        return tuple(result)
+
+
     def is_open(self):
         """Returns whether the database is currently open."""
         return self.connection is not None
@@ -941,22 +1326,14 @@ WARNING: misuse can easily result in a corrupt database file.""",
 
     def row_factory(self, cursor, row):
         """Returns dict from resultset rows, with BLOBs converted to strings."""
+        description, names = self.rowkeys
+        if cursor.description is not description:
+            description = cursor.description
+            names = [decode_name(c[0]) for c in description]
+            self.rowkeys = (description, names)
         result = {}
-        for idx, col in enumerate(cursor.description):
-            try: name = col[0].decode("utf-8")
-            except Exception: name = col[0]
-            result[name] = row[idx]
-        for name in list(result):
-            datatype = type(result[name])
-            if sys.version_info < (3, ) and datatype is buffer:  # Py2
-                result[name] = str(result[name]).decode("latin1")
-            elif datatype is memoryview:
-                result[name] = datatype.to_bytes().decode("latin1")
-            elif datatype is six.binary_type:
-                try:
-                    result[name] = result[name].decode("utf-8")
-                except Exception:
-                    result[name] = result[name].decode("latin1")
+        for name, value in zip(names, row):
+            result[name] = decode_value(value) if type(value) in BINARY_TYPES else value
         return result
 
 
@@ -975,10 +1352,12 @@ WARNING: misuse can easily result in a corrupt database file.""",
         """
         if not self.is_open(): return
         category, name = (x.lower() if x is not None else x for x in (category, name))
+        versions = self.get_versions()
 
         schema0 = CaselessDict((c, CaselessDict(
             (k, copy.copy(v)) for k, v in d.items()
         )) for c, d in self.schema.items())
+        self.relations = None
         if category:
             if name is not None: self.schema[category].pop(name, None)
             else: self.schema[category].clear()
@@ -1012,6 +1391,17 @@ WARNING: misuse can easily result in a corrupt database file.""",
         elif category: total = len(self.schema.get(category) or {})
         if progress and not progress(index=0, total=total): return
 
+        # Retrieve columns in one query per category if possible, else per item in first pass
+        colmap = {} # {category: {lowercase name: [{PRAGMA table_info or index_info row}]}}
+        if name is None and self.has_feature("pragma_functions"):
+            colmap = self.get_column_rows(set(
+                mycategory for mycategory, itemmap in self.schema.items()
+                if mycategory in ("table", "index", "view")
+                and (not category or category == mycategory)
+                for myname, opts in itemmap.items() if "index" == mycategory
+                or opts["sqlraw"] != schema0.get(mycategory, {}).get(myname, {}).get("sqlraw")
+            ))
+
         # First pass, rapid: retrieve columns, use cache if available
         for mycategory, itemmap in self.schema.items():
             if category and category != mycategory: continue # for mycategory
@@ -1028,7 +1418,8 @@ WARNING: misuse can easily result in a corrupt database file.""",
                     pragma = "index_info" if "index" == mycategory else "table_info"
                     sql = "PRAGMA %s(%s)" % (pragma, grammar.quote(myname))
                     try:
-                        rows = self.execute(sql, log=False).fetchall()
+                        if mycategory in colmap: rows = colmap[mycategory].get(myname.lower(), [])
+                        else: rows = self.execute(sql, log=False).fetchall()
                     except Exception:
                         opts.update(columns=[])
                         logger.exception("Error fetching columns for %s %s.",
@@ -1065,6 +1456,22 @@ WARNING: misuse can easily result in a corrupt database file.""",
                     if "is_count_estimated" in opts0:
                         opts["is_count_estimated"] = opts0["is_count_estimated"]
 
+        # Parse distinct SQL texts in worker processes if there are many
+        if parse and not (category and name is not None):
+            texts = list(OrderedDict((opts["sql0"], True)
+                for mycategory, itemmap in self.schema.items()
+                if not category or category == mycategory
+                for opts in itemmap.values() if not opts.get("__parsed__")
+            ))
+            if len(texts) >= conf.MinItemsForParallelParse:
+                total0, total = total, total + len(texts)
+                myprogress = (lambda index, **_: progress(index=index, total=total)) \
+                             if progress else None
+                result = parse_in_processes(texts, myprogress)
+                if result is False: return
+                if result: index = len(texts)
+                else: total = total0
+
         # Second pass, slow: parse SQL, retrieve counts
         for mycategory, itemmap in self.schema.items():
             if category and category != mycategory: continue # for mycategory
@@ -1107,11 +1514,87 @@ WARNING: misuse can easily result in a corrupt database file.""",
                     opts.update(mycounts)
 
                 index += 1
-                if progress and not progress(index=index, total=total): return
+                if progress and not progress(index=index, total=total):
+                    self.relations = None # Drop graph possibly built from partial schema
+                    return
+
+        self.relations = None
+        if not category: self.schema_version = versions[0]
+        if count and category in (None, "table"):
+            if name is None: self.data_version = versions[1]
+            if name is None: self.written.clear()
+            else: self.written.discard(name)
+        if progress: progress(done=True)
+
+
+    def refresh_schema(self, count=False, parse=False, generate=True, progress=None):
+        """
+        Refreshes metadata incrementally: populates schema only if it has changed
+        since last full populate (PRAGMA schema_version), and counts only tables
+        modified since last count, or all tables if database has been modified
+        by another connection (PRAGMA data_version).
 
+        @param   count      update table row counts
+        @param   parse      parse all CREATE statements in full, complete metadata
+        @param   generate   generate nicely formatted CREATE SQL from parsed metadata
+        @param   progress   callback(index, total, ?done) to report progress,
+                            returning false if refresh should cancel
+        """
+        if not self.is_open(): return
+        schema_version, data_version = self.get_versions()
+
+        if schema_version is None or schema_version != self.schema_version or parse and any(
+            not opts.get("__parsed__") for itemmap in self.schema.values()
+            for opts in itemmap.values()
+        ):
+            if not count:
+                return self.populate_schema(parse=parse, generate=generate, progress=progress)
+            self.populate_schema(parse=parse, generate=generate)
+        if not count:
+            if progress: progress(done=True)
+            return
+
+        tables = self.schema.get("table") or {}
+        if data_version is None or data_version != self.data_version:
+            names = list(tables)
+        else: names = [n for n, o in tables.items() if "count" not in o
+                       or n.lower() in self.written]
+        if progress and not progress(index=0, total=len(names)): return
+        for i, name in enumerate(names):
+            mycounts = self.get_count(name)
+            if name in self.schema["table"]: self.schema["table"][name].update(mycounts)
+            self.written.discard(name.lower())
+            if progress and not progress(index=i + 1, total=len(names)): return
+        self.data_version = data_version
         if progress: progress(done=True)
 
 
+    def get_column_rows(self, categories):
+        """
+        Returns PRAGMA table_info rows for all tables and views, and PRAGMA index_info rows
+        for all indexes, with one query per category via pragma table-valued functions.
+
+        @param   categories  schema categories to query, from "table", "view", "index"
+        @return              {category: {lowercase name: [{row}, ]}}, without categories
+                             that failed to query, e.g. due to an invalid view
+        """
+        result = {}
+        for category in categories:
+            pragma, order = ("index_info", "seqno") if "index" == category else ("table_info", "cid")
+            sql = ("SELECT m.name AS __name__, p.* FROM sqlite_master m, pragma_%s(m.name) p "
+                   "WHERE m.type = :type AND m.sql != '' AND m.name NOT LIKE 'sqlite_%%' "
+                   "ORDER BY m.name, p.%s" % (pragma, order))
+            try: rows = self.execute(sql, {"type": category}, log=False).fetchall()
+            except Exception:
+                logger.debug("Error fetching %s columns in one query, falling back to one query "
+                             "per %s.", category, category, exc_info=True)
+                continue # for category
+            result[category] = itemrows = {}
+            for row in rows:
+                itemrows.setdefault(row.pop("__name__").lower(), []).append(row)
+        return result
+
+
     def generate_schema(self, progress=None):
         """
         Generate nicely formatted CREATE SQL statements for all schema items.
@@ -1131,39 +1614,202 @@ WARNING: misuse can easily result in a corrupt database file.""",
         if progress: progress(done=True)
 
 
-    def get_count(self, table, key="count"):
+    def get_count(self, table, key="count", exact=False, cursor=None):
         """
         Returns {"count": int, ?"is_count_estimated": bool}.
-        Uses MAX(ROWID) to estimate row count and skips COUNT(*) if likely
-        to take too long (file over half a gigabyte).
-        Estimated count is rounded upwards to 100.
 
-        @param   key  name of item key to use for count (also changes key for estimate)
+        Uses exact count from persistent cache if database file is unchanged
+        since counting. Else uses sqlite_stat1 statistics or MAX(ROWID)
+        to estimate row count, and skips COUNT(*) if likely to take too long
+        (file over half a gigabyte). Estimated count is rounded upwards to 100.
+
+        @param   key     name of item key to use for count (also changes key for estimate)
+        @param   exact   whether to always do full COUNT(*)
+        @param   cursor  cursor or connection to query with, if not main connection
         """
-        result, do_full = {key: None}, False
+        result, do_full = {key: None}, exact
+        cachekey = self.get_count_cache_key(table)
+        if cachekey:
+            count = COUNT_CACHE.get(cachekey)
+            if count is not None: return {key: count}
+
         tpl = "SELECT %%s AS count FROM %s LIMIT 1" % grammar.quote(table)
         try:
-            rowidname = self.get_rowid(table)
-            if rowidname:
-                row = self.execute(tpl % "MAX(%s)" % rowidname, log=False).fetchone()
-                result[key] = int(math.ceil(row["count"] / 100.) * 100) # Round to upper 100
-                result["is_%s_estimated" % key] = True
+            if not do_full:
+                count, rowidname = self.get_stat_count(table), None
+                if count is None: rowidname = self.get_rowid(table)
+                if rowidname:
+                    row = self.execute(tpl % "MAX(%s)" % rowidname, log=False).fetchone()
+                    count = row["count"]
+                if count is not None:
+                    result[key] = int(math.ceil(count / 100.) * 100) # Round to upper 100
+                    result["is_%s_estimated" % key] = True
             if self.filesize < conf.MaxDBSizeForFullCount \
-            or result and result[key] < conf.MaxTableRowIDForFullCount:
+            or result[key] is not None and result[key] < conf.MaxTableRowIDForFullCount:
                 do_full = True
         except Exception:
-            do_full = (self.filesize < conf.MaxDBSizeForFullCount)
+            do_full = do_full or (self.filesize < conf.MaxDBSizeForFullCount)
 
         try:
             if do_full:
-                row = self.execute(tpl % "COUNT(*)", log=False).fetchone()
+                row = self.execute(tpl % "COUNT(*)", log=False, cursor=cursor).fetchone()
                 result = {key: row["count"]}
+                if cachekey: COUNT_CACHE.set(cachekey, row["count"])
+        except Exception as e:
+            if "interrupted" != str(e): # Cancelled via connection.interrupt()
+                logger.exception("Error fetching COUNT for table %s.",
+                                 util.unprint(grammar.quote(table)))
+        return result
+
+
+    def count_tables(self, tables=None, progress=None, jobs=None):
+        """
+        Counts table rows exactly, running COUNT(*) concurrently on separate
+        read-only connections if database is in WAL mode, as readers would
+        block writes otherwise, largest tables last. Updates counts in schema.
+
+        @param   tables    names of tables to count, defaults to all tables
+        @param   progress  callback(index, total, ?name, ?count, ?done) invoked in
+                           calling thread on each completed count and periodically
+                           while counting, returning false if counting should cancel,
+                           ongoing counts are interrupted
+        @param   jobs      number of concurrent connections, defaults to conf.MaxReadConnections
+        @return            {name: count} for completed counts
+        """
+        result = {}
+        if not self.is_open(): return result
+        items = self.schema.get("table") or {}
+        names = [x for x in items if tables is None or any(util.lceq(x, y) for y in tables)]
+        names.sort(key=lambda x: items[x].get("size") or items[x].get("count") or 0)
+        jobs = max(1, min(len(names), conf.MaxReadConnections if jobs is None else jobs))
+
+        workqueue, resultqueue, state = queue.Queue(), queue.Queue(), {"stop": False}
+        for name in names: workqueue.put(name)
+        connections = list(filter(bool, (self.connect_reader() for _ in range(jobs)))) \
+                      if self.is_wal() else []
+        if not connections: connections = [self.connection] # Without interrupt support
+
+        def counter(connection):
+            try:
+                while not state["stop"]:
+                    try: name = workqueue.get(block=False)
+                    except queue.Empty: break # while not state["stop"]
+                    count = self.get_count(name, exact=True, cursor=connection).get("count")
+                    resultqueue.put((name, count))
+            finally:
+                resultqueue.put(None)
+                if connection is not self.connection: util.try_ignore(connection.close)
+
+        for connection in connections:
+            thread = threading.Thread(target=counter, args=(connection, ))
+            thread.daemon = True
+            thread.start()
+
+        index, running = 0, len(connections)
+        while running:
+            try: item = resultqueue.get(timeout=0.1)
+            except queue.Empty: item = ()
+            if item is None:
+                running -= 1
+                continue # while running
+
+            kwargs = {"index": index, "total": len(names)}
+            if item:
+                name, count = item
+                index += 1
+                kwargs.update(index=index, name=name, count=count)
+                if count is not None and name in items:
+                    result[name] = count
+                    items[name].pop("is_count_estimated", None)
+                    items[name]["count"] = count
+                    self.written.discard(name.lower())
+            if progress and not state["stop"] and not progress(**kwargs):
+                state["stop"] = True
+                for connection in connections:
+                    if connection is not self.connection: util.try_ignore(connection.interrupt)
+        if progress and not state["stop"]: progress(done=True)
+        return result
+
+
+    def get_stat_count(self, table):
+        """
+        Returns table row count estimate from sqlite_stat1 statistics,
+        or None if statistics not available.
+        """
+        try:
+            row = self.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = ? "
+                               "ORDER BY idx IS NOT NULL LIMIT 1", [table], log=False).fetchone()
+            return int(row["stat"].split()[0]) if row and row["stat"] else None
+        except Exception: return None
+
+
+    def get_column_sample(self, table, column, limit=100, scan=10000, cursor=None):
+        """
+        Returns a list of non-null values from table or view column, taken from
+        initial rows only, as a cheap sample of how column values are stored.
+
+        @param   limit   maximum number of values to return
+        @param   scan    maximum number of rows to scan
+        @param   cursor  cursor or connection to query with, if not main connection
+        """
+        # Avoid scanning a covering index, giving NULLs first
+        hint = " NOT INDEXED" if table in self.schema.get("table", {}) else ""
+        sql = "SELECT x FROM (SELECT %s AS x FROM %s%s LIMIT %s) WHERE x IS NOT NULL LIMIT %s" % \
+              (grammar.quote(column), grammar.quote(table), hint, scan, limit)
+        try: return [x["x"] for x in self.execute(sql, log=False, cursor=cursor).fetchall()]
         except Exception:
-            logger.exception("Error fetching COUNT for table %s.",
-                             util.unprint(grammar.quote(table)))
+            logger.warning("Error sampling column %s in %s.", grammar.quote(column, force=True),
+                           grammar.quote(table, force=True), exc_info=True)
+        return []
+
+
+    def get_count_cache_key(self, table):
+        """
+        Returns key for table exact count in persistent cache, from database
+        file identity and current file contents state, or None if not cacheable.
+        """
+        if not COUNT_CACHE or self.temporary or not self.connection \
+        or getattr(self.connection, "in_transaction", False): return None
+        identity = self.get_file_identity()
+        return COUNT_CACHE.make_key("count", identity, table.lower()) if identity else None
+
+
+    def get_file_identity(self):
+        """
+        Returns a JSON-serializable value identifying database file and the state
+        of its contents, changing with any committed modification: file path,
+        sizes and modification times of database and WAL file, database header
+        change counter, and WAL header checkpoint sequence and salts.
+        Returns None if file information not available.
+        """
+        result = [os.path.realpath(self.filename)]
+        for path, offset, length in [(self.filename, 24, 4), (self.filename + "-wal", 12, 12)]:
+            try:
+                stat = os.stat(path)
+                with open(path, "rb") as f:
+                    f.seek(offset)
+                    header = list(bytearray(f.read(length)))
+                result.append([stat.st_size, stat.st_mtime, header])
+            except Exception:
+                if path == self.filename: return None
+                result.append(None)
         return result
 
 
+    def analyze(self, limit=None):
+        """
+        Runs ANALYZE to populate sqlite_stat1 statistics used for row count estimates,
+        bounded with PRAGMA analysis_limit if supported by SQLite version.
+
+        @param   limit  approximate number of index rows to examine per index,
+                        defaults to conf.AnalysisLimit, 0 for unbounded
+        """
+        limit = conf.AnalysisLimit if limit is None else limit
+        if self.has_feature("analysis_limit"):
+            self.execute("PRAGMA analysis_limit = %d" % max(0, int(limit)))
+        self.executescript("ANALYZE", name="ANALYZE")
+
+
     def set_sizes(self, data):
         """
         Sets table and index byte sizes.
@@ -1222,7 +1868,7 @@ WARNING: misuse can easily result in a corrupt database file.""",
         @param   data   return cascading data dependency relations:
                         for views, the tables and views they query,
                         and for tables, the views that query them, all recursively
-        @param   skip   CaselessDict{name: True} to skip (internal recursion helper)
+        @param   skip   CaselessDict{name: True} to skip
         @param   clone  whether to return copies of data
         """
         category, name = category.lower(), name.lower()
@@ -1237,39 +1883,102 @@ WARNING: misuse can easily result in a corrupt database file.""",
         if not item or category not in SUBCATEGORIES or "meta" not in item:
             return result
 
-        for subcategory in SUBCATEGORIES.get(category, []):
-            for subname, subitem in self.schema[subcategory].items():
-                if "meta" not in subitem or subname in skip:
-                    continue # for subname, subitem
+        relations = self.get_relations()
+        if data: keys = relations["closures"].get((category, name))
+        if data and keys is None:
+            keys = relations["closures"][(category, name)] = self.walk_relations(category, name)
+        if not data:
+            keys = [(c, n) for c, n, is_own in relations["edges"].get((category, name), ())
+                    if c in SUBCATEGORIES[category] and (own is None or bool(own) is is_own)]
+
+        for subcategory, subname in keys:
+            if subname in skip: continue # for subcategory, subname
+            subitem = self.schema[subcategory][subname]
+            if subcategory not in result: result[subcategory] = CaselessDict()
+            result[subcategory][subitem["name"]] = copy.deepcopy(subitem) if clone else subitem
+        return result
+
+
+    def get_relations(self):
+        """
+        Returns dependency graph of schema items, built once per schema populate,
+        as {
+            "edges":    {(category, name): [(category2, name2, is_own), ]},
+            "data":     {(category, name): [(category2, name2), ]},
+            "closures": {(category, name): [(category2, name2), ]},
+            "full":     {(category, name, foreign): {category2: [name2, ]}},
+        }, names in lowercase, ordered like schema.
+        "edges" are direct relations in any way and whether related item is owned or owner,
+        "data" are direct data dependency relations for tables and views,
+        "closures" and "full" are populated on demand from get_related() and get_full_related().
+        """
+        relations = self.relations
+        if relations is not None: return relations
+
+        ORDER = ["table", "view", "index", "trigger"]
+        items, positions = {}, {} # {(category, name): item}, {(category, name): index}
+        owneds, referers = defaultdict(list), defaultdict(list) # {name: [(category, name), ]}
+        for category, itemmap in list(self.schema.items()):
+            for i, (name, item) in enumerate(list(itemmap.items())):
+                if "meta" not in item: continue # for i, (name, item)
+                key = (category, name.lower())
+                items[key], positions[key] = item, i
+                if item["meta"].get("table"):
+                    owneds[item["meta"]["table"].lower()].append(key)
+                for name2 in item["meta"].get("__tables__", ()):
+                    referers[name2.lower()].append(key)
+        categories = defaultdict(list) # {name: [category, ]}
+        for category, name in items: categories[name].append(category)
+
+        edges, datas = {}, {}
+        for (category, name), item in items.items():
+            candidates = set(owneds.get(name, ())) | set(referers.get(name, ()))
+            for name2 in [item["meta"].get("table")] + list(item["meta"].get("__tables__", ())):
+                if not name2: continue # for name2
+                candidates.update((c, name2.lower()) for c in categories.get(name2.lower(), ()))
+            candidates.discard((category, name))
+
+            myedges, mydatas = [], []
+            for subcategory, subname in sorted(candidates, key=lambda x: (
+                ORDER.index(x[0]) if x[0] in ORDER else len(ORDER), positions[x]
+            )):
+                if subname == name: continue # for subcategory, subname
+                subitem = items[(subcategory, subname)]
                 is_own = util.lceq(subitem["meta"].get("table"), name) or \
                          util.lceq(item["meta"].get("table"), subname)
                 is_rel_from = name in subitem["meta"]["__tables__"] \
                               or "trigger" == subcategory and is_own
-                is_rel_to   = subname.lower() in item["meta"]["__tables__"] \
+                is_rel_to   = subname in item["meta"]["__tables__"] \
                               or "trigger" == category and is_own
-                if not is_rel_to and not is_rel_from \
-                or data and "view" == category and is_rel_from \
-                or not data and own is not None and bool(own) is not is_own:
-                    continue # for subname, subitem
-
-                if subcategory not in result: result[subcategory] = CaselessDict()
-                result[subcategory][subname] = copy.deepcopy(subitem) if clone else subitem
-
-        visited = CaselessDict()
-        for vv in result.values() if data else ():
-            skip.update({v: True for v in vv})
-        for mycategory, items in result.items() if data else ():
-            if mycategory not in SUBCATEGORIES: continue # for mycategory, items
-            for myitem in items.values():
-                if myitem["name"] in visited: continue # for myitem
-                visited[myitem["name"]] = True
-                subresult = self.get_related(mycategory, myitem["name"], own, data, skip, clone)
-                for subcategory, subitemmap in subresult.items():
-                    if subcategory not in result: result[subcategory] = CaselessDict()
-                    result[subcategory].update(subitemmap)
-                    visited.update(subitemmap)
-                    skip.update(visited)
+                if not is_rel_to and not is_rel_from: continue # for subcategory, subname
+
+                myedges.append((subcategory, subname, bool(is_own)))
+                if category in ("table", "view") and subcategory in ("table", "view") \
+                and (subcategory, category) != ("table", "table") \
+                and not ("view" == category and is_rel_from):
+                    mydatas.append((subcategory, subname))
+            if myedges: edges[(category, name)] = myedges
+            if mydatas: datas[(category, name)] = mydatas
+
+        relations = {"edges": edges, "data": datas, "closures": {}, "full": {}}
+        self.relations = relations
+        return relations
+
 
+    def walk_relations(self, category, name):
+        """
+        Returns all items reachable from specified item via data dependency
+        relations in get_relations(), as [(category, name), ] in breadth-first order.
+        """
+        datas = self.get_relations()["data"]
+        start = (category.lower(), name.lower())
+        result, queue, seen = [], deque([start]), set([start[1]])
+        while queue:
+            for key in datas.get(queue.popleft(), ()):
+                if key[1] in seen: continue # for key
+                seen.add(key[1])
+                result.append(key)
+                queue.append(key)
         return result
 
 
@@ -1282,6 +1991,14 @@ WARNING: misuse can easily result in a corrupt database file.""",
         @return  {category: CaselessDict({name: item, })}
         """
         category, name = category.lower(), name.lower()
+        cachekey, fulls = (category, name, bool(foreign)), self.get_relations()["full"]
+        if cachekey in fulls:
+            result = defaultdict(CaselessDict)
+            for category2, names in fulls[cachekey].items():
+                for name2 in names:
+                    result[category2][name2] = self.schema[category2][name2]
+            return result
+
         result = defaultdict(CaselessDict)
         item = self.schema[category][name]
         skip_foreign = not foreign and "table" == category
@@ -1293,7 +2010,7 @@ WARNING: misuse can easily result in a corrupt database file.""",
                 result[category2][name2] = self.schema[category2][name2]
         # Take all owned or required related entities
         own = None if "trigger" == category else True
-        for relcategory, rels in self.get_related(category, name, own=own).items():
+        for relcategory, rels in self.get_related(category, name, own=own, clone=False).items():
             for relname, relitem in rels.items():
                 result[relcategory][relname] = relitem
 
@@ -1306,7 +2023,8 @@ WARNING: misuse can easily result in a corrupt database file.""",
                 processed2.add(name2)
 
                 own = None if "trigger" == category2 else True
-                for relcategory, rels in self.get_related(category2, name2, own=own).items():
+                for relcategory, rels in self.get_related(category2, name2, own=own,
+                                                          clone=False).items():
                     for relname, relitem in rels.items():
                         result[relcategory][relname] = relitem
             # Take foreign tables
@@ -1323,12 +2041,14 @@ WARNING: misuse can easily result in a corrupt database file.""",
                 if name2 in processed: continue # for name2
                 processed2.add(name2)
 
-                for relcategory, rels in self.get_related("view", name2, data=True).items():
+                for relcategory, rels in self.get_related("view", name2, data=True,
+                                                          clone=False).items():
                     for relname, relitem in rels.items():
                         result[relcategory][relname] = relitem
             processed.update(processed2)
             if processed0 == processed: break # while True
 
+        fulls[cachekey] = {c: list(items) for c, items in result.items()}
         return result
 
 
@@ -1554,23 +2274,27 @@ WARNING: misuse can easily result in a corrupt database file.""",
         return result
 
 
-    def select(self, sql, params=(), error=None, tick=None):
+    def select(self, sql, params=(), error=None, tick=None, lazy=False, cursor=None):
         """
         Yields rows from query; auto-closes cursor on error, never raises.
 
-        @param   error  message to use when logging error, if not assembling with SQL and params
-        @param   tick   function(index) invoked after yielding each row, index is 1-based
+        @param   error   message to use when logging error, if not assembling with SQL and params
+        @param   tick    function(index) invoked after yielding each row, index is 1-based
+        @param   lazy    whether to yield read-only DataRow instances instead of dictionaries
+        @param   cursor  sqlite3.Cursor or sqlite3.Connection to use if not main connection
         """
-        cursor = None
+        connection, cursor, rows = cursor, None, None
         try:
-            cursor = self.execute(sql, params)
-            for i, x in enumerate(cursor, 1):
+            cursor = rows = self.execute(sql, params, cursor=connection, lazy=lazy)
+            if self.profiler: rows = self.profiler.iterate(cursor, sql)
+            for i, x in enumerate(rows, 1):
                 yield x
                 tick and tick(i)
         except Exception:
             msg = error or "Error running %r%s." % (sql, " (%s)" % (params, ) if params else "")
             logger.warning(msg, exc_info=True)
         finally:
+            if rows is not cursor: rows.close()
             try: cursor.close()
             except Exception: pass
 
@@ -1611,17 +2335,7 @@ WARNING: misuse can easily result in a corrupt database file.""",
         table = self.schema["table"][table]["name"]
         logger.info("Inserting 1 row into table %s, %s.",
                     util.unprint(grammar.quote(table)), self.name)
-        col_data = self.schema["table"][table]["columns"]
-        fields = [col["name"] for col in col_data if col["name"] in row]
-        row = self.blobs_to_binary(row, fields, col_data)
-        args = self.make_args(fields, row)
-
-        if args:
-            str_cols = ", ".join(map(grammar.quote, fields))
-            str_vals = (":" if args else "") + ", :".join(args)
-            sql = "INSERT INTO %s (%s) VALUES (%s)" % \
-                  (grammar.quote(table), str_cols, str_vals)
-        else: sql = "INSERT INTO %s DEFAULT VALUES" % grammar.quote(table)
+        sql, args = self.make_insert(table, row)
         cursor = self.execute(sql, args)
         self.log_query("INSERT", sql, args)
         self.last_modified = datetime.datetime.now()
@@ -1639,10 +2353,113 @@ WARNING: misuse can easily result in a corrupt database file.""",
         table = self.schema["table"][table]["name"]
         logger.info("Updating 1 row in table %s, %s.",
                     grammar.quote(table), self.name)
+        sql, args = self.make_update(table, row, original_row, rowid)
+        self.executeaction(sql, args, name="UPDATE")
+
+
+    def delete_row(self, table, row, rowid=None):
+        """
+        Deletes the table row from the database. Row is identified by its
+        primary key, or by rowid if no primary key.
+
+        @return   success as boolean
+        """
+        if not self.is_open(): return
+
+        table = self.schema["table"][table]["name"]
+        logger.info("Deleting 1 row from table %s, %s.",
+                    util.unprint(grammar.quote(table)), self.name)
+        sql, args = self.make_delete(table, row, rowid)
+        self.executeaction(sql, args, name="DELETE")
+        self.last_modified = datetime.datetime.now()
+        return True
+
+
+    def save_rows(self, table, updates=(), inserts=(), deletes=()):
+        """
+        Saves changes to table rows in a single transaction, rolling back
+        all changes on error. Updates and deletes of the same statement shape
+        are executed as prepared batches.
+
+        @param   updates  [(row, original row, rowid or None), ]
+        @param   inserts  [row, ]
+        @param   deletes  [(row, rowid or None), ]
+        @return           [ID of inserted row, ] in order of inserts
+        """
+        result = []
+        if not self.is_open(): return result
+
+        updates, inserts, deletes = (list(x) for x in (updates, inserts, deletes))
+        table = self.schema["table"][table]["name"]
+        logger.info("Saving changes to table %s: %s, %s, %s, %s.",
+                    util.unprint(grammar.quote(table)), util.plural("update", updates),
+                    util.plural("insert", inserts), util.plural("delete", deletes), self.name)
+        batches = [OrderedDict(), OrderedDict()] # [{UPDATE SQL: [args, ]}, {DELETE SQL: [args, ]}]
+        for row, original_row, rowid in updates:
+            sql, args = self.make_update(table, row, original_row, rowid)
+            if sql: batches[0].setdefault(sql, []).append(args)
+        for row, rowid in deletes:
+            sql, args = self.make_delete(table, row, rowid)
+            batches[1].setdefault(sql, []).append(args)
+
+        self.execute("SAVEPOINT save_rows")
+        try:
+            for sql, argslist in batches[0].items():
+                self.executemany(sql, argslist, name="UPDATE")
+            for row in inserts:
+                sql, args = self.make_insert(table, row)
+                result.append(self.execute(sql, args).lastrowid)
+                self.log_query("INSERT", sql, args)
+            for sql, argslist in batches[1].items():
+                self.executemany(sql, argslist, name="DELETE")
+            self.execute("RELEASE SAVEPOINT save_rows")
+        except Exception:
+            _, e, tb = sys.exc_info()
+            for sql in ("ROLLBACK TO SAVEPOINT save_rows", "RELEASE SAVEPOINT save_rows"):
+                try: self.execute(sql)
+                except Exception: pass
+            six.reraise(type(e), e, tb)
+        self.last_modified = datetime.datetime.now()
+        return result
+
+
+    def make_insert(self, table, row):
+        """
+        Returns INSERT statement and arguments for inserting the table row.
+
+        @return  ("INSERT INTO ..", {param: value})
+        """
+        table = self.schema["table"][table]["name"]
+        col_data = self.schema["table"][table]["columns"]
+        fields = [col["name"] for col in col_data if col["name"] in row]
+        row = self.blobs_to_binary(row, fields, col_data)
+        args = self.make_args(fields, row)
+
+        if args:
+            str_cols = ", ".join(map(grammar.quote, fields))
+            str_vals = (":" if args else "") + ", :".join(args)
+            sql = "INSERT INTO %s (%s) VALUES (%s)" % \
+                  (grammar.quote(table), str_cols, str_vals)
+        else: sql = "INSERT INTO %s DEFAULT VALUES" % grammar.quote(table)
+        return sql, args
+
+
+    def make_update(self, table, row, original_row, rowid=None):
+        """
+        Returns UPDATE statement and arguments for updating changed values
+        in the table row, identified by the given ROWID, or by the primary keys
+        in its original values, or by all columns in its original values
+        if table has no primary key.
+
+        @return  ("UPDATE ..", {param: value}), or (None, None) if no changes
+        """
+        table = self.schema["table"][table]["name"]
         col_data = self.schema["table"][table]["columns"]
 
         changed_cols = [x for x in col_data
                         if row[x["name"]] != original_row[x["name"]]]
+        if not changed_cols: return None, None
+
         where, args = "", self.make_args(changed_cols, row)
         setsql = ", ".join("%s = :%s" % (grammar.quote(changed_cols[i]["name"]), x)
                                          for i, x in enumerate(args))
@@ -1657,23 +2474,18 @@ WARNING: misuse can easily result in a corrupt database file.""",
             where += (" AND " if where else "") + \
                      "%s IS :%s" % (grammar.quote(col["name"]), key)
         args.update(keyargs)
-        self.executeaction("UPDATE %s SET %s WHERE %s" %
-                           (grammar.quote(table), setsql, where), args,
-                           name="UPDATE")
+        sql = "UPDATE %s SET %s WHERE %s" % (grammar.quote(table), setsql, where)
+        return sql, args
 
 
-    def delete_row(self, table, row, rowid=None):
+    def make_delete(self, table, row, rowid=None):
         """
-        Deletes the table row from the database. Row is identified by its
-        primary key, or by rowid if no primary key.
+        Returns DELETE statement and arguments for deleting the table row,
+        identified by its primary key, or by rowid if no primary key.
 
-        @return   success as boolean
+        @return  ("DELETE FROM ..", {param: value})
         """
-        if not self.is_open(): return
-
         table, where = self.schema["table"][table]["name"], ""
-        logger.info("Deleting 1 row from table %s, %s.",
-                    util.unprint(grammar.quote(table)), self.name)
         col_data = self.schema["table"][table]["columns"]
 
         pks = [{"name": y} for x in self.get_keys(table, True)[0] for y in x["name"]]
@@ -1687,10 +2499,7 @@ WARNING: misuse can easily result in a corrupt database file.""",
             keyargs = self.make_args(key_data, row)
         for col, key in zip(key_data, keyargs):
             where += (" AND " if where else "") + "%s IS :%s" % (grammar.quote(col["name"]), key)
-        self.executeaction("DELETE FROM %s WHERE %s" % (grammar.quote(table), where),
-                           keyargs, name="DELETE")
-        self.last_modified = datetime.datetime.now()
-        return True
+        return "DELETE FROM %s WHERE %s" % (grammar.quote(table), where), keyargs
 
 
     def chunk_args(self, cols, rows):
@@ -1728,70 +2537,124 @@ WARNING: misuse can easily result in a corrupt database file.""",
         Deletes the table rows from the database, cascading delete to any
         related rows in foreign tables, and their related rows, etc.
 
+        Row keys are collected into temporary tables, one per affected table,
+        serving as visited sets; each level of related rows is resolved and
+        deleted with set-based queries against these key tables.
+
         @return   [(table, [{identifying column: value}])] in order of deletion
         """
         if not self.is_open(): return
-        result, queue = [], [(self.schema["table"][table]["name"], rows, rowids)]
+        table = self.schema["table"][table]["name"]
+        result, queue, step = [], [], 1
+        keytables = CaselessDict() # {table: (temp table name, [key column, ])}
+
+        def get_keytable(table1):
+            """Returns (temp table name, [key column, ]), creating temp table if not created."""
+            if table1 in keytables: return keytables[table1]
+            rowidname = self.get_rowid(table1)
+            pks = [y for x in self.get_keys(table1, True)[0] for y in x["name"]]
+            keys = [rowidname] if rowidname else \
+                   pks or [c["name"] for c in self.schema["table"][table1]["columns"]]
+            name = "sqlitely_cascade_%s" % (len(keytables) + 1)
+            self.execute("DROP TABLE IF EXISTS temp.%s" % name, cursor=cursor)
+            self.execute("CREATE TEMP TABLE %s (%s, __step__ INTEGER, PRIMARY KEY (%s))" %
+                         (name, ", ".join(map(grammar.quote, keys)),
+                          ", ".join(map(grammar.quote, keys))), cursor=cursor)
+            self.execute("CREATE INDEX temp.%s_step ON %s (__step__)" % (name, name),
+                         cursor=cursor)
+            keytables[table1] = (name, keys)
+            return keytables[table1]
+
+        def run(sql, params=(), many=False):
+            """Executes action query, returns affected row count."""
+            queries.append((sql, params))
+            if many: return self.executemany(sql, params, cursor=cursor)
+            return self.execute(sql, params, cursor=cursor).rowcount
+
+        def select_keys(alias, keys, sql):
+            """Returns "SELECT alias.key0 AS __k0__, .. sql", with keys aliased positionally."""
+            return "SELECT %s %s" % (", ".join("%s.%s AS __k%s__" % (alias, grammar.quote(k), i)
+                                               for i, k in enumerate(keys)), sql)
+
+        def match_keys(alias, keys, subsql):
+            """Returns condition for alias.keys being in results of select_keys() subquery."""
+            if len(keys) > 1 and not self.has_feature("row_values"):
+                return "EXISTS (SELECT 1 FROM (%s) WHERE %s)" % (subsql, " AND ".join(
+                    "__k%s__ = %s.%s" % (i, alias, grammar.quote(k)) for i, k in enumerate(keys)
+                ))
+            lhs = ", ".join("%s.%s" % (alias, grammar.quote(k)) for k in keys)
+            return "%s IN (%s)" % (lhs if len(keys) == 1 else "(%s)" % lhs, subsql)
 
         queries = [] # [(sql, params)]
         with self.connection:
             cursor = self.connection.cursor()
             self.execute("BEGIN TRANSACTION", cursor=cursor)
 
-            while queue:
-                table1, rows1, rowids1 = queue.pop(0)
-                if not util.lceq(table1, table):
-                    lock = self.get_lock("table", table1)
-                    if lock: raise Exception("%s, cannot delete." % lock)
-                col_data = self.schema["table"][table1]["columns"]
-                pks = [{"name": y} for x in self.get_keys(table, True)[0]
-                       for y in x["name"]]
-                rowidname = self.get_rowid(table1)
-                use_rowids = rowidname and rowids1 and all(rowids1) and \
-                             not (len(pks) == 1 and all(pks[0]["name"] in r for r in rows1))
-                key_cols = [{"name": "_rowid_"}] if use_rowids else pks or col_data
-                key_data, myrows = [], []
-
-                for row, rowid in zip(rows1, rowids1):
-                    data = {rowidname: rowid} if use_rowids else \
-                           {c["name"]: row[c["name"]] for c in key_cols}
-                    if not any(data in xx for t, xx in result if util.lceq(t, table1)):
-                        key_data.append(data); myrows.append(row)
-                if not key_data: continue # while queue
-
-                logger.info("Deleting %s from table %s, %s.", util.plural("row", key_data),
-                            util.unprint(grammar.quote(table1)), self.name)
-                for where, args in self.chunk_args(key_cols, key_data):
-                    sql = "DELETE FROM %s WHERE %s" % (grammar.quote(table1), where)
-                    self.execute(sql, args, cursor=cursor)
-                    queries.append((sql, args))
-                result.append((table1, key_data))
-
-                for lk in self.get_keys(table1)[0]:
-                    if "table" not in lk: continue # for lk
-                    lkrows = [x for x in myrows
-                              if all(x[c] is not None for c in lk["name"])]
-                    if not lkrows: continue # for lk
-                    for table2, keys2 in lk["table"].items():
-                        table2 = self.schema["table"][table2]["name"]
-
-                        key_cols2 = [{"name": x} for x in keys2]
-                        key_data2 = [{x: row[y] for x, y in zip(keys2, lk["name"])}
-                                     for row in lkrows]
-                        cols = "*"
-                        rowidname2 = self.get_rowid(table2)
-                        if rowidname2: cols = "%s AS %s, *" % ((rowidname2, ) * 2)
-                        sqlbase = "SELECT %s FROM %s" % (cols, grammar.quote(table2))
-                        rows2, rowids2 = [], []
-                        for where2, args2 in self.chunk_args(key_cols2, key_data2):
-                            sql2 = "%s WHERE %s" % (sqlbase, where2)
-                            myrows2 = self.execute(sql2, args2, cursor=cursor).fetchall()
-                            rowids2 += [x.pop(rowidname2) if rowidname2 else None
-                                        for x in myrows2]
-                            rows2.extend(myrows2)
-                        if rows2: queue.append((table2, rows2, rowids2))
-
-            self.execute("COMMIT", cursor=cursor)
+            try:
+                # Seed key table with given rows
+                tempname, keys = get_keytable(table)
+                if self.get_rowid(table) and rowids and all(x is not None for x in rowids):
+                    sql = "INSERT OR IGNORE INTO temp.%s (%s, __step__) VALUES (?, %s)" % \
+                          (tempname, grammar.quote(keys[0]), step)
+                    run(sql, [(x, ) for x in rowids], many=True)
+                else: # Look up keys by primary key or all columns
+                    col_data = self.schema["table"][table]["columns"]
+                    pks = [{"name": y} for x in self.get_keys(table, True)[0] for y in x["name"]]
+                    key_data = pks or col_data
+                    argslist = [self.make_args(key_data, row) for row in rows]
+                    where = " AND ".join("%s IS :%s" % (grammar.quote(c["name"]), a)
+                                         for c, a in zip(key_data, argslist[0])) \
+                            if argslist else ""
+                    sql = "INSERT OR IGNORE INTO temp.%s (%s, __step__) SELECT %s, %s FROM %s " \
+                          "WHERE %s" % (tempname, ", ".join(map(grammar.quote, keys)),
+                                        ", ".join(map(grammar.quote, keys)), step,
+                                        grammar.quote(table), where)
+                    if argslist: run(sql, argslist, many=True)
+                queue.append((table, step))
+
+                while queue:
+                    table1, step1 = queue.pop(0)
+                    if not util.lceq(table1, table):
+                        lock = self.get_lock("table", table1)
+                        if lock: raise Exception("%s, cannot delete." % lock)
+                    tempname1, keys1 = get_keytable(table1)
+
+                    sql = "SELECT %s FROM temp.%s WHERE __step__ = ?" % \
+                          (", ".join(map(grammar.quote, keys1)), tempname1)
+                    key_data = self.execute(sql, [step1], cursor=cursor).fetchall()
+                    if not key_data: continue # while queue
+
+                    stepsql = select_keys("v", keys1, "FROM temp.%s v WHERE v.__step__ = %s" %
+                                                      (tempname1, step1))
+
+                    # Collect related rows in foreign tables before deleting
+                    for lk in self.get_keys(table1)[0]:
+                        for table2, keys2 in lk.get("table", {}).items():
+                            table2 = self.schema["table"][table2]["name"]
+                            tempname2, keys2k = get_keytable(table2)
+                            step += 1
+                            parentsql = select_keys("p", lk["name"], "FROM %s p WHERE %s" % (
+                                grammar.quote(table1), match_keys("p", keys1, stepsql)
+                            ))
+                            sql = "INSERT OR IGNORE INTO temp.%s (%s, __step__) " \
+                                  "SELECT %s, %s FROM %s c WHERE %s" % (
+                                tempname2, ", ".join(map(grammar.quote, keys2k)),
+                                ", ".join("c.%s" % grammar.quote(k) for k in keys2k), step,
+                                grammar.quote(table2), match_keys("c", keys2, parentsql)
+                            )
+                            if run(sql): queue.append((table2, step))
+
+                    logger.info("Deleting %s from table %s, %s.", util.plural("row", key_data),
+                                util.unprint(grammar.quote(table1)), self.name)
+                    sql = "DELETE FROM %s WHERE %s" % (grammar.quote(table1),
+                          match_keys(grammar.quote(table1), keys1, stepsql))
+                    run(sql)
+                    result.append((table1, key_data))
+
+                self.execute("COMMIT", cursor=cursor)
+            finally:
+                for tempname, _ in keytables.values():
+                    util.try_ignore(self.execute, "DROP TABLE IF EXISTS temp.%s" % tempname)
             self.log_query("DELETE CASCADE", [x for x, _ in queries],
                            [x for _, x in queries])
             self.last_modified = datetime.datetime.now()
@@ -1807,16 +2670,36 @@ WARNING: misuse can easily result in a corrupt database file.""",
         @param   dump   if True, returns only directives for db dump
         @param   stats  if True, returns only directives for statistics export
         """
-        result = {}
+        result, names = {}, []
         for name, opts in self.PRAGMA.items():
             if opts.get("read") == False: continue # for name, opts
             if dump  and not opts.get("dump") \
             or stats and not opts.get("dump") and not opts.get("stats"):
                 continue # for name, opts
+            names.append(name)
+
+        # Select all scalar directives in one query if possible, else one by one
+        values = {} # {name: value}
+        batch = [n for n in names if "table" != self.PRAGMA[n]["type"]
+                 and n not in self.PRAGMA_NONFUNCTIONS] if self.has_feature("pragma_functions") else []
+        while batch:
+            sql = "SELECT %s" % ", ".join("(SELECT * FROM pragma_%s()) AS %s" % (n, n)
+                                          for n in batch)
+            try: row = self.execute(sql, log=False).fetchone()
+            except Exception as e:
+                match = re.search(r"no such table: pragma_(\w+)", str(e))
+                if not match or match.group(1) not in batch: break # while batch
+                self.PRAGMA_NONFUNCTIONS.add(match.group(1)), batch.remove(match.group(1))
+            else:
+                values = {n: row[n] for n in batch}
+                break # while batch
 
-            rows = self.execute("PRAGMA %s" % name, log=False).fetchall()
+        for name in names:
+            opts = self.PRAGMA[name]
+            if name in values: rows = [{name: values[name]}] if values[name] is not None else []
+            else: rows = self.execute("PRAGMA %s" % name, log=False).fetchall()
             if not rows:
-                if not callable(opts["type"]): continue # for name, opts
+                if not callable(opts["type"]): continue # for name
                 value = opts["type"]()
             elif "table" == opts["type"]: value = [next(iter(x.values())) for x in rows]
             else:
@@ -1843,6 +2726,7 @@ WARNING: misuse can easily result in a corrupt database file.""",
         opts.update(name=newname, tbl_name=tbl_name)
         opts["meta"].update(name=newname)
         self.schema[category][newname] = opts
+        self.relations = None
         for mycategory, names in reloads.items():
             for myname in names:
                 self.populate_schema(category=mycategory, name=myname, parse=True)
@@ -2243,6 +3127,1211 @@ WARNING: misuse can easily result in a corrupt database file.""",
 
 
 
+class DataRow(Mapping):
+    """
+    Compact read-only mapping of a resultset row, for iterating large queries.
+
+    Backed by a list of raw values and column names shared by all rows
+    of the same cursor; BLOBs are converted to strings on first access.
+    """
+    __slots__ = ("_names", "_index", "_values")
+
+
+    def __init__(self, names, index, values):
+        """
+        @param   names   tuple of unique column names
+        @param   index   {column name: index in values}
+        @param   values  list of raw column values
+        """
+        self._names, self._index, self._values = names, index, values
+
+
+    def __getitem__(self, key):
+        i = self._index[key]
+        value = self._values[i]
+        if type(value) in BINARY_TYPES: value = self._values[i] = decode_value(value)
+        return value
+
+
+    def __contains__(self, key):
+        return key in self._index
+
+
+    def __iter__(self):
+        return iter(self._names)
+
+
+    def __len__(self):
+        return len(self._names)
+
+
+    def __repr__(self):
+        return "%s(%r)" % (type(self).__name__, self.copy())
+
+
+    def copy(self):
+        """Returns row as a new dictionary."""
+        return dict(zip(self._names, self.values()))
+
+
+    def keys(self):
+        """Returns a list of column names."""
+        return list(self._names)
+
+
+    def values(self):
+        """Returns a list of column values, with BLOBs converted to strings."""
+        values, index = self._values, self._index
+        for i, value in enumerate(values):
+            if type(value) in BINARY_TYPES: values[i] = decode_value(value)
+        if len(values) == len(self._names): return list(values)
+        return [values[index[n]] for n in self._names]
+
+
+    def items(self):
+        """Returns a list of (column name, value) pairs."""
+        return list(zip(self._names, self.values()))
+
+
+
+class RowFactory(object):
+    """
+    Cursor row factory producing DataRow instances,
+    caching column names per cursor description.
+    """
+    __slots__ = ("_description", "_names", "_index")
+
+
+    def __init__(self):
+        self._description, self._names, self._index = None, (), {}
+
+
+    def __call__(self, cursor, row):
+        if cursor.description is not self._description:
+            names = [decode_name(c[0]) for c in cursor.description]
+            self._index = {n: i for i, n in enumerate(names)}
+            self._names = tuple(OrderedDict((n, True) for n in names))
+            self._description = cursor.description
+        return DataRow(self._names, self._index, list(row))
+
+
+
+class Profiler(object):
+    """
+    Collects SQL statement statistics, grouped by statement shape:
+    SQL with literals and parameters replaced by placeholders.
+
+    Timings and written rows are recorded by Database for statements it runs,
+    rows returned for rows iterated from Database.select(), statement counts
+    by SQLite trace callback, including statements within scripts.
+    """
+
+    """Maximum number of latest durations to retain per shape, for percentiles."""
+    MAX_SAMPLES = 1000
+
+    """Regex for SQL tokens to replace with placeholders, or to retain as is."""
+    SHAPE_RGX = re.compile(r"""
+        "(?:[^"]|"")*" | `[^`]*` | \[[^\]]*\]          # Quoted names: retain
+        | [xX]'[0-9a-fA-F]*' | '(?:[^']|'')*'           # BLOB and string literals
+        | (?<![\w.])\.?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?   # Numeric literals
+        | \?\d* | [:@$][\w:]+                          # Parameters
+    """, re.X | re.U)
+
+    """Regex for consecutive placeholders like "?, ?, ?" in value lists."""
+    PLACEHOLDERS_RGX = re.compile(r"\?(?:\s*,\s*\?)+")
+
+
+    def __init__(self):
+        self.stats = {} # {shape: {sql, calls, statements, time, rows, written, samples}}
+        self.shapes = util.MemoCache(maxsize=10000) # {sql: shape}
+        self.lock = threading.Lock()
+
+
+    def start(self, target):
+        """
+        Returns measurement mark for Profiler.stop().
+
+        @param   target  sqlite3.Connection or sqlite3.Cursor executing statement
+        """
+        connection = getattr(target, "connection", target)
+        return (time.time(), connection, connection.total_changes)
+
+
+    def stop(self, mark, sql):
+        """Records statement execution started with Profiler.start()."""
+        elapsed = time.time() - mark[0]
+        self.record(sql, elapsed, written=mark[1].total_changes - mark[2])
+
+
+    def iterate(self, cursor, sql):
+        """Yields rows from cursor, recording time spent fetching and number of rows."""
+        elapsed, count, iterator = 0, 0, iter(cursor)
+        try:
+            while True:
+                start = time.time()
+                try: row = next(iterator)
+                except StopIteration: break # while True
+                finally: elapsed += time.time() - start
+                count += 1
+                yield row
+        finally:
+            self.record(sql, elapsed, rows=count, calls=0)
+
+
+    def trace(self, sql):
+        """SQLite trace callback, counts statement execution."""
+        self.record(sql, calls=0, statements=1)
+
+
+    def record(self, sql, elapsed=None, rows=0, written=0, calls=1, statements=0):
+        """
+        Adds statement statistics.
+
+        @param   elapsed     time spent in seconds, if measured
+        @param   rows        number of rows returned
+        @param   written     number of rows inserted, updated or deleted
+        @param   calls       number of statement invocations by program
+        @param   statements  number of statement executions in SQLite
+        """
+        shape = self.shape(sql)
+        with self.lock:
+            stats = self.stats.get(shape)
+            if not stats:
+                stats = self.stats[shape] = {"sql": shape, "calls": 0, "statements": 0,
+                                             "time": 0, "rows": 0, "written": 0,
+                                             "samples": deque(maxlen=self.MAX_SAMPLES)}
+            stats["calls"] += calls
+            stats["statements"] += statements
+            stats["rows"] += rows
+            stats["written"] += written
+            if elapsed is not None:
+                stats["time"] += elapsed
+                if calls: stats["samples"].append(elapsed)
+                elif stats["samples"]: stats["samples"][-1] += elapsed
+
+
+    def shape(self, sql):
+        """Returns SQL with whitespace collapsed and values replaced with "?"."""
+        sql = util.to_unicode(sql)
+        result = self.shapes.get(sql)
+        if result is None:
+            repl = lambda m: m.group(0) if m.group(0)[0] in "\"`[" else "?"
+            result = self.SHAPE_RGX.sub(repl, sql)
+            result = self.PLACEHOLDERS_RGX.sub("?, ..", result)
+            result = re.sub(r"\s+", " ", result).strip()
+            if len(sql) < 1000: self.shapes[sql] = result # Avoid caching values-inlined SQL
+        return result
+
+
+    def get_stats(self, sort="time"):
+        """
+        Returns collected statistics as [{sql, calls, statements, time, mean, p95, rows,
+        written}], times in seconds, in descending order of given field.
+        """
+        result = []
+        with self.lock:
+            items = [dict(x, samples=sorted(x["samples"])) for x in self.stats.values()]
+        for stats in items:
+            samples = stats.pop("samples")
+            stats["mean"] = stats["time"] / stats["calls"] if stats["calls"] else 0
+            stats["p95"]  = samples[min(len(samples) - 1, int(len(samples) * 0.95))] \
+                            if samples else 0
+            result.append(stats)
+        return sorted(result, key=lambda x: (-x[sort], x["sql"]))
+
+
+    def format_report(self, limit=None, sort="time"):
+        """
+        Returns collected statistics as text table.
+
+        @param   limit  maximum number of statement shapes to include, if not all
+        @param   sort   field to order statements by, descending
+        """
+        stats = self.get_stats(sort)
+        header = "SQL profile: %s in %s, %.3f seconds in total." % (
+            util.plural("statement", sum(x["statements"] or x["calls"] for x in stats)),
+            util.plural("shape", stats), sum(x["time"] for x in stats))
+        if limit is not None and len(stats) > limit:
+            header += " Showing %s with highest %s." % (util.plural("shape", limit), sort)
+        cols = ("Calls", "Stmts", "Total ms", "Mean ms", "P95 ms", "Rows", "Written", "SQL")
+        lines = [header, "", "%7s %7s %10s %9s %9s %9s %9s  %s" % cols]
+        for x in stats[:limit]:
+            lines.append("%7s %7s %10.1f %9.2f %9.2f %9s %9s  %s" % (
+                x["calls"], x["statements"], x["time"] * 1000, x["mean"] * 1000,
+                x["p95"] * 1000, x["rows"], x["written"], util.ellipsize(x["sql"], 200)
+            ))
+        return "\n".join(lines)
+
+
+    def clear(self):
+        """Drops all collected statistics."""
+        with self.lock: self.stats.clear()
+
+
+
+class ActionLog(object):
+    """
+    Database action log, retaining latest entries in memory and optionally
+    spilling older entries to a temporary SQLite file, read back in pages.
+
+    Consecutive identical entries are summarized as one entry with a count.
+    Entries are {timestamp, action, sql: "" or [""], ?params: x or [x], ?count: int}.
+    """
+
+    """Number of spilled entries read from file at a time when iterating."""
+    PAGE_SIZE = 100
+
+
+    def __init__(self, maxsize=None, spill=None):
+        """
+        @param   maxsize  maximum number of entries to keep in memory,
+                          defaults to conf.MaxActionLogEntries
+        @param   spill    whether to write entries exceeding maxsize to file
+                          instead of discarding them, defaults to conf.SpillActionLog
+        """
+        self.maxsize = conf.MaxActionLogEntries if maxsize is None else maxsize
+        self.spill   = conf.SpillActionLog if spill is None else spill
+        self.entries = deque() # Latest entries in memory
+        self.spilled = 0       # Number of entries in spill file
+        self.dropped = 0       # Number of entries discarded
+        self._path   = None    # Path to spill file, if any
+        self._conn   = None    # sqlite3.Connection to spill file, if any
+        self._failed = False   # Whether opening spill file failed
+        self._lock   = threading.RLock()
+
+
+    def __len__(self):
+        return self.spilled + len(self.entries)
+
+
+    def __iter__(self):
+        """Yields all retained entries, oldest first."""
+        for i in itertools.count(0, self.PAGE_SIZE):
+            entries = self.get(i, self.PAGE_SIZE)
+            for entry in entries: yield entry
+            if len(entries) < self.PAGE_SIZE: break # for i
+
+
+    def append(self, entry):
+        """Adds entry to log, or increments count of last entry if identical."""
+        with self._lock:
+            last = self.entries[-1] if self.entries else None
+            if last and all(last.get(k) == entry.get(k) for k in ("action", "sql", "params")):
+                last["count"] = last.get("count", 1) + 1
+                return
+            self.entries.append(entry)
+            if len(self.entries) > self.maxsize:
+                self._shrink()
+
+
+    def get(self, start=0, count=None):
+        """
+        Returns a list of retained entries, oldest first.
+
+        @param   start  index of first entry to return
+        @param   count  maximum number of entries to return, if not all
+        """
+        result = []
+        with self._lock:
+            end = len(self) if count is None else min(len(self), start + count)
+            if start < self.spilled:
+                try:
+                    rows = self._conn.execute("SELECT data FROM log WHERE id >= ? AND id < ? "
+                                              "ORDER BY id", [start, min(end, self.spilled)])
+                    result.extend(pickle.loads(bytes(x[0])) for x in rows)
+                except Exception:
+                    logger.exception("Error reading action log from %s.", self._path)
+            start, end = (max(0, x - self.spilled) for x in (start, end))
+            result.extend(itertools.islice(self.entries, start, end))
+        return result
+
+
+    def clear(self):
+        """Drops all entries and spill file."""
+        with self._lock:
+            self.close()
+            self.entries.clear()
+            self.dropped = 0
+
+
+    def close(self):
+        """Closes and deletes spill file, if any, discarding spilled entries."""
+        with self._lock:
+            if self._conn: util.try_ignore(self._conn.close)
+            if self._path: util.try_ignore(os.unlink, self._path)
+            self.dropped += self.spilled
+            self._conn, self._path, self.spilled = None, None, 0
+
+
+    def _shrink(self):
+        """Moves oldest entries from memory to spill file, or discards them."""
+        count = len(self.entries) - self.maxsize + self.maxsize // 10
+        entries = [self.entries.popleft() for _ in range(min(count, len(self.entries)))]
+        if not self.spill or not self._connect():
+            self.dropped += len(entries)
+            return
+
+        rows = []
+        for entry in entries:
+            try: data = pickle.dumps(entry, protocol=2)
+            except Exception: # Unpicklable parameter values
+                data = pickle.dumps(dict(entry, params=repr(entry.get("params"))), protocol=2)
+            rows.append((self.spilled + len(rows), sqlite3.Binary(data)))
+        try:
+            self._conn.executemany("INSERT INTO log (id, data) VALUES (?, ?)", rows)
+            self.spilled += len(rows)
+        except Exception:
+            logger.exception("Error writing action log to %s.", self._path)
+            self.dropped += len(rows)
+
+
+    def _connect(self):
+        """Creates spill file if not already created, returns whether file is available."""
+        if self._conn or self._failed: return bool(self._conn)
+        try:
+            fh, self._path = tempfile.mkstemp(".log.db")
+            os.close(fh)
+            self._conn = sqlite3.connect(self._path, check_same_thread=False,
+                                         isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode = OFF")
+            self._conn.execute("PRAGMA synchronous = OFF")
+            self._conn.execute("CREATE TABLE log (id INTEGER PRIMARY KEY, data BLOB)")
+        except Exception:
+            logger.exception("Error creating action log file.")
+            if self._conn: util.try_ignore(self._conn.close)
+            if self._path: util.try_ignore(os.unlink, self._path)
+            self._conn, self._path, self._failed = None, None, True
+        return bool(self._conn)
+
+
+
+class DatabaseDiff(object):
+    """
+    Compares schema and table data of two databases.
+
+    Table data is compared in bounded memory, by streaming both tables in
+    primary key or ROWID order in ranges of conf.DiffChunkSize rows:
+    ranges with identical row hashes are skipped, differing ranges
+    are queried again and merged row by row.
+    """
+
+    """Schema categories in the order of comparison."""
+    CATEGORIES = ["table", "index", "trigger", "view"]
+
+    """Sort order of value types in SQLite ORDER BY, for merging key streams."""
+    TYPE_ORDER = {"null": 0, "integer": 1, "real": 1, "text": 2, "blob": 3}
+
+
+    def __init__(self, db1, db2, tables=None):
+        """
+        @param   db1     Database instance to compare, with parsed schema
+        @param   db2     Database instance to compare against, with parsed schema
+        @param   tables  names of tables to compare data of, defaults to all
+        """
+        self.db1, self.db2 = db1, db2
+        self.tables = tables
+        self.counts = CaselessDict() # {table: {"-": rows removed, "+": added, "~": changed}}
+
+
+    def get_schema_diff(self):
+        """
+        Returns schema differences, as [{category, name, change, ?sql1, ?sql2}]
+        where change is one of "added", "removed", "changed".
+
+        Items are compared by generated SQL if schema is parsed,
+        ignoring differences in comments and whitespace.
+        """
+        result = []
+        for category in self.CATEGORIES:
+            items1, items2 = (db.schema.get(category) or {} for db in (self.db1, self.db2))
+            names = {n.lower(): n for n in list(items2) + list(items1)}
+            for name in sorted(names.values(), key=lambda x: x.lower()):
+                sql1, sql2 = (x[name]["sql"] if name in x else None for x in (items1, items2))
+                if sql1 is None and sql2 is None: continue # for name
+                if sql1 is None: change = "added"
+                elif sql2 is None: change = "removed"
+                elif grammar.strip_and_collapse(sql1, literals=False) \
+                  == grammar.strip_and_collapse(sql2, literals=False): continue # for name
+                else: change = "changed"
+                item = {"category": category, "name": name, "change": change}
+                if sql1 is not None: item["sql1"] = items1[name].get("sql0") or sql1
+                if sql2 is not None: item["sql2"] = items2[name].get("sql0") or sql2
+                result.append(item)
+        return result
+
+
+    def get_tables(self):
+        """Returns names of tables present in both databases, to compare data of."""
+        items2 = self.db2.schema.get("table") or {}
+        names = [n for n in self.db1.schema.get("table") or {} if n in items2]
+        if self.tables is not None:
+            names = [n for n in names if any(util.lceq(n, x) for x in self.tables)]
+        return sorted(names, key=lambda x: x.lower())
+
+
+    def get_table_info(self, table):
+        """
+        Returns data comparison information for table present in both databases.
+
+        @return   {"columns": [names in both], "keys": [key column names] or None,
+                   "rowid": whether key is ROWID, "nullable": whether key can contain NULL}
+        """
+        items = [db.schema["table"][table] for db in (self.db1, self.db2)]
+        names2 = set(c["name"].lower() for c in items[1]["columns"])
+        result = {"columns": [c["name"] for c in items[0]["columns"]
+                              if c["name"].lower() in names2],
+                  "keys": None, "rowid": False, "nullable": False}
+
+        pks = []
+        for db in (self.db1, self.db2):
+            keys = [x for x in db.get_keys(table, pks_only=True)[0] if "pk" in x]
+            pks.append([n.lower() for n in keys[-1]["name"]] if keys else [])
+        rowids = [db.get_rowid(table) for db in (self.db1, self.db2)]
+        if pks[0] and pks[0] == pks[1] and set(pks[0]) <= names2:
+            result["keys"] = [c for n in pks[0] for c in result["columns"] if c.lower() == n]
+        elif rowids[0] and rowids[0] == rowids[1]:
+            result.update(keys=[rowids[0]], rowid=True)
+        if result["keys"] and not result["rowid"]:
+            for item, rowid in zip(items, rowids):
+                cols = [c for c in item["columns"] if c["name"].lower() in pks[0]]
+                if rowid and not (len(cols) == 1 and "INTEGER" == cols[0].get("type")) \
+                and not all("notnull" in c for c in cols):
+                    result["nullable"] = True
+        return result
+
+
+    def diff_table(self, table, progress=None):
+        """
+        Yields row differences in table data, in key order.
+
+        Rows with NULL in key columns are compared separately first,
+        as multisets of full rows yielding only removals and additions,
+        as such keys are not unique and cannot be used in key range conditions.
+
+        @param   table     name of table present in both databases, with a common key
+        @param   progress  callback(name, count) with number of rows scanned in first
+                           database, returning false if comparison should cancel
+        @return            generator yielding {"change": "-" | "+" | "~", "keys": [key values],
+                           "row1": [values] or None, "row2": [values] or None,
+                           "qkeys": [quoted keys], "quoted1": [quoted values] or None,
+                           "quoted2": [quoted values] or None}, values in column order
+        """
+        info = self.get_table_info(table)
+        cols, keys = info["columns"], info["keys"]
+        keyexprs = ["%s COLLATE BINARY" % grammar.quote(k) for k in keys]
+        keyrow = "(%s)" % ", ".join(keyexprs)
+        order = " ORDER BY %s" % ", ".join(keyexprs)
+        fullorder = " ORDER BY %s" % ", ".join("quote(%s) COLLATE BINARY" % grammar.quote(c)
+                                               for c in cols)
+        rowexpr = " || ',' || ".join("quote(%s)" % grammar.quote(c)
+                                     for c in (keys if info["rowid"] else []) + cols)
+        keycols = ", ".join(["typeof(%s)" % grammar.quote(k) for k in keys] +
+                            list(map(grammar.quote, keys)))
+        fullcols = ", ".join([keycols] + ["quote(%s)" % grammar.quote(c) for c in keys + cols] +
+                             list(map(grammar.quote, cols)))
+        sqlbase = "SELECT %%s FROM %s" % grammar.quote(table)
+        notnull = " AND ".join("%s IS NOT NULL" % grammar.quote(k) for k in keys)
+        isnull  = " OR ".join("%s IS NULL" % grammar.quote(k) for k in keys)
+        n, state = len(keys), {"count": 0, "cancel": False}
+        counts = self.counts[table] = {"-": 0, "+": 0, "~": 0}
+
+        def text(v):
+            return decode_value(v) if type(v) in BINARY_TYPES else v
+
+        def sortkey(row):
+            return tuple((self.TYPE_ORDER[text(t)], v) for t, v in zip(row[:n], row[n:2*n]))
+
+        def bindkey(row):
+            """Returns key values of key or full row as query parameters."""
+            return [sqlite3.Binary(v) if "blob" == text(t) else text(v)
+                    for t, v in zip(row[:n], row[n:2*n])]
+
+        def make_where(first=None, last=None, nulls=False):
+            """Returns (WHERE-clause, params) for key range (first, last]."""
+            conds, params = [isnull if nulls else notnull] if info["nullable"] else [], []
+            if first is not None:
+                conds.append("%s > (%s)" % (keyrow, ", ".join("?" * n)))
+                params.extend(first)
+            if last is not None:
+                conds.append("%s <= (%s)" % (keyrow, ", ".join("?" * n)))
+                params.extend(last)
+            return (" WHERE " + " AND ".join("(%s)" % x for x in conds)) if conds else "", params
+
+        def tick(count=0):
+            """Adds to scanned row count and reports progress, returns whether to continue."""
+            state["count"] += count
+            if progress and not progress(name=table, count=state["count"]):
+                state["cancel"] = True
+            return not state["cancel"]
+
+        def merge(connections, where, params, multiset=False):
+            """
+            Yields differences from full rows in key range,
+            or from rows compared by full content if multiset.
+            """
+            sql = (sqlbase % fullcols) + where + (fullorder if multiset else order)
+            def rowkey(row):
+                return tuple(row[3*n:3*n+len(cols)]) if multiset else sortkey(row)
+            cursors = [c.cursor() for c in connections]
+            for c in cursors: c.row_factory = None
+            try:
+                rows1, rows2 = (c.execute(sql, params) for c in cursors)
+                row1, row2 = next(rows1, None), next(rows2, None)
+                for i in itertools.count():
+                    if row1 is None and row2 is None: break # for i
+                    key1 = None if row1 is None else rowkey(row1)
+                    key2 = None if row2 is None else rowkey(row2)
+                    if key2 is None or key1 is not None and key1 < key2: change = "-"
+                    elif key1 is None or key2 < key1: change = "+"
+                    elif row1[2*n:3*n+len(cols)] != row2[2*n:3*n+len(cols)]: change = "~"
+                    else: change = None
+
+                    if change:
+                        counts[change] += 1
+                        row = row1 if row1 is not None and change != "+" else row2
+                        yield {"change": change, "keys": [text(v) for v in row[n:2*n]],
+                               "qkeys": [text(v) for v in row[2*n:3*n]],
+                               "row1": None if "+" == change else
+                                       [text(v) for v in row1[3*n+len(cols):]],
+                               "row2": None if "-" == change else
+                                       [text(v) for v in row2[3*n+len(cols):]],
+                               "quoted1": None if "+" == change else
+                                          [text(v) for v in row1[3*n:3*n+len(cols)]],
+                               "quoted2": None if "-" == change else
+                                          [text(v) for v in row2[3*n:3*n+len(cols)]]}
+                    if change != "+":
+                        row1 = next(rows1, None)
+                    if i and not i % 1000 and not tick(): break # for i
+                    if change != "-": row2 = next(rows2, None)
+            finally:
+                for c in cursors: util.try_ignore(c.close)
+
+        def get_bound(connection, where, params):
+            """Returns last key of next full chunk as query parameters, or None if no full chunk."""
+            sql = (sqlbase % keycols) + where + order
+            sql += " LIMIT 1 OFFSET %s" % (conf.DiffChunkSize - 1)
+            cursor = connection.cursor()
+            cursor.row_factory = None
+            try: row = cursor.execute(sql, params).fetchone()
+            finally: util.try_ignore(cursor.close)
+            return None if row is None else bindkey(row)
+
+        def scan(connection, where, params, result):
+            """Hashes rows in key range, populating result list with [row count, hexdigest]."""
+            sql = (sqlbase % rowexpr) + where + order
+            cursor = connection.cursor()
+            cursor.row_factory = None
+            count, digest = 0, hashlib.sha1()
+            try:
+                for row in cursor.execute(sql, params):
+                    digest.update(row[0]), digest.update(b"\n")
+                    count += 1
+            finally: util.try_ignore(cursor.close)
+            result[:] = [count, digest.hexdigest()]
+
+        # Separate readers only in WAL mode, as they would block writes otherwise
+        connections = [db.is_wal() and db.connect_reader() or db.connection
+                       for db in (self.db1, self.db2)]
+        try:
+            if info["nullable"]:
+                where, params = make_where(nulls=True)
+                for diff in merge(connections, where, params, multiset=True): yield diff
+
+            last = None
+            while not state["cancel"]:
+                bound = get_bound(connections[0], *make_where(first=last))
+                where, params = make_where(first=last, last=bound)
+                # Hash both sides of range concurrently, SQLite releasing GIL while stepping
+                results = [[], []]
+                thread = threading.Thread(target=scan, args=(connections[1], where, params, results[1]))
+                thread.daemon = True
+                thread.start()
+                scan(connections[0], where, params, results[0])
+                thread.join()
+                if results[0] != results[1]:
+                    for diff in merge(connections, where, params): yield diff
+                if not tick(results[0][0]) or bound is None: break # while not state["cancel"]
+                last = bound
+        finally:
+            for db, connection in zip((self.db1, self.db2), connections):
+                if connection is not db.connection: util.try_ignore(connection.close)
+
+
+    def get_patch_sql(self, progress=None):
+        """
+        Yields SQL statements changing the first database into the second,
+        terminated with semicolons, wrapped in a transaction, after header comments.
+
+        Tables with changed schema are re-created and re-populated,
+        other tables are updated by changed rows only. Rows with NULL
+        in a nullable primary key are deleted one at a time by full content
+        and re-inserted, as such keys are not unique. Triggers are
+        dropped before and re-created after changing data.
+
+        @param   progress  callback(name, count) with number of rows scanned,
+                           returning false if generation should cancel
+        """
+        changes = self.get_schema_diff()
+        rebuilds = set(x["name"].lower() for x in changes
+                       if "table" == x["category"] and "removed" != x["change"])
+        items1, items2 = self.db1.schema, self.db2.schema
+        state = {"cancel": False}
+        def on_progress(**kwargs):
+            if progress and not progress(**kwargs): state["cancel"] = True
+            return not state["cancel"]
+
+        yield "-- Changes %s into %s." % (self.db1, self.db2)
+        yield "-- %s\n" % templates.export_comment()
+        yield "BEGIN;"
+        yield "PRAGMA defer_foreign_keys = ON;"
+        for category in ("trigger", "view", "index", "table"):
+            for name in (items1.get(category) or {}):
+                item = next((x for x in changes if category == x["category"]
+                             and util.lceq(name, x["name"]) and "added" != x["change"]), None)
+                if "trigger" == category and items1[category][name].get("sql") or item:
+                    yield "DROP %s %s;" % (category.upper(), grammar.quote(name))
+
+        for name, item in sorted((items2.get("table") or {}).items(), key=lambda x: x[0].lower()):
+            if name.lower() in rebuilds: yield grammar.terminate(item["sql0"])
+
+        for name in sorted((items2.get("table") or {}), key=lambda x: x.lower()):
+            if name.lower() not in rebuilds: continue # for name
+            cols = [c["name"] for c in items2["table"][name]["columns"]]
+            sql = "SELECT %s FROM %s" % (", ".join("quote(%s)" % grammar.quote(c) for c in cols),
+                                         grammar.quote(name))
+            insert = "INSERT INTO %s (%s) VALUES (%%s)" % (grammar.quote(name),
+                                                           ", ".join(map(grammar.quote, cols)))
+            cursor = self.db2.connection.cursor()
+            cursor.row_factory = None
+            try:
+                for i, row in enumerate(cursor.execute(sql), 1):
+                    yield insert % ", ".join(map(decode_value, row)) + ";"
+                    if not i % 1000 and not on_progress(name=name, count=i): return
+            finally: util.try_ignore(cursor.close)
+
+        for name in self.get_tables():
+            info = self.get_table_info(name)
+            if name.lower() in rebuilds or not info["keys"]: continue # for name
+            cols, keys, table = info["columns"], info["keys"], grammar.quote(name)
+            rowid = self.db1.get_rowid(name)
+            insertcols = ([] if not info["rowid"] else keys) + cols
+            insert = "INSERT INTO %s (%s) VALUES (%%s)" % (table,
+                                                           ", ".join(map(grammar.quote, insertcols)))
+            for diff in self.diff_table(name, on_progress):
+                where = " AND ".join("%s %s %s" % (grammar.quote(k), "IS" if "NULL" == v else "=", v)
+                                     for k, v in zip(keys, diff["qkeys"]))
+                if info["nullable"] and "NULL" in diff["qkeys"] and "-" == diff["change"]:
+                    match = " AND ".join("%s IS %s" % (grammar.quote(c), v)
+                                         for c, v in zip(cols, diff["quoted1"]))
+                    where = "%s IN (SELECT %s FROM %s WHERE %s LIMIT 1)" % \
+                            (rowid, rowid, table, match)
+                if "-" == diff["change"]:
+                    yield "DELETE FROM %s WHERE %s;" % (table, where)
+                elif "+" == diff["change"]:
+                    values = ([] if not info["rowid"] else diff["qkeys"]) + diff["quoted2"]
+                    yield insert % ", ".join(values) + ";"
+                else:
+                    sets = ["%s = %s" % (grammar.quote(c), v2) for c, v1, v2
+                            in zip(cols, diff["quoted1"], diff["quoted2"]) if v1 != v2]
+                    yield "UPDATE %s SET %s WHERE %s;" % (table, ", ".join(sets), where)
+            if state["cancel"] or not on_progress(name=name, done=True): return
+
+        for category in ("index", "view", "trigger"):
+            for name, item in (items2.get(category) or {}).items():
+                if not item.get("sql"): continue # for name
+                change = next((x for x in changes if category == x["category"]
+                               and util.lceq(name, x["name"])), None)
+                if "trigger" == category or change or "index" == category \
+                and item.get("tbl_name", "").lower() in rebuilds:
+                    yield grammar.terminate(item["sql0"])
+        yield "COMMIT;"
+
+
+
+class SearchIndex(object):
+    """
+    Full-text index of table data in a sidecar SQLite file next to the database,
+    for narrowing data search down to candidate rows.
+
+    Each indexed ROWID table gets an FTS5 table, one row per table row
+    with all column values as text, tokenized either into words,
+    for matching search words from word starts, or into trigrams,
+    for prefiltering exact substring matches. FTS5 table is contentless
+    if SQLite supports deleting from contentless tables (3.43+).
+
+    Index is refreshed incrementally: skipped entirely if database is
+    unchanged since last refresh (PRAGMA data_version and file state),
+    and tables not written to via database connection since last refresh
+    are skipped if no other connection has changed the database meanwhile.
+    Other tables are compared to index by content hashes stored per row,
+    re-indexing only added, changed and deleted rows. Tables with changed
+    schema are re-indexed in full.
+    """
+
+    """Suffix of index file name, appended to database file name."""
+    SUFFIX = ".sqlitely-index"
+
+    """Schema name of index attached to search connection."""
+    SCHEMA = "searchindex"
+
+    """Index file format version, index with other version is rebuilt."""
+    VERSION = 4
+
+    """Number of rows compared and indexed in one transaction."""
+    BATCH = 10000
+
+    """FTS5 tokenizers for index kinds, as {kind: tokenize option}."""
+    TOKENIZERS = {"words": "unicode61 remove_diacritics 0", "trigram": "trigram"}
+
+    """Whether index kinds and contentless delete are supported by SQLite, as {kind: bool}."""
+    SUPPORT = {}
+
+
+    def __init__(self, db, kind="words"):
+        """
+        @param   db    Database instance
+        @param   kind  index kind, "words" or "trigram"
+        """
+        self.db = db
+        self.kind = kind
+        self.fresh = CaselessDict()   # {table name: FTS table name} for tables up to date
+        self.checked = CaselessDict() # {table name: (database state, write count)} at last refresh
+        self.versions = None          # Database state at last complete refresh
+        self.lock = threading.RLock()
+
+
+    @property
+    def path(self):
+        """Returns path of index file."""
+        return self.db.filename + self.SUFFIX
+
+
+    @classmethod
+    def is_supported(cls, db, kind="words"):
+        """Returns whether database can be searched via full-text index of given kind."""
+        if kind not in cls.SUPPORT:
+            try:
+                sqlite3.connect(":memory:").execute("CREATE VIRTUAL TABLE x USING "
+                                                    "fts5(y, tokenize='%s')" % cls.TOKENIZERS[kind])
+                cls.SUPPORT[kind] = True
+            except Exception: cls.SUPPORT[kind] = False
+        return bool(cls.SUPPORT[kind] and db.is_open() and not db.temporary
+                    and not db.snapshot and sys.version_info >= (3, 4))
+
+
+    @classmethod
+    def is_contentless(cls):
+        """Returns whether SQLite supports deleting rows from contentless FTS5 tables."""
+        if "contentless_delete" not in cls.SUPPORT:
+            try:
+                sqlite3.connect(":memory:").execute("CREATE VIRTUAL TABLE x USING "
+                                                    "fts5(y, content='', contentless_delete=1)")
+                cls.SUPPORT["contentless_delete"] = True
+            except Exception: cls.SUPPORT["contentless_delete"] = False
+        return cls.SUPPORT["contentless_delete"]
+
+
+    def exists(self):
+        """Returns whether index file exists."""
+        return os.path.isfile(self.path)
+
+
+    def get_versions(self, tables):
+        """Returns database state for detecting changes since last refresh."""
+        return (self.db.connection, self.db.filename, self.db.get_versions(),
+                self.db.connection.total_changes, sorted(x.lower() for x in tables))
+
+
+    def update(self, tables=None, full=False, progress=None):
+        """
+        Creates or refreshes the index, returns whether index is complete.
+
+        @param   tables    names of tables to index, defaults to all ROWID tables
+        @param   full      whether to rebuild index of these tables from scratch
+        @param   progress  callback(name, index, total, ?count, ?done)
+                           returning false if update should cancel
+        @return            True if all tables indexed, False if cancelled
+        """
+        with self.lock:
+            alls = [n for n in self.db.schema.get("table", {}) if self.db.get_rowid(n)]
+            names = alls if tables is None else [n for n in alls if any(
+                        util.lceq(n, x) for x in tables)]
+            versions = self.get_versions(names)
+            if not full and versions == self.versions and self.exists():
+                if progress: progress(done=True)
+                return True
+
+            # Writes via database connection are registered per table: if no other
+            # connection has changed the database, tables not written to are unchanged
+            state, writes = versions[:3], dict(self.db.writes)
+            checks = {n: (state, writes.get(n.lower(), 0)) for n in names}
+            unchanged = [] if full else [n for n in names if checks[n] == self.checked.get(n)]
+
+            self.fresh.clear()
+            identity = json.dumps(self.db.get_file_identity())
+            conn = None
+            try:
+                conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+                result = self._update(conn, alls, names, unchanged, identity, full, progress)
+            finally:
+                conn and util.try_ignore(conn.close)
+            for name in self.fresh: self.checked[name] = checks.get(name)
+            self.versions = versions if result else None
+            if result and progress: progress(done=True)
+            return result
+
+
+    def _update(self, conn, alls, names, unchanged, identity, full=False, progress=None):
+        """Populates index file tables, returns whether index is complete."""
+        version = "%s%s" % (self.VERSION, "" if self.is_contentless() else "+content")
+        conn.execute("CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT)")
+        info = dict(conn.execute("SELECT key, value FROM info").fetchall())
+        if info.get("version") != version:
+            for (name, ) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' "
+                                         "AND name != 'info' ORDER BY "
+                                         "sql LIKE 'CREATE VIRTUAL%' DESC").fetchall():
+                conn.execute("DROP TABLE IF EXISTS %s" % grammar.quote(name, force=True))
+            conn.execute("DELETE FROM info")
+            conn.execute("INSERT INTO info VALUES ('version', ?)", [version])
+        conn.execute("CREATE TABLE IF NOT EXISTS tables (name TEXT COLLATE NOCASE, kind TEXT, "
+                     "fts TEXT, sql TEXT, stamp TEXT, PRIMARY KEY (name, kind))")
+        KEYS = ("name", "kind", "fts", "sql", "stamp")
+        entries = CaselessDict((r[0], dict(zip(KEYS, r))) for r in conn.execute(
+                               "SELECT %s FROM tables WHERE kind = ?" % ", ".join(KEYS),
+                               [self.kind]).fetchall())
+        for name in [n for n in entries if n not in alls or full and n in names]:
+            self._drop(conn, entries.pop(name))
+
+        for name in [n for n in names if n in entries]:
+            if identity == entries[name]["stamp"]:
+                self.fresh[name] = entries[name]["fts"] # Unchanged since last complete update
+            elif name in unchanged \
+            and entries[name]["sql"] == self.db.schema["table"][name]["sqlraw"]:
+                conn.execute("UPDATE tables SET stamp = ? WHERE name = ? AND kind = ?",
+                             [identity, name, self.kind])
+                self.fresh[name] = entries[name]["fts"] # Not written to since last update
+        if all(n in self.fresh for n in names): return True
+
+        # Separate reader only in WAL mode, as it would block writes otherwise
+        connection = self.db.connect_reader() if self.db.is_wal() else self.db.connection
+        if not connection: return False
+        reader = connection.cursor()
+        reader.row_factory = None
+        try:
+            for i, name in enumerate(names):
+                if name in self.fresh: continue # for i, name
+                if progress and not progress(name=name, index=i, total=len(names)):
+                    return False
+                item, entry = self.db.schema["table"][name], entries.get(name)
+                entry = self._update_table(conn, reader, item, entry, progress)
+                if not entry: return False
+                conn.execute("UPDATE tables SET stamp = ? WHERE name = ? AND kind = ?",
+                             [identity, name, self.kind])
+                self.fresh[name] = entry["fts"]
+        finally:
+            util.try_ignore(reader.close)
+            if connection is not self.db.connection: util.try_ignore(connection.close)
+        return True
+
+
+    def _update_table(self, conn, reader, item, entry, progress=None):
+        """
+        Indexes table rows added or changed since last update and drops rows deleted,
+        comparing rows to content hashes in index, returns table entry if completed.
+        """
+        rowid, table = self.db.get_rowid(item["name"]), grammar.quote(item["name"])
+        if entry and entry["sql"] != item["sqlraw"]:
+            self._drop(conn, entry) # Schema changed: re-index in full
+            entry = None
+        if entry and entry["stamp"]:
+            conn.execute("UPDATE tables SET stamp = NULL WHERE name = ? AND kind = ?",
+                         [entry["name"], self.kind])
+        if not entry:
+            cursor = conn.execute("INSERT INTO tables (name, kind, sql) VALUES (?, ?, ?)",
+                                  [item["name"], self.kind, item["sqlraw"]])
+            entry = {"name": item["name"], "kind": self.kind, "fts": "fts_%s" % cursor.lastrowid,
+                     "sql": item["sqlraw"], "stamp": None}
+            options = "content='', contentless_delete=1, " if self.is_contentless() else ""
+            conn.execute("CREATE VIRTUAL TABLE %s USING fts5(content, %stokenize='%s')" %
+                         (grammar.quote(entry["fts"], force=True), options,
+                          self.TOKENIZERS[self.kind]))
+            conn.execute("CREATE TABLE %s (id INTEGER PRIMARY KEY, hash INTEGER)" %
+                         grammar.quote(self._hashes(entry), force=True))
+            conn.execute("UPDATE tables SET fts = ? WHERE name = ? AND kind = ?",
+                         [entry["fts"], item["name"], self.kind])
+
+        # Values as SQLite converts them to text for LIKE and GLOB
+        cols = ", ".join("CAST(%s AS TEXT)" % grammar.quote(c["name"]) for c in item["columns"])
+        sql = "SELECT %s, %s FROM %s%%s ORDER BY %s LIMIT %s" % \
+              (rowid, cols, table, rowid, self.BATCH)
+        fts, hashes = (grammar.quote(x, force=True) for x in (entry["fts"], self._hashes(entry)))
+        hashsql = "SELECT id, hash FROM %s%%s" % hashes
+        last, count = None, 0
+        while True:
+            if last is None: rows = reader.execute(sql % "").fetchall()
+            else: rows = reader.execute(sql % (" WHERE %s > ?" % rowid), [last]).fetchall()
+            # Stored hashes in ROWID range of rows, or beyond if last batch
+            conds, params = [], []
+            if last is not None: conds, params = ["id > ?"], [last]
+            if len(rows) == self.BATCH: conds, params = conds + ["id <= ?"], params + [rows[-1][0]]
+            where = (" WHERE " + " AND ".join(conds)) if conds else ""
+            stored = dict(conn.execute(hashsql % where, params).fetchall())
+
+            inserts, deletes = [], []
+            for row in rows:
+                values = [v for v in row[1:] if v is not None]
+                checksum = self._hash(values)
+                previous = stored.pop(row[0], None)
+                if checksum == previous: continue # for row
+                if previous is not None: deletes.append(row[0])
+                inserts.append((row[0], "\n".join(map(decode_value, values)), checksum))
+            deletes.extend(stored) # Rows no longer in table
+
+            if inserts or deletes:
+                conn.execute("BEGIN")
+                try:
+                    conn.executemany("DELETE FROM %s WHERE rowid = ?" % fts,
+                                     [(x, ) for x in deletes])
+                    conn.executemany("DELETE FROM %s WHERE id = ?" % hashes,
+                                     [(x, ) for x in deletes])
+                    conn.executemany("INSERT INTO %s (rowid, content) VALUES (?, ?)" % fts,
+                                     [x[:2] for x in inserts])
+                    conn.executemany("INSERT INTO %s (id, hash) VALUES (?, ?)" % hashes,
+                                     [(x[0], x[2]) for x in inserts])
+                    conn.execute("COMMIT")
+                except Exception:
+                    util.try_ignore(conn.execute, "ROLLBACK")
+                    raise
+            count += len(rows)
+            if progress and not progress(name=item["name"], count=count):
+                return None
+            if len(rows) < self.BATCH: break # while True
+            last = rows[-1][0]
+        return entry
+
+
+    def _hash(self, values):
+        """Returns content hash of indexed row values, as 60-bit integer."""
+        return int(hashlib.md5(b"\n".join(values)).hexdigest()[:15], 16)
+
+
+    def _hashes(self, entry):
+        """Returns name of content hash table for index table entry."""
+        return "hashes_%s" % entry["fts"][len("fts_"):]
+
+
+    def _drop(self, conn, entry):
+        """Drops table entry from index."""
+        if entry["fts"]:
+            for name in (entry["fts"], self._hashes(entry)):
+                conn.execute("DROP TABLE IF EXISTS %s" % grammar.quote(name, force=True))
+        conn.execute("DELETE FROM tables WHERE name = ? AND kind = ?",
+                     [entry["name"], entry["kind"]])
+
+
+    def get_match(self, table):
+        """
+        Returns index information for narrowing table search, as
+        {"table": FTS table name, "schema": index schema name,
+         "rowid": ROWID name, "kind": index kind},
+        or None if table is not indexed or index is not up to date.
+        """
+        if table not in self.fresh: return None
+        return {"table": self.fresh[table], "schema": self.SCHEMA,
+                "rowid": self.db.get_rowid(table), "kind": self.kind}
+
+
+    def connect(self):
+        """
+        Returns a connection to database with index attached, or None if not possible:
+        a new read-only connection if database is in WAL mode, else main connection,
+        as separate readers would block writes. Main connection is not to be closed.
+        """
+        if not self.db.is_wal():
+            try:
+                rows = self.db.execute("PRAGMA database_list", log=False).fetchall()
+                if not any(self.SCHEMA == x["name"] for x in rows):
+                    self.db.execute("ATTACH DATABASE ? AS %s" % self.SCHEMA, [self.path], log=False)
+                return self.db.connection
+            except Exception:
+                logger.warning("Error attaching search index %s.", self.path, exc_info=True)
+            return None
+
+        connection = self.db.connect_reader()
+        if not connection: return None
+        try:
+            path = six.moves.urllib.request.pathname2url(os.path.abspath(self.path))
+            connection.execute("ATTACH DATABASE ? AS %s" % self.SCHEMA, ["file:%s?mode=ro" % path])
+            return connection
+        except Exception:
+            logger.warning("Error attaching search index %s.", self.path, exc_info=True)
+            util.try_ignore(connection.close)
+        return None
+
+
+
+class QueryPool(object):
+    """
+    Runs SELECT queries concurrently on a bounded pool of read-only connections,
+    fetching result rows in chunks. Queries are started in the order added.
+
+    Results are consumed either in order of arrival from results(),
+    or per query from rows(), in which case each query buffers a limited
+    number of chunks, waiting until these are consumed.
+    """
+
+    def __init__(self, db, jobs=None, chunk=100, ordered=False, buffer=10, connect=None):
+        """
+        @param   db       Database instance
+        @param   jobs     number of concurrent connections, defaults to conf.MaxReadConnections
+        @param   chunk    number of rows to fetch at a time
+        @param   ordered  whether results are consumed per query from rows(),
+                          instead of in order of arrival from results()
+        @param   buffer   number of chunks to buffer per query if ordered
+        @param   connect  function returning a new read-only connection,
+                          defaults to Database.connect_reader() if database
+                          is in WAL mode, else main connection is used;
+                          one connection only if not in WAL mode,
+                          as readers would block writes
+        """
+        self.db       = db
+        self.jobs     = max(1, conf.MaxReadConnections if jobs is None else jobs)
+        self.chunk    = max(1, chunk)
+        self.ordered  = ordered
+        self.buffer   = max(1, buffer) if ordered else 0
+        self.connect  = connect
+        self.queries  = OrderedDict() # {key: (sql, params)}
+        self.queues   = {}            # {key: queue.Queue} if ordered
+        self.events   = queue.Queue() # (key, [row, ] or None or Exception) or None if not ordered
+        self.skipped  = set()         # Keys of queries no longer consumed
+        self.stopped  = False
+        self.running  = 0             # Number of active worker threads
+        self.connections = []
+
+
+    def add(self, key, sql, params=()):
+        """Adds query to run, under unique key."""
+        self.queries[key] = (sql, params)
+        if self.ordered: self.queues[key] = queue.Queue(self.buffer)
+
+
+    def start(self):
+        """Opens connections and starts running queries in background threads."""
+        workqueue = queue.Queue()
+        for key in self.queries: workqueue.put(key)
+        jobs, connect, wal = min(len(self.queries), self.jobs), self.connect, self.db.is_wal()
+        if not wal: jobs = min(jobs, 1)
+        elif not connect: connect = self.db.connect_reader
+        self.connections = list(filter(bool, (connect() for _ in range(jobs)))) if connect else []
+        if jobs and not self.connections:
+            self.connections = [self.db.connection] # Without interrupt support
+        self.running = len(self.connections)
+        for connection in self.connections:
+            thread = threading.Thread(target=self._run, args=(connection, workqueue))
+            thread.daemon = True
+            thread.start()
+
+
+    def stop(self):
+        """Stops running queries, interrupting ongoing queries."""
+        self.stopped = True
+        for connection in self.connections:
+            if connection is not self.db.connection: util.try_ignore(connection.interrupt)
+
+
+    def skip(self, key):
+        """Stops running query if not yet finished, discarding its results."""
+        self.skipped.add(key)
+
+
+    def results(self, timeout=None):
+        """
+        Yields query results in order of arrival, until all queries are finished,
+        as (key, [row, ]) for fetched rows, (key, None) for finished query,
+        and (key, Exception) for failed query.
+
+        @param   timeout  if set, yields None when no results during this many seconds
+        """
+        while self.running:
+            try: item = self.events.get(timeout=timeout)
+            except queue.Empty:
+                yield None
+                continue # while self.running
+            if item is None: self.running -= 1
+            else: yield item
+
+
+    def rows(self, key):
+        """Yields result rows of query unless skipped, raises query error if any."""
+        if key in self.skipped: return
+        try:
+            while not self.stopped:
+                try: item = self.queues[key].get(timeout=0.1)
+                except queue.Empty: continue # while not self.stopped
+                if item is None: break # while not self.stopped
+                if isinstance(item, Exception): raise item
+                for row in item: yield row
+        finally:
+            self.skip(key)
+
+
+    def _run(self, connection, workqueue):
+        """Runs queries from work queue until empty or stopped."""
+        try:
+            while not self.stopped:
+                try: key = workqueue.get(block=False)
+                except queue.Empty: break # while not self.stopped
+                if key not in self.skipped: self._query(connection, key)
+        finally:
+            if connection is not self.db.connection: util.try_ignore(connection.close)
+            if not self.ordered: self.events.put(None)
+
+
+    def _query(self, connection, key):
+        """Runs query, putting result rows in chunks to results."""
+        cursor = None
+        try:
+            sql, params = self.queries[key]
+            cursor = self.db.execute(sql, params, cursor=connection, lazy=True)
+            while not self.stopped:
+                rows = cursor.fetchmany(self.chunk)
+                if rows and not self._put(key, rows): return
+                if len(rows) < self.chunk: break # while not self.stopped
+            self._put(key, None)
+        except Exception as e:
+            self._put(key, e)
+        finally:
+            cursor and util.try_ignore(cursor.close)
+
+
+    def _put(self, key, item):
+        """Puts item to results, returns false if query results are no longer consumed."""
+        if not self.ordered:
+            self.events.put((key, item))
+            return not self.stopped and key not in self.skipped
+        while not self.stopped and key not in self.skipped:
+            try: self.queues[key].put(item, timeout=0.1)
+            except queue.Full: continue # while not self.stopped
+            return True
+        return False
+
+
+
+def decode_name(name):
+    """Returns resultset column name as string."""
+    try: return name.decode("utf-8")
+    except Exception: return name
+
+
+def decode_value(value):
+    """Returns binary resultset value as string, UTF-8 if possible else latin1."""
+    if type(value) is not six.binary_type:
+        value = value.tobytes() if type(value) is memoryview else str(value)  # Py2 buffer
+        return value.decode("latin1")
+    try: return value.decode("utf-8")
+    except Exception: return value.decode("latin1")
+
+
 def is_sqlite_file(filename, path=None, empty=False, ext=True):
     """
     Returns whether the file looks to be an SQLite database file.
@@ -2320,6 +4409,55 @@ def find_databases(folder):
             yield [p] if is_sqlite_file(p) else []
 
 
+def parse_in_processes(texts, progress=None):
+    """
+    Parses SQL statements in worker processes, populating grammar.parse() cache.
+
+    @param   texts     CREATE statements to parse
+    @param   progress  callback(index, total) to report progress,
+                       returning false if parse should cancel
+    @return            True if parsed, False if cancelled,
+                       None if worker processes were not available
+    """
+    cache = util.memoize.get_cache(grammar.parse)
+    texts = [x for x in texts if (x, ) not in cache]
+    processes = min(conf.MaxParseProcesses, multiprocessing.cpu_count(), len(texts))
+    if processes < 2: return None
+
+    # Spawn fresh processes, forking a multi-threaded GUI program is not safe
+    context = multiprocessing.get_context("spawn") if six.PY3 else multiprocessing
+    disk_cache, pool, result = grammar.sqlite.DISK_CACHE, None, True
+    try:
+        initargs = (disk_cache.path, disk_cache.maxsize) if disk_cache else (None, None)
+        pool = context.Pool(processes, grammar.set_cache_file, initargs)
+        chunksize = max(1, min(50, len(texts) // (processes * 4)))
+        results = pool.imap(grammar.parse, texts, chunksize)
+        for i, (sql, value) in enumerate(zip(texts, results), 1):
+            cache[(sql, )] = value
+            if progress and not progress(index=i, total=len(texts)):
+                result = False
+                break # for i, (sql, value)
+    except Exception:
+        logger.warning("Error parsing SQL in %s worker processes.", processes, exc_info=True)
+        result = None
+    finally:
+        if pool: util.try_ignore(pool.terminate)
+    return result
+
+
+def set_count_cache_file(path, maxsize):
+    """
+    Sets persistent file cache for exact table row counts,
+    shared between program instances.
+
+    @param   path     path to cache file, or None to disable file cache
+    @param   maxsize  maximum total size of cached counts in bytes
+    """
+    global COUNT_CACHE
+    if COUNT_CACHE: COUNT_CACHE.close()
+    COUNT_CACHE = util.DiskCache(path, maxsize) if path else None
+
+
 def fmt_entity(name, force=True, limit=None):
     """
     Formats the schema entity for display, enclosed in quotes,
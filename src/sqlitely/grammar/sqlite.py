@@ -13,6 +13,7 @@ Released under the MIT License.
 """
 import codecs
 from collections import defaultdict
+import functools
 import json
 import logging
 import re
@@ -25,6 +26,7 @@ import six
 import step
 
 from .. lib import util
+from .. import conf
 from . import templates
 from . SQLiteLexer import SQLiteLexer
 from . SQLiteParser import SQLiteParser
@@ -32,11 +34,54 @@ from . SQLiteParser import SQLiteParser
 """Regex for matching unprintable characters (\x00 etc)."""
 SAFEBYTE_RGX = re.compile(r"[\x00-\x1f\x7f-\xa0]")
 
+"""Persistent cache of parse(), transform() and generate() results, as util.DiskCache if set."""
+DISK_CACHE = None
+
 logger = logging.getLogger(__name__)
 
 
 
-@util.memoize(__nohash__=True)
+def set_cache_file(path, maxsize):
+    """
+    Sets persistent file cache for parse(), transform() and generate() results,
+    shared between program instances.
+
+    @param   path     path to cache file, or None to disable file cache
+    @param   maxsize  maximum total size of cached results in bytes
+    """
+    global DISK_CACHE
+    if DISK_CACHE: DISK_CACHE.close()
+    DISK_CACHE = util.DiskCache(path, maxsize) if path else None
+
+
+def disk_cached(func):
+    """
+    Decorator for looking up function (result, error) from DISK_CACHE,
+    keyed by function name, arguments and program version,
+    storing successful results that survive serialization unchanged.
+    """
+    @functools.wraps(func)
+    def inner(*args, **kwargs):
+        cache, key = DISK_CACHE, None
+        if cache:
+            try: key = cache.make_key(func.__name__, conf.Version, conf.VersionDate, args, kwargs)
+            except Exception: pass # Unserializable arguments
+        if key:
+            value = cache.get(key)
+            if value is not None: return tuple(value)
+        result = func(*args, **kwargs)
+        if key and result[0] is not None and result[1] is None:
+            try: storable = json.loads(json.dumps(result[0])) == result[0]
+            except Exception: storable = False
+            if storable: cache.set(key, result)
+        return result
+    return inner
+
+
+
+
+@util.memoize(__nohash__=True, __maxsize__=None, __maxbytes__=100 * 1e6)
+@disk_cached
 def parse(sql, category=None, renames=None):
     """
     Returns data structure for SQL statement.
@@ -61,6 +106,7 @@ def parse(sql, category=None, renames=None):
     return result, err
 
 
+@disk_cached
 def generate(data, indent="  ", category=None):
     """
     Returns SQL statement from data structure.
@@ -112,7 +158,8 @@ def get_type(sql):
     return result
 
 
-@util.memoize(__nohash__=True)
+@util.memoize(__nohash__=True, __maxsize__=None, __maxbytes__=100 * 1e6)
+@disk_cached
 def transform(sql, flags=None, renames=None, indent="  "):
     """
     Returns transformed SQL.
@@ -1425,7 +1472,8 @@ def test():
 
 __all__ = [
     "CTX", "Generator", "ParseError", "Parser", "SQL", "format", "generate", "get_type",
-    "parse", "quote", "strip_and_collapse", "terminate", "transform", "unquote",
+    "parse", "quote", "set_cache_file", "strip_and_collapse", "terminate", "transform",
+    "unquote",
 ]
 
 
@@ -114,10 +114,6 @@ class MainWindow(guibase.TemplateFrameMixIn, wx.Frame):
         self.is_dragging_page = False
         self.wizard_import = None # components.ImportWizard
 
-        # Restore cached parse results; memoize cache is {(sql, ..): (meta, error)}
-        cache = {(k, ): (v, None) for k, v in (conf.ParseCache or {}).items()}
-        util.memoize.set_cache(grammar.parse, cache)
-
         icons = images.get_appicons()
         self.SetIcons(icons)
 
@@ -489,6 +485,8 @@ class MainWindow(guibase.TemplateFrameMixIn, wx.Frame):
             wx.ID_ANY, "&Unsaved changes", "Show unsaved changes")
         menu_view_history = self.menu_view_history = menu_view.Append(
             wx.ID_ANY, "Action &history", "Show database action log for current session")
+        menu_view_profile = self.menu_view_profile = menu_view.Append(
+            wx.ID_ANY, "SQL &profile", "Show SQL statement timings for current session")
 
         menu_edit = self.menu_edit = wx.Menu()
         menu.Append(menu_edit, "&Edit")
@@ -545,6 +543,9 @@ class MainWindow(guibase.TemplateFrameMixIn, wx.Frame):
         menu_tools_fks = self.menu_tools_fks = menu_tools.Append(
             wx.ID_ANY, "Check &foreign keys",
             "Check for foreign key violations")
+        menu_tools_compare = self.menu_tools_compare = menu_tools.Append(
+            wx.ID_ANY, "Co&mpare with database..",
+            "Compare schema and data with another database")
         menu_tools.AppendSeparator()
         menu_tools_import = self.menu_tools_import = menu_tools.Append(
             wx.ID_ANY, "&Import data",
@@ -645,6 +646,7 @@ class MainWindow(guibase.TemplateFrameMixIn, wx.Frame):
         self.Bind(wx.EVT_MENU, functools.partial(self.on_menu_page, ["locks"]),   menu_view_locks)
         self.Bind(wx.EVT_MENU, functools.partial(self.on_menu_page, ["changes"]), menu_view_changes)
         self.Bind(wx.EVT_MENU, functools.partial(self.on_menu_page, ["history"]), menu_view_history)
+        self.Bind(wx.EVT_MENU, functools.partial(self.on_menu_page, ["profile"]), menu_view_profile)
 
         self.Bind(wx.EVT_MENU, functools.partial(self.on_menu_page, ["save"]),        menu_edit_save)
         self.Bind(wx.EVT_MENU, functools.partial(self.on_menu_page, ["cancel"]),      menu_edit_cancel)
@@ -655,6 +657,7 @@ class MainWindow(guibase.TemplateFrameMixIn, wx.Frame):
         self.Bind(wx.EVT_MENU, functools.partial(self.on_menu_page, ["vacuum"]),    menu_tools_vacuum)
         self.Bind(wx.EVT_MENU, functools.partial(self.on_menu_page, ["integrity"]), menu_tools_integrity)
         self.Bind(wx.EVT_MENU, functools.partial(self.on_menu_page, ["fks"]),       menu_tools_fks)
+        self.Bind(wx.EVT_MENU, functools.partial(self.on_menu_page, ["compare"]),   menu_tools_compare)
         self.Bind(wx.EVT_MENU, functools.partial(self.on_menu_page, ["import"]),    menu_tools_import)
 
         self.Bind(wx.EVT_MENU, functools.partial(self.on_menu_page, ["export", "tables"]),     menu_tools_export_tables)
@@ -2193,11 +2196,6 @@ class MainWindow(guibase.TemplateFrameMixIn, wx.Frame):
         self.worker_detection.stop()
         self.worker_folder.stop()
 
-        # Save cached parse results; memoize cache is {(sql, ..): (meta, error)}
-        cache = util.memoize.get_cache(grammar.parse) or {}
-        conf.ParseCache = {k[0]: v[0] for i, (k, v) in enumerate(cache.items())
-                           if i < conf.MaxParseCache and len(k) == 1 and v[-1] is None}
-
         # Save last selected files in db lists, to reselect them on rerun
         conf.LastSelectedFiles[:] = self.dbs_selected[:]
         conf.WindowMaximized = self.IsMaximized()
@@ -2518,9 +2516,11 @@ class DatabasePage(wx.Panel):
         # Create search structures and threads
         self.Bind(EVT_SEARCH, self.on_searchall_result)
         self.workers_search = {} # {search ID: workers.SearchThread, }
+        self.search_indexes = {} # {index kind: database.SearchIndex}
 
         self.worker_analyzer = workers.AnalyzerThread(self.on_analyzer_result)
         self.worker_checksum = workers.ChecksumThread(self.on_checksum_result)
+        self.worker_count    = workers.CountThread(self.on_count_result)
 
         sizer = self.Sizer = wx.BoxSizer(wx.VERTICAL)
 
@@ -2649,6 +2649,12 @@ class DatabasePage(wx.Panel):
             shortHelp="New tab for each search  (Alt-N)", longHelp="")
         tb.AddCheckTool(wx.ID_CONVERT, "", images.ToolbarCase.Bitmap,
             shortHelp="Case-sensitive search", longHelp="")
+        tb.AddCheckTool(wx.ID_PREVIEW, "", images.ToolbarZoom.Bitmap,
+            shortHelp="Search data via full-text index in a file next to the database,\n"
+                      "matching words from word starts only", longHelp="")
+        tb.AddCheckTool(wx.ID_REPLACE, "", images.ToolbarZoomIn.Bitmap,
+            shortHelp="Search data via trigram index in a file next to the database,\n"
+                      "prefiltering substring matches in large tables", longHelp="")
         tb.AddTool(wx.ID_STOP, "", images.ToolbarStopped.Bitmap,
             shortHelp="Stop current search, if any")
         tb.Realize()
@@ -2656,10 +2662,16 @@ class DatabasePage(wx.Panel):
         tb.ToggleTool(wx.ID_STATIC,  conf.SearchInData)
         tb.ToggleTool(wx.ID_NEW,     conf.SearchUseNewTab)
         tb.ToggleTool(wx.ID_CONVERT, conf.SearchCaseSensitive)
+        tb.ToggleTool(wx.ID_PREVIEW, "words"   == conf.SearchIndexKind)
+        tb.ToggleTool(wx.ID_REPLACE, "trigram" == conf.SearchIndexKind)
+        tb.EnableTool(wx.ID_PREVIEW, database.SearchIndex.is_supported(self.db, "words"))
+        tb.EnableTool(wx.ID_REPLACE, database.SearchIndex.is_supported(self.db, "trigram"))
         self.Bind(wx.EVT_TOOL, self.on_searchall_toggle_toolbar, id=wx.ID_INDEX)
         self.Bind(wx.EVT_TOOL, self.on_searchall_toggle_toolbar, id=wx.ID_STATIC)
         self.Bind(wx.EVT_TOOL, self.on_searchall_toggle_toolbar, id=wx.ID_NEW)
         self.Bind(wx.EVT_TOOL, self.on_searchall_toggle_toolbar, id=wx.ID_CONVERT)
+        self.Bind(wx.EVT_TOOL, self.on_searchall_toggle_toolbar, id=wx.ID_PREVIEW)
+        self.Bind(wx.EVT_TOOL, self.on_searchall_toggle_toolbar, id=wx.ID_REPLACE)
         self.Bind(wx.EVT_TOOL, self.on_searchall_stop, id=wx.ID_STOP)
 
         self.label_search.Label = "Search &in data:"
@@ -3294,9 +3306,10 @@ class DatabasePage(wx.Panel):
                                   wx.FONTWEIGHT_BOLD, faceName=self.Font.FaceName)
 
         names = ["edit_info_path", "edit_info_size", "edit_info_created",
-                 "edit_info_modified", "edit_info_sha1", "edit_info_md5", ]
+                 "edit_info_modified", "edit_info_sha1", "edit_info_md5",
+                 "edit_info_content", ]
         labels = ["Full path", "File size", "Created", "Last modified",
-                  "SHA-1 checksum", "MD5 checksum",  ]
+                  "SHA-1 checksum", "MD5 checksum", "Content checksum", ]
         for i, (name, label) in enumerate(zip(names, labels)):
             labeltext = wx.StaticText(panel1c, label="%s:" % label,
                                       name=name+"_label")
@@ -3311,10 +3324,12 @@ class DatabasePage(wx.Panel):
             setattr(self, name, valuetext)
         button_checksum_stop = self.button_checksum_stop = wx.Button(panel1c, label="Stop")
         button_checksum_stop.ToolTip = "Stop checksum calculation"
-        sizer_info.Add(button_checksum_stop, pos=(len(names) - 2, 2), span=(2, 1),
+        sizer_info.Add(button_checksum_stop, pos=(len(names) - 3, 2), span=(3, 1),
                        border=10, flag=wx.RIGHT | wx.ALIGN_CENTER_VERTICAL)
         self.edit_info_path.Value = "<temporary file>" if self.db.temporary \
                                     else self.db.filename
+        self.edit_info_content.ToolTip = "SHA-1 over table rows in primary key order, " \
+                                         "independent of file layout"
 
         self.Bind(wx.EVT_BUTTON, self.on_checksum_stop, button_checksum_stop)
 
@@ -3994,6 +4009,8 @@ class DatabasePage(wx.Panel):
                           format_changes(temp=True), conf.Title)
         elif "history" == cmd:
             components.HistoryDialog(self, self.db).ShowModal()
+        elif "profile" == cmd:
+            components.ProfileDialog(self, self.db).ShowModal()
         elif "folder" == cmd:
             util.select_file(self.db.filename)
         elif "save" == cmd:
@@ -4022,6 +4039,18 @@ class DatabasePage(wx.Panel):
             self.on_check_integrity()
         elif "fks" == cmd:
             self.on_check_fks()
+        elif "compare" == cmd:
+            exts = ";".join("*" + x for x in conf.DBExtensions)
+            wildcard = "SQLite database (%s)|%s|All files|*.*" % (exts, exts)
+            dialog = wx.FileDialog(self, message="Compare with", wildcard=wildcard,
+                style=wx.FD_FILE_MUST_EXIST | wx.FD_OPEN | wx.FD_CHANGE_DIR | wx.RESIZE_BORDER
+            )
+            if wx.ID_OK != dialog.ShowModal(): return
+            filename = controls.get_dialog_path(dialog)
+            if self.db.filename and os.path.realpath(filename) == os.path.realpath(self.db.filename):
+                return wx.MessageBox("Cannot compare database with itself.",
+                                     conf.Title, wx.OK | wx.ICON_WARNING)
+            components.DiffDialog(self, self.db, filename).ShowModal()
         elif "import" == cmd:
             components.ImportDialog(self, self.db).ShowModal()
         elif "copy" == cmd:
@@ -4343,19 +4372,52 @@ class DatabasePage(wx.Panel):
             # Gtk tends to crash if not clearing these before setting longer value
             self.edit_info_sha1.Value = ""
             self.edit_info_md5.Value  = ""
+            self.edit_info_content.Value = ""
             if "error" in result:
                 self.edit_info_sha1.Value = result["error"]
                 self.edit_info_md5.Value  = result["error"]
             else:
                 self.edit_info_sha1.Value = result["sha1"]
                 self.edit_info_md5.Value  = result["md5"]
+                self.edit_info_content.Value = result.get("content", "")
+            if result.get("tables"):
+                self.edit_info_content.ToolTip = "\n".join("%s: %s" % (fmt_entity(k), v)
+                                                           for k, v in result["tables"].items())
             self.edit_info_sha1.MinSize = (-1, -1)
             self.edit_info_md5.MinSize  = (-1, -1)
+            self.edit_info_content.MinSize = (-1, -1)
             self.button_checksum_stop.Hide()
             self.edit_info_md5.ContainingSizer.Layout()
         wx.CallAfter(after)
 
 
+    def on_count_result(self, result):
+        """
+        Handler for getting exact table row count from count thread,
+        updates schema and data tree.
+        """
+        def after():
+            if not self or "table" not in result: return
+            item = self.db.schema.get("table", {}).get(result["table"])
+            if not item: return
+            item.pop("is_count_estimated", None)
+            item["count"] = result["count"]
+
+            tree = self.tree_data
+            top = tree.GetNext(tree.RootItem)
+            while top and top.IsOk():
+                if "table" == (tree.GetItemPyData(top) or {}).get("category"):
+                    child = tree.GetNext(top)
+                    while child and child.IsOk():
+                        if util.lceq((tree.GetItemPyData(child) or {}).get("name"), item["name"]):
+                            tree.SetItemText(child, util.count(item, "row"), 1)
+                            break # while child
+                        child = tree.GetNextSibling(child)
+                    break # while top
+                top = tree.GetNextSibling(top)
+        wx.CallAfter(after)
+
+
     def populate_statistics(self):
         """Populates statistics HTML window."""
         if not self: return
@@ -5045,6 +5107,7 @@ class DatabasePage(wx.Panel):
         for worker in self.workers_search.values(): worker.stop()
         self.worker_analyzer.stop()
         self.worker_checksum.stop()
+        self.worker_count.stop()
         self.panel_data_export.Stop()
 
         for p in (p for x in self.data_pages.values() for p in x.values()):
@@ -5128,15 +5191,18 @@ class DatabasePage(wx.Panel):
         and (conf.RunChecksums or reload):
             self.edit_info_sha1.Value = "Analyzing.."
             self.edit_info_md5.Value  = "Analyzing.."
+            self.edit_info_content.Value = "Analyzing.." if conf.RunContentChecksums else ""
             self.button_checksum_stop.Show()
-            self.worker_checksum.work(self.db.filename)
+            db = self.db if conf.RunContentChecksums else None
+            self.worker_checksum.work({"path": self.db.filename, "db": db})
         elif not self.worker_checksum.is_working():
             self.edit_info_sha1.Value = ""
             self.edit_info_md5.Value  = ""
+            self.edit_info_content.Value = ""
             self.button_checksum_stop.Hide()
 
         for name in ["edit_info_size", "edit_info_created", "edit_info_modified",
-                     "edit_info_path", "edit_info_sha1", "edit_info_md5"]:
+                     "edit_info_path", "edit_info_sha1", "edit_info_md5", "edit_info_content"]:
             getattr(self, name).MinSize = (-1, -1)
         self.edit_info_path.ContainingSizer.Layout()
 
@@ -5149,7 +5215,8 @@ class DatabasePage(wx.Panel):
     def on_checksum_stop(self, event=None):
         """Stops current checksum analysis."""
         self.worker_checksum.stop_work()
-        self.on_checksum_result({"sha1": "Cancelled", "md5": "Cancelled"})
+        self.on_checksum_result({"sha1": "Cancelled", "md5": "Cancelled",
+                                 "content": "Cancelled" if conf.RunContentChecksums else ""})
 
 
     def on_refresh_tree_data(self, event):
@@ -5355,6 +5422,12 @@ class DatabasePage(wx.Panel):
             conf.SearchUseNewTab = event.EventObject.GetToolState(event.Id)
         elif wx.ID_CONVERT == event.Id:
             conf.SearchCaseSensitive = event.EventObject.GetToolState(event.Id)
+        elif event.Id in (wx.ID_PREVIEW, wx.ID_REPLACE):
+            kind, otherid = ("words", wx.ID_REPLACE) if wx.ID_PREVIEW == event.Id \
+                            else ("trigram", wx.ID_PREVIEW)
+            on = event.EventObject.GetToolState(event.Id)
+            conf.SearchIndexKind = kind if on else None
+            if on: event.EventObject.ToggleTool(otherid, False)
         elif not event.EventObject.GetToolState(event.Id):
             # All others are radio tools and state might be toggled off by
             # shortkey key adapter
@@ -5466,6 +5539,11 @@ class DatabasePage(wx.Panel):
             elif "data" == source or conf.SearchInData:
                 data["source"] = "data"
                 fromtext = "database data"
+                kind = conf.SearchIndexKind
+                if kind and database.SearchIndex.is_supported(self.db, kind):
+                    if kind not in self.search_indexes:
+                        self.search_indexes[kind] = database.SearchIndex(self.db, kind)
+                    data["index"] = self.search_indexes[kind]
             # Partially assembled HTML for current results
             template = step.Template(templates.SEARCH_HEADER_HTML, escape=True)
             data["partial_html"] = template.expand(locals())
@@ -5863,7 +5941,7 @@ class DatabasePage(wx.Panel):
 
         try:
             if rename:
-                shutil.copy(filename1, tempname)
+                self.db.backup(tempname)
                 self.db.reopen(tempname)
         except Exception as e:
             logger.exception("Error saving %s as %s.", self.db, filename2)
@@ -5901,7 +5979,10 @@ class DatabasePage(wx.Panel):
 
         if success and rename:
             try:
-                shutil.copy(tempname, filename2)
+                if os.path.exists(filename2) \
+                and not database.is_sqlite_file(filename2, empty=True, ext=False):
+                    os.unlink(filename2) # Overwrite confirmed in file dialog
+                self.db.backup(filename2)
                 self.db.reopen(filename2)
             except Exception as e:
                 error = "Error saving %s as %s:\n\n" % util.format_exc(e)
@@ -6260,7 +6341,7 @@ class DatabasePage(wx.Panel):
             self.notebook_data.SetSelection(self.notebook_data.GetPageIndex(page))
             if row: page.ScrollToRow(row, full=True)
         if remove:
-            self.db.populate_schema(count=True)
+            self.db.refresh_schema(count=True)
             self.load_tree_data()
             if table in self.data_pages["table"]:
                 self.data_pages["table"][table].DropRows(rows)
@@ -6847,7 +6928,7 @@ class DatabasePage(wx.Panel):
 
         self.flags["reload_schema_underway"] = True
         try:
-            self.db.populate_schema(count=count, parse=True)
+            self.db.refresh_schema(count=count, parse=True)
             self.on_pragma_refresh(reload=True)
             for pmap in self.data_pages, self.schema_pages:
                 for p in (p for d in pmap.values() for p in d.values()): p.Reload()
@@ -6942,7 +7023,7 @@ class DatabasePage(wx.Panel):
         tree.Freeze()
         try:
             try:
-                if refresh: self.db.populate_schema(count=True)
+                if refresh: self.db.refresh_schema(count=True)
             except Exception:
                 msg = "Error loading data from %s." % self.db
                 logger.exception(msg)
@@ -6997,6 +7078,12 @@ class DatabasePage(wx.Panel):
             tree.SetColumnWidth(1, 100)
             tree.SetColumnWidth(0, tree.Size[0] - 130)
             self.set_tree_state(tree, tree.RootItem, expandeds)
+
+            # Refine estimated row counts to exact counts in the background
+            tables = sorted((x for x in self.db.schema.get("table", {}).values()
+                             if x.get("is_count_estimated")), key=lambda x: x["count"])
+            self.worker_count.stop_work()
+            if tables: self.worker_count.work({"db": self.db, "tables": [x["name"] for x in tables]})
         finally:
             if self:
                 self.button_refresh_data.Enable()
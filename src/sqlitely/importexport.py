@@ -307,7 +307,7 @@ def export_data_combined(db, filename, format, title, category=None, names=None,
             category = next((c for c in db.schema if name in db.schema[c]), "")
             msg = "Error querying %s %s." % (category, grammar.quote(name, force=True))
             tick = lambda n: counts.update({name: n})
-            return db.select(sql, error=msg, tick=tick)
+            return db.select(sql, error=msg, tick=tick, lazy=True)
 
         def make_item_iterables():
             """Yields pairs of ({item}, callable returning iterable cursor)."""
@@ -512,7 +512,7 @@ def export_dump(db, filename, schema=None, data=True, pragma=True,
 
         msg = "Error querying table %s." % grammar.quote(name, force=True)
         tick = lambda n: counts.update({name: n})
-        cursors.append(db.select(sql, error=msg, tick=tick))
+        cursors.append(db.select(sql, error=msg, tick=tick, lazy=True))
         return cursors[-1]
 
     def make_datas():
@@ -722,6 +722,37 @@ def export_to_db(db, filename, schema, renames=None, data=False, selects=None,
     return result    
 
 
+def export_backup(db, filename, vacuum=False, progress=None):
+    """
+    Copies the complete database to a new file, using SQLite online backup,
+    or VACUUM INTO for a compacted copy.
+
+    @param   db        Database instance
+    @param   filename  database filename to export to, must not exist or be empty
+    @param   vacuum    whether to produce a compacted copy with VACUUM INTO
+    @param   progress  callback(?index, ?total, ?error, ?done) to report export progress,
+                       returning false if export should cancel
+    @return            True on success, False on failure, None on cancel
+    """
+    result, finalargs = True, {"done": True}
+    file_existed = os.path.isfile(filename)
+    db.lock(None, None, filename, label="database export")
+    try:
+        logger.info("Copying %s to %s.", db, filename)
+        result = db.backup(filename, progress=progress, vacuum=vacuum)
+    except Exception as e:
+        logger.exception("Error copying %s to %s.", db, filename)
+        finalargs["error"] = util.format_exc(e)
+        result = False
+    finally:
+        if not result and not file_existed:
+            util.try_ignore(os.unlink, filename)
+        db.unlock(None, None, filename)
+
+    if progress: progress(**finalargs)
+    return result
+
+
 def export_query_to_db(db, filename, table, query, params=(), cursor=None, create_sql=None,
                        empty=True, limit=None, progress=None):
     """
@@ -779,9 +810,9 @@ def export_query_to_db(db, filename, table, query, params=(), cursor=None, creat
             count = db.execute(sql, params).rowcount
             logs.append((sql, None))
         else:
-            if not cursor: cursor = db.execute(query, params)
+            if not cursor: cursor = db.execute(query, params, lazy=True)
             cols = [c[0] for c in cursor.description] if cursor.description else ["rowcount"]
-            sql = create_sql
+            sql = create_sql and grammar.transform(create_sql, renames={"schema": schema2})[0]
             sql = sql or "CREATE TABLE %s (%s)" % (fullname, ", ".join(map(grammar.quote, cols)))
             db.executescript(sql)
             logs.append((sql, None))
@@ -795,10 +826,9 @@ def export_query_to_db(db, filename, table, query, params=(), cursor=None, creat
                 if qrange and i < qrange[0]: continue # for
                 if qrange and qrange[1] >= 0 and i >= qrange[1]: break # for
 
-                params = list(row.values())
-                db.execute(insert_sql, params)
-                logs.append((sql, params))
+                db.execute(insert_sql, list(row.values()))
                 count += 1
+            logs.append((insert_sql, util.plural("row", count)))
         db.connection.commit()
         if count in (None, -1) and (progress or not empty): # If CREATE TABLE AS query
             count = db.execute("SELECT COUNT(*) AS count FROM %s" % fullname).fetchone()["count"]
@@ -23,13 +23,17 @@ except Exception: fcntl = None
 import functools
 import inspect
 import io
+import hashlib
 import itertools
+import json
 import locale
+import marshal
 import math
 import multiprocessing.connection
 import os
 import platform
 import re
+import sqlite3
 import stat
 import string
 import struct
@@ -54,46 +58,57 @@ class CaselessDict(dict):
     A case-insensitive dict for string keys, keys are returned in original case
     in case-insensitive order, unless insertorder given in constructor.
     Keys can be strings, or tuples of strings, or None.
+
+    Key order is cached until keys are added or removed;
+    keys(), values() and items() return views.
     """
 
     def __init__(self, iterable=None, insertorder=False, **kwargs):
         self._data  = {} # {lowercase key: value}
-        self._keys  = {} # {lowercase key: original key}
-        self._order = [] if insertorder else None # [lowercase key]
+        self._keys  = collections.OrderedDict() if insertorder else {} # {lowercase key: original key}
+        self._order = None # [(lowercase key, original key)] in iteration order, None if stale
+        self._insertorder = bool(insertorder)
         self.update(iterable, **kwargs)
 
     def clear(self):
         self._data.clear(), self._keys.clear()
-        if self._order: del self._order[:]
+        self._order = None
 
     def copy(self):
-        return type(self)(((k, self[k]) for k in self), self._order is not None)
+        return type(self)(((k, self[k]) for k in self), self._insertorder)
 
     @staticmethod
     def fromkeys(S, v=None): return CaselessDict((k, v) for k in S)
 
-    def get(self, key, value=None): return self[key] if key in self else value
+    def get(self, key, value=None):
+        lc = key.lower() if isinstance(key, six.string_types) else self._(key)
+        return self._data.get(lc, value)
 
     def has_key(self, key): return key in self
 
-    def items(self): return [(k, self[k]) for k in self]
+    def items(self): return CaselessItemsView(self) if six.PY3 else list(self.iteritems())
 
-    def iteritems(self): return ((k, self[k]) for k in self)
+    def iteritems(self):
+        data = self._data
+        return iter([(k, data[lc]) for lc, k in self._get_order()])
 
-    def iterkeys(self): return (k for k in self)
+    def iterkeys(self): return iter(self)
 
-    def itervalues(self): return (self[k] for k in self)
+    def itervalues(self):
+        data = self._data
+        return iter([data[lc] for lc, _ in self._get_order()])
 
-    def keys(self): return list(self.__iter__())
+    def keys(self): return CaselessKeysView(self) if six.PY3 else list(self)
 
     def pop(self, key, *args):
         if len(args) > 1:
             raise TypeError("pop expected at most 2 arguments, got %s" %
                             (len(args) + 1))
-        if key in self:
-            v, lc = self[key], self._(key)
-            del self[key]
-            if self._order and lc in self._order: self._order.remove(lc)
+        lc = key.lower() if isinstance(key, six.string_types) else self._(key)
+        if lc in self._data:
+            v = self._data.pop(lc)
+            del self._keys[lc]
+            self._order = None
             return v
         elif args: return args[0]
         else: raise KeyError(key)
@@ -101,10 +116,7 @@ class CaselessDict(dict):
     def popitem(self):
         if not self: raise KeyError("popitem(): dictionary is empty")
         k = next(iter(self))
-        v, lc = self[k], self._(k)
-        del self[k]
-        if self._order and lc in self._order: self._order.remove(lc)
-        return k, v
+        return k, self.pop(k)
 
     def setdefault(self, key, value=None):
         if key not in self: self[key] = value
@@ -116,39 +128,43 @@ class CaselessDict(dict):
         for k, v in iterable or (): self[k] = v
         for k, v in kwargs.items(): self[k] = v
 
-    def values(self): return [self[k] for k in self]
+    def values(self): return CaselessValuesView(self) if six.PY3 else list(self.itervalues())
 
     def __bool__(self): return bool(self._data)
 
-    def __contains__(self, key): return self._(key) in self._data
+    def __contains__(self, key):
+        lc = key.lower() if isinstance(key, six.string_types) else self._(key)
+        return lc in self._data
 
     def __eq__(self, other):
-        return isinstance(other, type(self)) and \
-               self._data == other._data and self._order == other._order
+        return isinstance(other, type(self)) and self._data == other._data and \
+               self._insertorder == other._insertorder and \
+               (not self._insertorder or list(self._keys) == list(other._keys))
 
     def __ne__(self, other):
         return not (self == other)
 
     def __delitem__(self, key):
-        lc = self._(key)
+        lc = key.lower() if isinstance(key, six.string_types) else self._(key)
         del self._data[lc]
         del self._keys[lc]
-        if self._order and lc in self._order: self._order.remove(lc)
+        self._order = None
 
-    def __getitem__(self, key): return self._data[self._(key)]
+    def __getitem__(self, key):
+        lc = key.lower() if isinstance(key, six.string_types) else self._(key)
+        return self._data[lc]
 
     def __len__(self): return len(self._data)
 
-    def __iter__(self):
-        if self._order is not None:
-            return iter(self._keys[k] for k in self._order)
-        sortkey = lambda x: coalesce(x[0] if isinstance(x[0], tuple) else (x[1], ), "")
-        return iter(x for _, x in sorted(self._keys.items(), key=sortkey))
+    def __iter__(self): return iter([k for _, k in self._get_order()])
+
+    def __reversed__(self): return iter([k for _, k in self._get_order()[::-1]])
 
     def __setitem__(self, key, value):
-        lc, self._keys[lc], self._data[lc] = self._(key), key, value
-        if self._order is not None and lc not in self._order:
-            self._order.append(lc)
+        lc = key.lower() if isinstance(key, six.string_types) else self._(key)
+        if lc not in self._keys or self._keys[lc] != key:
+            self._keys[lc], self._order = key, None
+        self._data[lc] = value
 
     def _(self, key):
         """Returns lowercased key value."""
@@ -156,11 +172,41 @@ class CaselessDict(dict):
         if isinstance(key, six.string_types): return key.lower()
         return tuple(x.lower() if isinstance(x, six.string_types) else x for x in key)
 
+    def _get_order(self):
+        """Returns cached [(lowercase key, original key)] in iteration order."""
+        order = self._order
+        if order is None:
+            if self._insertorder: order = list(self._keys.items())
+            else:
+                sortkey = lambda x: coalesce(x[0] if isinstance(x[0], tuple) else (x[1], ), "")
+                order = sorted(self._keys.items(), key=sortkey)
+            self._order = order
+        return order
+
     def __str__(self): return repr(self)
 
     def __repr__(self): return "%s(%s)" % (type(self).__name__, list(self.items()))
 
 
+class CaselessKeysView(collections_abc.KeysView):
+    """Keys view for CaselessDict, iterating over keys as of iteration start."""
+    def __reversed__(self): return reversed(self._mapping)
+
+
+class CaselessItemsView(collections_abc.ItemsView):
+    """Items view for CaselessDict, iterating over items as of iteration start."""
+    def __iter__(self): return self._mapping.iteritems()
+
+    def __reversed__(self): return iter(list(self._mapping.iteritems())[::-1])
+
+
+class CaselessValuesView(collections_abc.ValuesView):
+    """Values view for CaselessDict, iterating over values as of iteration start."""
+    def __iter__(self): return self._mapping.itervalues()
+
+    def __reversed__(self): return iter(list(self._mapping.itervalues())[::-1])
+
+
 
 class ProgressBar(threading.Thread):
     """
@@ -277,6 +323,61 @@ class ProgressBar(threading.Thread):
 
 
 
+class PhaseTimer(object):
+    """
+    Records wall time, CPU time and peak memory use for consecutive named phases
+    of a task, together with number of rows and bytes processed in each phase.
+    """
+
+    def __init__(self, name=None):
+        """
+        @param   name  task name, if any
+        """
+        self.name     = name
+        self.started  = datetime.datetime.now()
+        self.phases   = [] # [{name, wall, cpu, peak_rss, rows, bytes}]
+        self._start   = (time.time(), get_cpu_time())
+        self._current = None # (start wall, start CPU)
+
+
+    def phase(self, name):
+        """Ends current phase, if any, and starts a new one."""
+        self.stop()
+        self.phases.append({"name": name, "wall": 0, "cpu": 0, "peak_rss": None,
+                            "rows": 0, "bytes": 0})
+        self._current = (time.time(), get_cpu_time())
+
+
+    def add(self, rows=0, bytes=0):
+        """Adds number of processed rows and bytes to current or last phase."""
+        if not self.phases: self.phase("")
+        self.phases[-1]["rows"]  += rows
+        self.phases[-1]["bytes"] += bytes
+
+
+    def stop(self):
+        """Ends current phase, if any."""
+        if not self._current: return
+        self.phases[-1].update(wall=time.time() - self._current[0],
+                               cpu=get_cpu_time() - self._current[1],
+                               peak_rss=get_peak_memory())
+        self._current = None
+
+
+    def get_data(self):
+        """
+        Returns {name, started, wall, cpu, peak_rss, rows, bytes, phases: [{..}]},
+        with times in seconds and memory in bytes, ending current phase if any.
+        """
+        self.stop()
+        return {"name": self.name, "started": self.started.isoformat(),
+                "wall": time.time() - self._start[0], "cpu": get_cpu_time() - self._start[1],
+                "peak_rss": get_peak_memory(), "rows": sum(x["rows"] for x in self.phases),
+                "bytes": sum(x["bytes"] for x in self.phases),
+                "phases": [dict(x) for x in self.phases]}
+
+
+
 class SingleInstanceChecker(object):
     """
     Allows checking that only a single instance of a program is running, per user login.
@@ -450,10 +551,254 @@ class SingleInstanceChecker(object):
         self._lockfd = None
 
 
+
+class DiskCache(object):
+    """
+    Persistent key-value cache in an SQLite file, for JSON-serializable values.
+
+    Safe for concurrent use from several threads and processes. Evicts least
+    recently used entries when total size of values exceeds maximum size.
+    Fails silently: a cache that cannot be opened or written acts as empty.
+    """
+
+    """Interval in seconds for updating last access time of a read entry."""
+    TOUCH_INTERVAL = 3600
+
+    """Number of writes between checking cache size."""
+    PRUNE_INTERVAL = 100
+
+
+    def __init__(self, path, maxsize):
+        """
+        @param   path     path to cache file, directories created if missing
+        @param   maxsize  maximum total size of cached values in bytes
+        """
+        self.path    = path
+        self.maxsize = maxsize
+        self._conn   = None
+        self._failed = False
+        self._writes = 0
+        self._lock   = threading.RLock()
+
+
+    @staticmethod
+    def make_key(*args):
+        """Returns cache key for JSON-serializable arguments, raises on unserializable."""
+        text = json.dumps(args, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+    def get(self, key, default=None):
+        """Returns cached value for key, or default if not cached."""
+        with self._lock:
+            if not self._connect(): return default
+            try:
+                row = self._conn.execute("SELECT value, atime FROM cache WHERE key = ?",
+                                         [key]).fetchone()
+                if not row: return default
+                now = time.time()
+                if row[1] < now - self.TOUCH_INTERVAL:
+                    self._conn.execute("UPDATE cache SET atime = ? WHERE key = ?", [now, key])
+                return json.loads(row[0])
+            except Exception:
+                return default
+
+
+    def set(self, key, value):
+        """Stores value under key, returns whether value was stored."""
+        try: text = json.dumps(value, separators=(",", ":"))
+        except Exception: return False
+        with self._lock:
+            if not self._connect(): return False
+            try:
+                self._conn.execute("INSERT OR REPLACE INTO cache (key, value, size, atime) "
+                                   "VALUES (?, ?, ?, ?)", [key, text, len(text), time.time()])
+                self._writes += 1
+                if not self._writes % self.PRUNE_INTERVAL: self.prune()
+            except Exception:
+                return False
+        return True
+
+
+    def prune(self):
+        """Drops least recently used entries until cache is under 90% of maximum size."""
+        with self._lock:
+            if not self._connect(): return
+            try:
+                total = self._conn.execute("SELECT SUM(size) FROM cache").fetchone()[0] or 0
+                if total <= self.maxsize: return
+                excess, atime = total - self.maxsize * 0.9, None
+                for size, atime in self._conn.execute("SELECT size, atime FROM cache "
+                                                      "ORDER BY atime"):
+                    excess -= size
+                    if excess <= 0: break # for size, atime
+                self._conn.execute("DELETE FROM cache WHERE atime <= ?", [atime])
+            except Exception: pass
+
+
+    def clear(self):
+        """Drops all cached entries."""
+        with self._lock:
+            if self._connect(): try_ignore(self._conn.execute, "DELETE FROM cache")
+
+
+    def close(self):
+        """Closes cache file, if open."""
+        with self._lock:
+            if self._conn: try_ignore(self._conn.close)
+            self._conn = None
+
+
+    def _connect(self):
+        """Opens cache file if not already open, returns whether cache is available."""
+        if self._conn or self._failed: return bool(self._conn)
+        try:
+            try: os.makedirs(os.path.dirname(self.path))
+            except Exception: pass
+            self._conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False,
+                                         isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode = WAL")
+            self._conn.execute("PRAGMA synchronous = NORMAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, "
+                               "value TEXT, size INTEGER, atime REAL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS cache_atime ON cache (atime)")
+        except Exception:
+            if self._conn: try_ignore(self._conn.close)
+            self._conn, self._failed = None, True
+        return bool(self._conn)
+
+
+
+class MemoCache(object):
+    """
+    Bounded least-recently-used cache for memoize(), limited by number of
+    entries and approximate total size in bytes, with hit/miss/eviction counters.
+
+    Container results are kept frozen as marshalled bytes if they consist of
+    plain built-in types only, and thawed into fresh copies on each hit;
+    other container results are deep-copied on each hit.
+    """
+
+    """Default maximum number of entries."""
+    MAXSIZE = 10000
+
+    """Types returned as is, without copying."""
+    NOCOPY = six.string_types + six.integer_types + (float, bool, type(None),
+             datetime.date, datetime.datetime, datetime.time)
+
+
+    def __init__(self, maxsize=MAXSIZE, maxbytes=None):
+        """
+        @param   maxsize   maximum number of entries, None for unlimited
+        @param   maxbytes  maximum approximate total size of entries in bytes, None for unlimited
+        """
+        self.maxsize   = maxsize
+        self.maxbytes  = maxbytes
+        self.hits      = 0
+        self.misses    = 0
+        self.evictions = 0
+        self.bytes     = 0
+        self._items = collections.OrderedDict() # {key: (stored value, is frozen, size)}
+        self._lock  = threading.RLock()
+
+
+    def get(self, key, default=None):
+        """Returns cached value for key, or default if not cached; counts hit or miss."""
+        with self._lock:
+            item = self._items.pop(key, None)
+            if item is None:
+                self.misses += 1
+                return default
+            self._items[key] = item # Move to end as most recently used
+            self.hits += 1
+        return self._thaw(*item[:2])
+
+
+    def set(self, key, value):
+        """
+        Stores value under key, evicting least recently used entries if over budget.
+        Returns value, or a copy if value is a container not stored frozen.
+        """
+        item = self._freeze(value)
+        with self._lock:
+            previous = self._items.pop(key, None)
+            if previous: self.bytes -= previous[2]
+            self._items[key] = item
+            self.bytes += item[2]
+            while len(self._items) > 1 and (
+                self.maxsize  is not None and len(self._items) > self.maxsize or
+                self.maxbytes is not None and self.bytes > self.maxbytes
+            ):
+                self.bytes -= self._items.popitem(last=False)[1][2]
+                self.evictions += 1
+        return value if item[1] else self._thaw(value, False)
+
+
+    def update(self, items):
+        """Stores all values from {key: value}."""
+        for k, v in (items.items() if isinstance(items, dict) else items): self.set(k, v)
+
+
+    def clear(self):
+        """Drops all cached entries."""
+        with self._lock:
+            self._items.clear()
+            self.bytes = 0
+
+
+    def stats(self):
+        """Returns {size, bytes, hits, misses, evictions, maxsize, maxbytes}."""
+        with self._lock:
+            return dict(size=len(self._items), bytes=self.bytes, hits=self.hits,
+                        misses=self.misses, evictions=self.evictions,
+                        maxsize=self.maxsize, maxbytes=self.maxbytes)
+
+
+    def __contains__(self, key):
+        return key in self._items
+
+
+    def __getitem__(self, key):
+        with self._lock:
+            if key not in self._items: raise KeyError(key)
+            item = self._items[key]
+        return self._thaw(*item[:2])
+
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+
+    def __len__(self):
+        return len(self._items)
+
+
+    def _freeze(self, value):
+        """Returns (value or marshalled value, whether marshalled, approximate size)."""
+        if isinstance(value, self.NOCOPY) \
+        or type(value) is tuple and all(type(x) in self.NOCOPY for x in value):
+            return value, False, sys.getsizeof(value)
+        if isinstance(value, (dict, list, set, tuple)):
+            try: blob = marshal.dumps(value) # Fails on any non-builtin type
+            except Exception: pass
+            else: return blob, True, len(blob)
+        return value, False, sys.getsizeof(value)
+
+
+    def _thaw(self, value, frozen):
+        """Returns stored value, unmarshalled or deep-copied if container."""
+        if frozen: return marshal.loads(value)
+        if isinstance(value, self.NOCOPY) \
+        or type(value) is tuple and all(type(x) in self.NOCOPY for x in value):
+            return value
+        return copy.deepcopy(value) if isinstance(value, (dict, list, set, tuple)) else value
+
+
+
 def memoize(*args, **kwargs):
     """
     Returns function result, cached if available, caches result otherwise.
-    Returns deep copies if result is dict, list, set, or tuple.
+    Returns fresh copies if result is dict, list, set, or tuple.
 
     Acts as decorator if invoked with a single function argument or with 
     recognized keyword arguments; returning an outer decorator for the latter:
@@ -461,92 +806,97 @@ def memoize(*args, **kwargs):
     @memoize
     def somefunction(a, b): ..
 
-    @memoize(__nohash__=True)
+    @memoize(__nohash__=True, __maxbytes__=1e6)
     def otherfunction(a, b, unhashable): ..
 
+    Results are cached in a bounded MemoCache per function or root key,
+    evicting least recently used results.
+
     Cached values are also available via memoize.get_cache(),
     and they can be pre-set via memoize.set_cache().
+    Cache statistics are available via memoize.get_stats().
 
-    @param   args        (function, ?arg1, ..) or () if argumented decorator
-    @param   __key__     cache root key to use if not function, must be hashable
-    @param   __nohash__  whether arguments can be unhashable,
-                         checks unhashable arguments by equality instead
+    @param   args          (function, ?arg1, ..) or () if argumented decorator
+    @param   __key__       cache root key to use if not function, must be hashable
+    @param   __nohash__    whether arguments can be unhashable,
+                           unhashable arguments are converted to a hashable canonical key
+    @param   __maxsize__   maximum number of cached results for function or root key,
+                           None for unlimited, defaults to MemoCache.MAXSIZE
+    @param   __maxbytes__  maximum approximate size of cached results in bytes,
+                           None for unlimited (default)
     """
     func, root, nohash, ns = None, None, False, {}
-    cache       = getattr(memoize, "cache",       None)
-    nohashcache = getattr(memoize, "nohashcache", None)
-    wrappeds    = getattr(memoize, "wrappeds",    None)
+    budget = {"maxsize": MemoCache.MAXSIZE, "maxbytes": None}
+    cache    = getattr(memoize, "cache",    None)
+    wrappeds = getattr(memoize, "wrappeds", None)
 
-    if cache is None:       # {root: {(args): value}}
-        cache = collections.defaultdict(dict)
+    if cache is None:    # {root: MemoCache}
+        cache = {}
         setattr(memoize, "cache", cache)
-    if nohashcache is None: # {root: {(args): [((unhashable args), value)]}}
-        nohashcache = collections.defaultdict(lambda: collections.defaultdict(list))
-        setattr(memoize, "nohashcache", nohashcache)
     if wrappeds is None: # {wrapper: original function}
         wrappeds = {}
         setattr(memoize, "wrappeds", wrappeds)
 
     if not hasattr(memoize, "get_cache"):
-        def get_cache(root):
-            """Returns cache for specified function or other root key."""
-            return cache[wrappeds.get(root)]
+        def get_cache(root, **budget):
+            """Returns cache for specified function or other root key, creating if missing."""
+            root = wrappeds.get(root, root)
+            if root not in cache: cache[root] = MemoCache(**budget)
+            return cache[root]
         setattr(memoize, "get_cache", get_cache)
     if not hasattr(memoize, "set_cache"):
         def set_cache(root, items):
             """Sets cached items for specified function or other root key."""
-            cache[wrappeds.get(root)].update(items)
+            memoize.get_cache(root).update(items)
         setattr(memoize, "set_cache", set_cache)
-
-
-    NOCOPY = six.string_types + six.integer_types + (float, bool, type(None),
-             datetime.date, datetime.datetime, datetime.time)
-    def returner(v):
-        if type(v) is tuple and all(type(x) in NOCOPY for x in v): return v
-        return copy.deepcopy(v) if isinstance(v, (dict, list, set, tuple)) else v
+    if not hasattr(memoize, "get_stats"):
+        def get_stats():
+            """Returns cache statistics, as {function name or root key: {size, hits, ..}}."""
+            return {"%s.%s" % (k.__module__, k.__name__) if callable(k) else k: v.stats()
+                    for k, v in list(cache.items())}
+        setattr(memoize, "get_stats", get_stats)
+
+
+    def canonize(v):
+        """Returns hashable canonical form of value, equal for equal values of same type."""
+        if hashable(v): return v
+        if isinstance(v, dict):
+            return (type(v), frozenset((canonize(k), canonize(x)) for k, x in v.items()))
+        if isinstance(v, (set, frozenset)):
+            return (type(v), frozenset(canonize(x) for x in v))
+        if isinstance(v, (list, tuple)):
+            return (type(v), tuple(canonize(x) for x in v))
+        return (type(v), repr(v))
 
     def decorate(func):
         ns["func"] = func
         if ns.get("root") is None: ns["root"] = func
-        result = nohashget if nohash else hashget
+        result = getter
         functools.update_wrapper(result, func)
         result.__doc__ = "%s\n\nDecorated with %s.memoize()." % (result.__doc__ or "", __name__)
         result.__wrapped__ = func
         wrappeds[result] = ns["root"]
+        ns["cache"] = memoize.get_cache(ns["root"], **budget)
         return result
 
     def outer(func): return decorate(func)
 
-    def nohashget(*args, **kwargs):
-        """
-        Looks up by hashable args as far as possible,
-        finishes with checking unhashables by equality.
-        """
-        key1, key2 = [], []
-        for arg in args + sum(kwargs.items(), ()):
-            (key1 if hashable(arg) else key2).append(arg)
-        if not key2: return hashget(*args, **kwargs)
-
-        tuples = nohashcache[ns["root"]][tuple(key1)]
-        for mykey, value in tuples:
-            for k1, k2 in zip(key2, mykey) if len(key2) == len(mykey) else ():
-                if type(k1) is type(k2) and k1 == k2:
-                    return returner(value)
-        value = ns["func"](*args, **kwargs)
-        tuples.append((key2, value))
-        return returner(value)
-
-    def hashget(*args, **kwargs):
+    def getter(*args, **kwargs):
         key = args + sum(kwargs.items(), ())
-        mycache = cache[ns["root"]]
-        if key not in mycache:
-            mycache[key] = ns["func"](*args, **kwargs)
-        return returner(mycache[key])
-
-
-    as_outer = not args and ("__nohash__" in kwargs or "__key__" in kwargs)
-    if "__nohash__" in kwargs: nohash = kwargs.pop("__nohash__")
-    if "__key__"    in kwargs: root   = kwargs.pop("__key__")
+        if nohash and not hashable(key): key = canonize(key)
+        mycache = ns.get("cache") or ns.setdefault("cache", memoize.get_cache(ns["root"], **budget))
+        value = mycache.get(key, getter)
+        if value is getter:
+            value = mycache.set(key, ns["func"](*args, **kwargs))
+        return value
+
+
+    as_outer = not args and any(x in kwargs for x in
+                                ("__nohash__", "__key__", "__maxsize__", "__maxbytes__"))
+    if "__nohash__"   in kwargs: nohash = kwargs.pop("__nohash__")
+    if "__key__"      in kwargs: root   = kwargs.pop("__key__")
+    if "__maxsize__"  in kwargs: budget["maxsize"]  = kwargs.pop("__maxsize__")
+    if "__maxbytes__" in kwargs: budget["maxbytes"] = kwargs.pop("__maxbytes__")
     if as_outer and kwargs:
         raise TypeError("memoize() got an unexpected keyword argument '%s'" % 
                         next(iter(kwargs)))
@@ -559,14 +909,7 @@ def memoize(*args, **kwargs):
 
     if as_outer: return outer # Argumented decorator
     elif not args and not kwargs: return decorate(func) # Plain decorator
-    else: # Straight invocation
-        if nohash: return nohashget(*args, **kwargs)
-        else:
-            key = args + sum(kwargs.items(), ())
-            mycache = cache[root]
-            if key not in mycache:
-                mycache[key] = func(*args, **kwargs)
-            return returner(mycache[key])
+    else: return getter(*args, **kwargs) # Straight invocation
 
 
 def add_unique(lst, item, direction=1, maxlen=sys.maxsize):
@@ -768,6 +1111,34 @@ def get_locale_day_date(dt):
     return weekday, weekdate
 
 
+def get_cpu_time():
+    """Returns CPU time used by current process and its finished subprocesses, in seconds."""
+    return sum(os.times()[:4])
+
+
+def get_peak_memory():
+    """Returns peak resident memory size of current process in bytes, or None if unavailable."""
+    try:
+        import resource
+        size = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return size if "darwin" == sys.platform else size * 1024 # Linux reports kilobytes
+    except ImportError: pass
+    try:
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [("cb", ctypes.c_ulong), ("PageFaultCount", ctypes.c_ulong)] + \
+                       [(n, ctypes.c_size_t) for n in ("PeakWorkingSetSize", "WorkingSetSize",
+                        "QuotaPeakPagedPoolUsage", "QuotaPagedPoolUsage",
+                        "QuotaPeakNonPagedPoolUsage", "QuotaNonPagedPoolUsage",
+                        "PagefileUsage", "PeakPagefileUsage")]
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return counters.PeakWorkingSetSize
+    except Exception: pass
+    return None
+
+
 def getval(collection, *path, **kwargs):
     """
     Returns the value at specified collection path. If path not available,
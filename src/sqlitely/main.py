@@ -22,9 +22,11 @@ import errno
 import functools
 import glob
 import itertools
+import json
 import locale
 import logging
 import math
+import multiprocessing
 import os
 try: import Queue as queue        # Py2
 except ImportError: import queue  # Py3
@@ -88,6 +90,52 @@ ARGUMENTS = {
              {"args": ["--config-file"], "dest": "config_file", "metavar": "FILE",
               "help": "path of program configuration file to use"},
         ]},
+        {"name": "diff",
+         "help": "compare two SQLite databases",
+         "description": "Compare schema and table data of two SQLite databases,\n"
+                        "summary printed to console, row differences or SQL patch\n"
+                        "printed to console or written to file.",
+         "arguments": [
+             {"args": ["INFILE"], "metavar": "DATABASE", "help": "SQLite database to compare"},
+             {"args": ["INFILE2"], "metavar": "DATABASE2",
+              "help": "SQLite database to compare against"},
+             {"args": ["-o", "--output"], "dest": "OUTFILE", "metavar": "FILE",
+                       "nargs": "?", "const": "",
+              "help": "write differences to file instead of printing to console;\n"
+                      "filename will be auto-generated if not given;\n"
+                      "automatic for non-printable formats (%s)" %
+                      ",".join(sorted(set(importexport.EXPORT_EXTS) -
+                                      set(importexport.PRINTABLE_EXTS)))},
+             {"args": ["-f", "--format"], "dest": "format",
+              "choices": sorted(importexport.EXPORT_EXTS), "type": str.lower,
+              "help": "output format for row differences,\n"
+                      "or sql for script changing DATABASE into DATABASE2:\n%s\n"
+                      "(auto-detected from output filename if not specified;\n"
+                      "only summary is printed if no format)" % "\n".join(sorted(
+                        "  %-5s  %s" % ("%s:" % k, importexport.EXT_NAMES[k])
+                        for k in sorted(importexport.EXPORT_EXTS)
+                      ))},
+             {"args": ["--select"], "nargs": "+",
+              "help": "names of specific tables to compare data of, or skip\n"
+                      "(supports * wildcards; initial ~ skips)"},
+             {"args": ["--schema-only"], "dest": "schema_only", "action": "store_true",
+              "help": "compare schema only, skip table data"},
+             {"args": ["--overwrite"], "action": "store_true",
+              "help": "overwrite output file if already exists\n"
+                      "(by default appends unique counter to filename)"},
+             {"args": ["--progress"], "action": "store_true",
+              "help": "display progress bar"},
+
+             {"args": ["--profile"], "action": "store_true",
+              "help": "print SQL statement profile to stderr at exit"},
+             {"args": ["--timings"], "metavar": "FILE",
+              "help": "write time and memory used per processing phase\n"
+                      "to file as JSON"},
+             {"args": ["--verbose"], "action": "store_true",
+              "help": "print detailed logging messages to stderr"},
+             {"args": ["--config-file"], "dest": "config_file", "metavar": "FILE",
+              "help": "path of program configuration file to use"},
+        ]},
         {"name": "execute",
          "help": "run SQL statements in SQLite database",
          "description": "Run given SQL in an SQLite database,\n"
@@ -127,6 +175,8 @@ ARGUMENTS = {
              {"args": ["--progress"], "action": "store_true",
               "help": "display progress bar"},
 
+             {"args": ["--profile"], "action": "store_true",
+              "help": "print SQL statement profile to stderr at exit"},
              {"args": ["--verbose"], "action": "store_true",
               "help": "print detailed logging messages to stderr"},
              {"args": ["--config-file"], "dest": "config_file", "metavar": "FILE",
@@ -182,9 +232,25 @@ ARGUMENTS = {
                       "view rows in reverse row_number() order"},
              {"args": ["--max-count"], "dest": "maxcount", "type": int, "metavar": "NUM",
               "help": "maximum total number of rows to export over all tables and views"},
+             {"args": ["--vacuum"], "action": "store_true",
+              "help": "produce a compacted copy when exporting\n"
+                      "complete database to a new database file\n"
+                      "(complete database is otherwise copied as is,\n"
+                      "including PRAGMA settings and sqlite_sequence)"},
              {"args": ["--progress"], "action": "store_true",
               "help": "display progress bar"},
-
+             {"args": ["--snapshot"], "action": "store_true",
+              "help": "read database in one read-only transaction,\n"
+                      "for a consistent view of a database being written to"},
+             {"args": ["--immutable"], "action": "store_true",
+              "help": "assume database file is not modified by anyone\n"
+                      "while reading, skipping all locking (implies --snapshot)"},
+
+             {"args": ["--profile"], "action": "store_true",
+              "help": "print SQL statement profile to stderr at exit"},
+             {"args": ["--timings"], "metavar": "FILE",
+              "help": "write time and memory used per processing phase\n"
+                      "to file as JSON"},
              {"args": ["--verbose"], "action": "store_true",
               "help": "print detailed logging messages to stderr"},
              {"args": ["--config-file"], "dest": "config_file", "metavar": "FILE",
@@ -236,6 +302,11 @@ ARGUMENTS = {
              {"args": ["--progress"], "action": "store_true",
               "help": "display progress bar"},
 
+             {"args": ["--profile"], "action": "store_true",
+              "help": "print SQL statement profile to stderr at exit"},
+             {"args": ["--timings"], "metavar": "FILE",
+              "help": "write time and memory used per processing phase\n"
+                      "to file as JSON"},
              {"args": ["--verbose"], "action": "store_true",
               "help": "print detailed logging messages to stderr"},
              {"args": ["--config-file"], "dest": "config_file", "metavar": "FILE",
@@ -267,6 +338,11 @@ ARGUMENTS = {
              {"args": ["--reverse"], "action": "store_true",
               "help": "find matches in reverse order"},
 
+             {"args": ["--profile"], "action": "store_true",
+              "help": "print SQL statement profile to stderr at exit"},
+             {"args": ["--timings"], "metavar": "FILE",
+              "help": "write time and memory used per processing phase\n"
+                      "to file as JSON"},
              {"args": ["--verbose"], "action": "store_true",
               "help": "print detailed logging messages to stderr"},
              {"args": ["--config-file"], "dest": "config_file", "metavar": "FILE",
@@ -288,6 +364,8 @@ ARGUMENTS = {
               "help": "overwrite output file if already exists\n"
                       "(by default appends unique counter to filename)"},
 
+             {"args": ["--profile"], "action": "store_true",
+              "help": "print SQL statement profile to stderr at exit"},
              {"args": ["--verbose"], "action": "store_true", "help": argparse.SUPPRESS},
              {"args": ["--config-file"], "dest": "config_file", "metavar": "FILE",
               "help": "path of program configuration file to use"},
@@ -342,9 +420,35 @@ ARGUMENTS = {
              {"args": ["--no-empty"], "action": "store_true",
               "help": "skip empty tables and views from output altogether\n"
                       "(affected by offset and limit and search text)"},
+             {"args": ["--index"], "action": "store_true",
+              "help": "narrow down table search with a full-text index\n"
+                      "in a file next to the database, created or updated\n"
+                      "before search; words match from word starts only"},
+             {"args": ["--trigram"], "action": "store_true",
+              "help": "narrow down table search with a trigram index\n"
+                      "in a file next to the database, created or updated\n"
+                      "for searched tables before search; matches stay exact"},
+             {"args": ["--reindex"], "action": "store_true",
+              "help": "rebuild index of searched tables from scratch\n"
+                      "(implies --index if not --trigram)"},
+             {"args": ["--jobs"], "type": int, "metavar": "NUM",
+              "help": "number of tables and views to query concurrently\n"
+                      "on separate connections (default %s;\n"
+                      "single with --max-count or db output)" % conf.MaxReadConnections},
              {"args": ["--progress"], "action": "store_true",
               "help": "display progress bar"},
-
+             {"args": ["--snapshot"], "action": "store_true",
+              "help": "read database in one read-only transaction,\n"
+                      "for a consistent view of a database being written to"},
+             {"args": ["--immutable"], "action": "store_true",
+              "help": "assume database file is not modified by anyone\n"
+                      "while reading, skipping all locking (implies --snapshot)"},
+
+             {"args": ["--profile"], "action": "store_true",
+              "help": "print SQL statement profile to stderr at exit"},
+             {"args": ["--timings"], "metavar": "FILE",
+              "help": "write time and memory used per processing phase\n"
+                      "to file as JSON"},
              {"args": ["--verbose"], "action": "store_true",
               "help": "print detailed logging messages to stderr"},
              {"args": ["--config-file"], "dest": "config_file", "metavar": "FILE",
@@ -378,7 +482,18 @@ ARGUMENTS = {
               "help": "open output file with registered program"},
              {"args": ["--progress"], "action": "store_true",
               "help": "display progress bar"},
-
+             {"args": ["--snapshot"], "action": "store_true",
+              "help": "read database in one read-only transaction,\n"
+                      "for a consistent view of a database being written to"},
+             {"args": ["--immutable"], "action": "store_true",
+              "help": "assume database file is not modified by anyone\n"
+                      "while reading, skipping all locking (implies --snapshot)"},
+
+             {"args": ["--profile"], "action": "store_true",
+              "help": "print SQL statement profile to stderr at exit"},
+             {"args": ["--timings"], "metavar": "FILE",
+              "help": "write time and memory used per processing phase\n"
+                      "to file as JSON"},
              {"args": ["--verbose"], "action": "store_true",
               "help": "print detailed logging messages to stderr"},
              {"args": ["--config-file"], "dest": "config_file", "metavar": "FILE",
@@ -391,6 +506,7 @@ ARGUMENTS = {
 logger = logging.getLogger(__package__)
 window = None    # Application main window instance
 cli_args = None  # Command-line arguments list in CLI mode
+timer = util.PhaseTimer()  # Phase timings of current CLI command
 
 
 class MainApp(wx.App if wx else object):
@@ -644,7 +760,8 @@ def make_progress(action, entities, args, results=None, **ns):
             if args.progress:
                 if not ns["bar"]:
                     pulse = ("import" == action and (item["total"] == -1 or item["total"] < 100)) or \
-                            ("search" == action) or ("export" == action and "table" != item["type"])
+                            action in ("search", "index", "compare") or \
+                            ("export" == action and "table" != item["type"])
                     ns["bar"] = util.ProgressBar(pulse=pulse, interval=0.05, value=item["count"],
                                                  afterword=ns["afterword"], echo=echo)
                     if action in ("export", "import") and "view" != item["type"] \
@@ -693,6 +810,9 @@ def make_search_title(args):
                offset       number of initial matches
                reverse      find matches in reverse order
                ?maxcount    maximum total number of rows to export over all tables and views
+               ?index       search via full-text index
+               ?trigram     search via trigram index
+               ?reindex     search via rebuilt index
     """
     result = []
     if args.FILTER:
@@ -708,6 +828,10 @@ def make_search_title(args):
         result.append("Search total limit: %s" % args.maxcount)
     if args.reverse:
         result.append("Search order: reverse")
+    if getattr(args, "trigram", None):
+        result.append("Search index: trigram")
+    elif getattr(args, "index", None) or getattr(args, "reindex", None):
+        result.append("Search index: full-text, words matched from word starts")
     return result
 
 
@@ -720,7 +844,7 @@ def prepare_args(action, args):
     """
     DEFAULT_FORMATS   = {"execute": "txt", "export": "sql", "search": "txt", "stats": "txt"}
     ACTION_FORMATS    = {"stats": ["html", "sql", "txt"]}
-    OUTFILE_TEMPLATES = {"stats": "%(db)s statistics"}
+    OUTFILE_TEMPLATES = {"diff": "%(db)s differences", "stats": "%(db)s statistics"}
     FORMATS = {x: [x] for x in importexport.EXPORT_EXTS}
     FORMATS["db"] = [x.lstrip(".") for x in conf.DBExtensions]
     if importexport.yaml: FORMATS["yaml"] = list(importexport.YAML_EXTS)
@@ -735,7 +859,7 @@ def prepare_args(action, args):
         if fmt in FORMATS:
             args.format = fmt # Detect format from output filename
     if hasattr(args, "format"):
-        args.format = args.format or DEFAULT_FORMATS[action]
+        args.format = args.format or DEFAULT_FORMATS.get(action)
     if "stats" == action and "sql" == args.format:
         args.disk_usage = True
     if hasattr(args, "combine"):
@@ -747,11 +871,12 @@ def prepare_args(action, args):
     if hasattr(args, "offset"):
         args.offset   =    0 if args.offset   is None or args.offset   <= 0 else args.offset
 
-    format_printable = (args.format in importexport.PRINTABLE_EXTS) if hasattr(args, "format") \
-                       else None
+    format_printable = (args.format in importexport.PRINTABLE_EXTS) \
+                       if getattr(args, "format", None) else None
     outfile_transient = format_printable and args.OUTFILE is None and not getattr(args, "path", "")
     outfile_required  = "stats" == action \
                         or (getattr(args, "combine", False) and args.OUTFILE == "") \
+                        or ("diff" == action and args.OUTFILE == "" and args.format) \
                         or getattr(args, "path", "")
     if not args.OUTFILE and (outfile_required or format_printable is False):
         dct = {"action": action.capitalize(), "db": os.path.basename(args.INFILE)}
@@ -793,6 +918,16 @@ def validate_args(action, args, infile=None):
                  ("limit %r" % args.limit if not args.limit else "max count %r" % args.maxcount)))
     if "export" == action and args.limit == 0 and "json" == args.format:
         sys.exit("Nothing to export as JSON with limit 0.")
+    if action in ("export", "search") and "db" == args.format \
+    and (args.snapshot or args.immutable):
+        sys.exit("Cannot %s to database in snapshot mode." % action)
+    if "search" == action and (args.index or args.trigram or args.reindex) \
+    and (args.snapshot or args.immutable):
+        sys.exit("Cannot use search index in snapshot mode.")
+    if "search" == action and args.index and args.trigram:
+        sys.exit("Cannot use both full-text and trigram index.")
+    if "diff" == action and args.OUTFILE is not None and not args.format:
+        sys.exit("Output format required for writing differences to file.")
     if "import" == action and args.columns:
         try: parse_columns(args.columns, numeric=True)
         except Exception:
@@ -875,6 +1010,9 @@ def do_output(action, args, func, entities, files):
     else:
         count_total = {"count": sum(x.get("count", 0) for x in entities.values())}
         fmt_bytes = lambda f, s=None: util.format_bytes((s or os.path.getsize)(f))
+        outfiles = list(files.values()) or [args.OUTFILE]
+        timer.add(rows=count_total["count"],
+                  bytes=sum(os.path.getsize(f) for f in outfiles if f and os.path.isfile(f)))
 
         infoput()
         infoput("%s %s: %s (%s)", past.capitalize(), adverb, os.path.abspath(args.INFILE),
@@ -904,6 +1042,147 @@ def do_output(action, args, func, entities, files):
                 infoput("  %s%s", title, countstr)
 
 
+def run_diff(dbname, args):
+    """
+    Compares two databases, prints summary of differences to console,
+    writes row differences or SQL patch to file or prints to console.
+
+    @param   dbname         path of database to compare
+    @param   args
+               INFILE2      path of database to compare against
+               OUTFILE      path of output file, if any
+               format       output format for row differences, or "sql" for patch,
+                            or None for summary only
+               select       names of specific tables to compare data of or skip
+               schema_only  compare schema only
+               overwrite    overwrite existing output file instead of creating unique name
+               progress     show progress bar
+    """
+    if not os.path.isfile(args.INFILE2):
+        sys.exit("File not found: %s" % args.INFILE2)
+    if os.path.realpath(dbname) == os.path.realpath(args.INFILE2):
+        sys.exit("Cannot compare file with itself.")
+    validate_args("diff", args, dbname)
+    if args.OUTFILE and os.path.realpath(args.INFILE2) == os.path.realpath(args.OUTFILE):
+        sys.exit("Input file and output file are the same file.")
+    entity_rgx = util.filters_to_regex(args.select) if args.select else None
+
+    timer.phase("open")
+    db1, db2 = database.Database(dbname), database.Database(args.INFILE2)
+    timer.phase("parse schema")
+    progress = None
+    if args.progress:
+        progress, _ = make_progress("compare", {}, args, afterword=" Parsing schema"), output()
+    for db in (db1, db2): db.populate_schema(parse=True, progress=progress)
+
+    timer.phase("compare schema")
+    tables = [n for n in db1.schema["table"] if not entity_rgx or entity_rgx.match(n)]
+    differ = database.DatabaseDiff(db1, db2, tables)
+    changes = differ.get_schema_diff()
+    entities = util.CaselessDict(insertorder=True)
+    for name in [] if args.schema_only else differ.get_tables():
+        item, info = db1.schema["table"][name], differ.get_table_info(name)
+        title = "Table %s" % grammar.quote(name, force=True)
+        entities[name] = dict(item, title=title, info=info, count=0)
+
+    infostream = sys.stdout if args.OUTFILE or not args.format else sys.stderr
+    infoput = lambda s="", *a, **kw: output(s, *a, file=infostream, **kw)
+    progress = make_progress("compare", entities, args)
+    diffcol = util.make_unique("diff", [c for x in entities.values() for c in x["info"]["columns"]])
+    LABELS = {"-": "-", "+": "+", "~": "<>"} # Changed rows output as old and new
+
+
+    def make_iterables():
+        """Yields pairs of ({item}, callable returning iterable of row differences)."""
+        for item in entities.values():
+            if not item["info"]["keys"]: continue # for item
+            cols = item["info"]["columns"]
+            def make_iterable(item=item, cols=cols):
+                for diff in differ.diff_table(item["name"], progress):
+                    rows = [x for x in (diff["row1"], diff["row2"]) if x is not None]
+                    for label, row in zip(LABELS[diff["change"]], rows):
+                        yield collections.OrderedDict([(diffcol, label)] + list(zip(cols, row)))
+            columns = [{"name": diffcol}] + [{"name": c} for c in cols]
+            yield dict(item, columns=columns), make_iterable
+
+    def count_diffs():
+        """Runs through all row differences without output."""
+        for item in entities.values():
+            if not item["info"]["keys"]: continue # for item
+            for _ in differ.diff_table(item["name"], progress): pass
+            if not progress(name=item["name"], count=item["count"], done=True): return None
+        return True
+
+    def write_patch(write):
+        """Writes SQL patch lines with given function."""
+        for sql in differ.get_patch_sql(progress): write(sql)
+        return True
+
+    if args.overwrite and args.OUTFILE:
+        os.path.exists(args.OUTFILE) and os.unlink(args.OUTFILE)
+    title = ["Compare %s" % db1, "Against %s" % db2]
+    info = {"Command": " ".join(cli_args)} if cli_args else None
+    if not args.format:
+        func = count_diffs
+    elif "sql" == args.format and args.OUTFILE:
+        def func():
+            with open(args.OUTFILE, "wb") as f:
+                return write_patch(lambda s: f.write((s + "\n").encode("utf-8")))
+    elif "sql" == args.format:
+        func = functools.partial(write_patch, output)
+    elif args.OUTFILE:
+        func = functools.partial(importexport.export_data_combined, db1, args.OUTFILE,
+                                 args.format, title, make_iterables=make_iterables,
+                                 progress=progress, info=info)
+    else:
+        func = functools.partial(importexport.export_to_console, args.format, make_iterables,
+                                 title, output=output, combined=True, progress=progress)
+
+    timer.phase("compare data")
+    try:
+        result = func()
+    except Exception:
+        _, e, tb = sys.exc_info()
+        logger.exception("Error comparing %s with %s.", dbname, args.INFILE2)
+        if args.OUTFILE: util.try_ignore(os.unlink, args.OUTFILE)
+        six.reraise(type(e), e, tb)
+    else:
+        if not result: return
+        fmt_bytes = lambda f, s=None: util.format_bytes((s or os.path.getsize)(f))
+        timer.add(rows=sum(sum(x.values()) for x in differ.counts.values()))
+        infoput()
+        infoput("Compared %s (%s)", os.path.abspath(dbname), fmt_bytes(dbname, database.get_size))
+        infoput("    with %s (%s)", os.path.abspath(args.INFILE2),
+                                    fmt_bytes(args.INFILE2, database.get_size))
+        if args.OUTFILE:
+            timer.add(bytes=os.path.getsize(args.OUTFILE))
+            infoput("Wrote %s to '%s' (%s).",
+                    "SQL patch" if "sql" == args.format else "row differences",
+                    args.OUTFILE, fmt_bytes(args.OUTFILE))
+        infoput()
+        infoput("Schema differences:" if changes else "Schema: identical.")
+        for change in changes:
+            infoput("  %s %s: %s", change["category"].capitalize(),
+                    grammar.quote(change["name"], force=True), change["change"])
+        if entities: infoput()
+        if entities: infoput("Data differences:")
+        for item in entities.values():
+            counts = differ.counts.get(item["name"])
+            if not item["info"]["keys"]:
+                text = "no common primary key or ROWID, not compared"
+            elif counts is None:
+                text = "re-created" if "sql" == args.format else "not compared"
+            elif not any(counts.values()):
+                text = "identical"
+            else:
+                text = ", ".join("%s %s" % (counts[k], label) for k, label in
+                                 (("-", "removed"), ("+", "added"), ("~", "changed")) if counts[k])
+                text += " %s" % util.plural("row", sum(counts.values()), numbers=False)
+            infoput("  %s: %s", item["title"], text)
+    finally:
+        for db in (db1, db2): util.try_ignore(db.close)
+
+
 def run_execute(dbname, args):
     """
     Runs SQL statements in database, writes query results to file or prints to console.
@@ -1093,13 +1372,17 @@ def run_export(dbname, args):
     validate_args("export", args, dbname)
     entity_rgx = util.filters_to_regex(args.select) if args.select else None
 
-    db = database.Database(dbname)
+    timer.phase("open")
+    db = database.Database(dbname, snapshot=args.snapshot or args.immutable,
+                           immutable=args.immutable)
     if args.related or args.format in ("db", "sql"):
+        timer.phase("parse schema")
         progress = None
         if args.progress:
             progress, _ = make_progress("export", {}, args, afterword=" Parsing schema"), output()
         db.populate_schema(parse=True, generate=False, progress=progress)
 
+    timer.phase("select entities")
     entities = util.CaselessDict((kv for c in db.DATA_CATEGORIES for kv in db.schema[c].items()))
     renames = collections.defaultdict(util.CaselessDict) # {category: {name1: name2}}
     if args.select:
@@ -1139,6 +1422,13 @@ def run_export(dbname, args):
     if "db" == args.format and args.overwrite:
         os.path.exists(args.OUTFILE) and os.unlink(args.OUTFILE)
 
+    # Complete database to new file: copy pages directly instead of per-table queries
+    is_copy = "db" == args.format and not args.select and not os.path.exists(args.OUTFILE) \
+              and (args.limit, args.offset, args.maxcount) == (-1, 0, None) \
+              and not args.reverse and not args.no_empty
+    if args.vacuum and not is_copy:
+        sys.exit("Cannot vacuum unless exporting complete database to a new file.")
+
     if "db" == args.format and os.path.exists(args.OUTFILE):
         db2 = database.Database(args.OUTFILE)
         allitems2 = util.CaselessDict((n, True) for nn in db2.schema.values() for n in nn)
@@ -1148,6 +1438,7 @@ def run_export(dbname, args):
             if name != name2: renames[item["type"]][name] = name2
             allitems2[name2] = True
 
+    if args.progress: timer.phase("count rows")
     for item in (x for x in entities.values() if x["type"] in db.DATA_CATEGORIES):
         item["title"] = "%s %s" % (item["type"].capitalize(), grammar.quote(item["name"], force=True))
         item["count"] = 0
@@ -1175,7 +1466,19 @@ def run_export(dbname, args):
                                               error="Error querying %s." % item["title"])
             yield item, make_iterable
 
-    if "db" == args.format:
+    if is_copy:
+        def do_copy():
+            progress = make_progress("export", {}, args, afterword=" Copying database")
+            result = importexport.export_backup(db, args.OUTFILE, vacuum=args.vacuum,
+                                                progress=progress)
+            for item in (x for x in entities.values() if "table" == x["type"]):
+                item.update(db.get_count(item["name"]))
+            return result
+
+        func = do_copy
+        kwargs.clear()
+
+    elif "db" == args.format:
         func, posargs = importexport.export_to_db, [db, args.OUTFILE, schema]
         kwargs.update(data=not schema_only, limit=limit, maxcount=args.maxcount,
                       empty=not args.no_empty, renames=renames, reverse=args.reverse)
@@ -1223,6 +1526,7 @@ def run_export(dbname, args):
         posargs = [args.format, make_iterables]
         kwargs.update(output=output, combined=True, empty=not args.no_empty, progress=progress)
 
+    timer.phase("write output")
     try: do_output("export", args, functools.partial(func, *posargs, **kwargs), entities, files)
     finally: util.try_ignore(db.close)
 
@@ -1317,6 +1621,7 @@ def run_import(infile, args):
     validate_args("import", args, infile)
     entity_rgx = util.filters_to_regex(args.select) if args.select else None
     dbname, file_existed, total = args.OUTFILE, os.path.isfile(args.OUTFILE), 0
+    timer.phase("open")
     db = database.Database(dbname)
 
     output()
@@ -1325,7 +1630,9 @@ def run_import(infile, args):
     try:
         args.progress and bar.start()
         bar.update(afterword=" Examining data")
+        timer.phase("examine data")
         info = importexport.get_import_file_data(infile)
+        timer.add(bytes=info["size"])
         if args.progress: bar.pause, _ = True, output()
         has_sheets = "xls" in info["format"]
         has_dicts = info["format"] in ["json", "yaml"]
@@ -1347,6 +1654,7 @@ def run_import(infile, args):
             sys.exit("Nothing to import from %s." % infile)
 
         bar.update(afterword=" Parsing schema", pause=False)
+        timer.phase("parse schema")
         db.populate_schema(parse=True)
         if args.progress: bar.pause, _ = True, output()
         build_mappings(sheets)
@@ -1380,6 +1688,7 @@ def run_import(infile, args):
                     grammar.quote(b, force=True)
                 )
         if not args.assume_yes:
+            timer.phase("confirm")
             output()
             output("Proceed with import? (Y/n) ", end="")
             resp = six.moves.input().strip()
@@ -1395,7 +1704,9 @@ def run_import(infile, args):
                 if not args.offset else (args.limit, args.offset)
         maxcount = args.maxcount
         bar.update(afterword=" Importing")
+        timer.phase("import")
         importexport.import_data(db, infile, tables, args.row_header, limit, maxcount, progress)
+        timer.add(rows=sum(x["count"] or 0 for x in sheets))
 
     except Exception:
         _, e, tb = sys.exc_info()
@@ -1405,6 +1716,7 @@ def run_import(infile, args):
         six.reraise(type(e), e, tb)
     else:
         bar.update(afterword=" Finalizing", pause=False)
+        timer.phase("finalize")
         db.close()
         if args.progress: bar.update(value=100, pulse=False)
         bar.stop()
@@ -1471,7 +1783,9 @@ def run_parse(dbname, args):
         i = 0
         imin = 0 if args.offset is None else max(0, args.offset)
         imax = imin + (sys.maxsize if args.limit is None or args.limit < 0 else args.limit)
+        timer.phase("open")
         db = database.Database(dbname)
+        timer.phase("search schema")
         category_kws = {x for k in kws for x in [re.sub("^-", "", k)] if x in db.CATEGORIES}
         for category in (reversed if args.reverse else list)(db.CATEGORIES):
             othercats = set(db.CATEGORIES) - set([category])
@@ -1497,9 +1811,12 @@ def run_parse(dbname, args):
                     matches.append(item["sql"])
                 i += 1
 
+        timer.phase("write output")
+        timer.add(rows=len(matches))
         headers = make_search_title(args)
         if args.OUTFILE:
             importexport.export_sql(db, args.OUTFILE, ";\n\n".join(matches) + ";", headers)
+            timer.add(bytes=os.path.getsize(args.OUTFILE))
     except Exception:
         _, e, tb = sys.exc_info()
         if args.OUTFILE and not file_existed:
@@ -1596,14 +1913,22 @@ def run_search(dbname, args):
                reverse      query rows in reverse order
                maxcount     maximum total number of rows to export over all tables and views
                no_empty     skip empty tables and views from data output altogether
+               index        narrow down table search with full-text index
+               trigram      narrow down table search with trigram index
+               reindex      rebuild index of searched tables from scratch
+               jobs         number of tables and views to query concurrently
     """
     validate_args("search", args, dbname)
 
-    db = database.Database(dbname)
+    timer.phase("open")
+    db = database.Database(dbname, snapshot=args.snapshot or args.immutable,
+                           immutable=args.immutable)
+    timer.phase("select entities")
     queryparser = searchparser.SearchQueryParser("~")
 
     entities = util.CaselessDict(insertorder=True)
-    _, _, _, kws = queryparser.Parse(args.FILTER, args.case)
+    query = queryparser.Compile(args.FILTER, args.case)
+    kws = query.keywords
     for category, item in ((c, x) for c in db.DATA_CATEGORIES for x in db.schema[c].values()):
         if searchparser.match_keywords(item["name"], kws, category, args.case, neg="~") is False:
             continue # for item
@@ -1615,20 +1940,80 @@ def run_search(dbname, args):
     if not entities:
         sys.exit("Nothing to search in %s with %r." % (dbname, args.FILTER))
 
+    index = connection = None
+    if args.index or args.trigram or args.reindex:
+        index = database.SearchIndex(db, "trigram" if args.trigram else "words")
+        if not index.is_supported(db, index.kind):
+            util.try_ignore(db.close)
+            sys.exit("%s index not supported in this environment." %
+                     ("Trigram" if args.trigram else "Full-text"))
+        timer.phase("update index")
+        tables = [n for n, x in entities.items() if "table" == x["type"]]
+        try:
+            if not index.update(tables, full=args.reindex,
+                                progress=make_progress("index", entities, args)):
+                sys.exit("Failed to index %s." % dbname)
+        except Exception:
+            util.try_ignore(db.close)
+            raise
+        connection = index.connect()
+        for item in entities.values(): item["count"] = 0
+        timer.phase("select entities")
+    jobs = 1 if args.maxcount is not None or "db" == args.format else \
+           max(1, conf.MaxReadConnections if args.jobs is None else args.jobs)
+
+
+    def make_select(item, connection=None):
+        """Returns callable yielding rows of item query from database."""
+        return functools.partial(db.select, item["query"], item["params"], lazy=True,
+                                 cursor=connection if item["indexed"] else None,
+                                 error="Error querying %s." %
+                                       util.cap(item["title"], reverse=True))
+
+    def iterate_pool(pool, item):
+        """
+        Yields rows of item query from query pool,
+        or from database if already consumed from pool. Logs error if any.
+        """
+        if item["name"] in pool.skipped:
+            for row in make_select(item, connection)(): yield row
+            return
+        try:
+            for row in pool.rows(item["name"]): yield row
+        except Exception:
+            logger.warning("Error querying %s.", util.cap(item["title"], reverse=True),
+                           exc_info=True)
 
     def make_iterables():
         """Yields pairs of ({item}, callable returning iterable cursor)."""
+        pool, items = None, []
+        if jobs > 1 and len(entities) > 1:
+            pool = database.QueryPool(db, jobs, ordered=True,
+                                      connect=index.connect if connection else None)
         for item in (reversed if args.reverse else list)(entities.values()):
-            sql, params, _, _ = queryparser.Parse(args.FILTER, args.case, item)
+            match = index.get_match(item["name"]) \
+                    if connection and "table" == item["type"] else None
+            sql, params = query.get_sql(item, match, db.get_column_sample)
             if not sql: continue  # for item
 
             order_sql = db.get_order_sql(item["name"], reverse=True) if args.reverse else ""
             limit_sql = db.get_limit_sql(*limit, maxcount=args.maxcount, totals=entities.values())
             sql += order_sql + limit_sql
-            item.update(query=sql, params=params)
-            yield item, functools.partial(db.select, sql, params,
-                                          error="Error querying %s." %
-                                                util.cap(item["title"], reverse=True))
+            item.update(query=sql, params=params, indexed=bool(match))
+            if pool:
+                pool.add(item["name"], sql, params)
+                items.append(item)
+                continue # for item
+            yield item, make_select(item, connection)
+        if not pool: return
+
+        pool.start() # Queries run ahead concurrently, results consumed in order
+        try:
+            for item in items:
+                yield item, functools.partial(iterate_pool, pool, item)
+                pool.skip(item["name"])
+        finally:
+            pool.stop()
 
     if args.overwrite and args.OUTFILE:
         os.path.exists(args.OUTFILE) and os.unlink(args.OUTFILE)
@@ -1647,8 +2032,11 @@ def run_search(dbname, args):
 
                 sql, params = item["query"], item["params"]
                 create_sql = item["sql"] if "table" == item["type"] else None
+                cursor = db.execute(sql, params, cursor=connection, lazy=True) \
+                         if item["indexed"] else None
                 res = importexport.export_query_to_db(db, args.OUTFILE, item["name"],
-                    sql, params, create_sql=create_sql, empty=not args.no_empty, progress=progress
+                    sql, params, cursor=cursor, create_sql=create_sql,
+                    empty=not args.no_empty, progress=progress
                 )
                 result = res or result
                 if res is None: break # for item
@@ -1692,8 +2080,11 @@ def run_search(dbname, args):
         posargs = [args.format, make_iterables, make_search_title(args)]
         kwargs.update(output=output, combined=True, progress=progress, empty=not args.no_empty)
 
+    timer.phase("write output")
     try: do_output("search", args, functools.partial(func, *posargs, **kwargs), entities, files)
-    finally: util.try_ignore(db.close)
+    finally:
+        if connection and connection is not db.connection: util.try_ignore(connection.close)
+        util.try_ignore(db.close)
 
 
 def run_stats(dbname, args):
@@ -1713,7 +2104,9 @@ def run_stats(dbname, args):
     file_existed = args.OUTFILE and not args.overwrite and os.path.isfile(args.OUTFILE)
     validate_args("stats", args, dbname)
 
-    db = database.Database(os.path.abspath(dbname))
+    timer.phase("open")
+    db = database.Database(os.path.abspath(dbname), snapshot=args.snapshot or args.immutable,
+                           immutable=args.immutable)
     stats = {}
     if args.disk_usage:
         resultqueue = queue.Queue()
@@ -1729,17 +2122,26 @@ def run_stats(dbname, args):
         args.progress and bar.start()
         if "sql" != args.format:
             bar.update(afterword=" Parsing schema")
+            timer.phase("parse schema")
             db.populate_schema(parse=True)
             bar.update(afterword=" Counting rows")
-            db.populate_schema(count=True)
+            timer.phase("count rows")
+            def progress(index=None, total=None, name=None, **_):
+                if args.progress and name:
+                    bar.update(afterword=" Counting rows (%s of %s)" % (index, total))
+                return True
+            counts = db.count_tables(progress=progress)
+            timer.add(rows=sum(x or 0 for x in counts.values()))
         if args.disk_usage:
             bar.update(afterword=" Counting disk usage")
+            timer.phase("disk usage")
             worker.work(dbname)
             stats = next((x["data"] for x in [resultqueue.get()] if "data" in x), None)
             if stats: db.set_sizes(stats)
         diagrams = None
         if "html" == args.format:
             bar.update(afterword=" Generating diagram")
+            timer.phase("generate diagram")
             a = MainApp() if is_gui_possible else None
             layout = scheme.SchemaPlacement(db)
             layout.SetFonts("Verdana",
@@ -1751,7 +2153,9 @@ def run_stats(dbname, args):
             svg = layout.MakeTemplate("SVG", embed=True)
             diagrams = {"bmp": bmp, "svg": svg}
         bar.update(afterword=" Writing output")
+        timer.phase("write output")
         importexport.export_stats(db, args.OUTFILE, args.format, stats, diagrams)
+        timer.add(bytes=os.path.getsize(args.OUTFILE))
         bar.stop()
         output()
     except Exception:
@@ -1831,11 +2235,21 @@ def run_gui(filenames):
     finally: del app.SingleChecker
 
 
+def write_timings(filename):
+    """Writes phase timings of current CLI command to file as JSON."""
+    data = dict(timer.get_data(), version=conf.Version, command=cli_args)
+    try:
+        with open(filename, "w") as f: json.dump(data, f, indent=2)
+    except Exception as e:
+        output("Error writing timings to %s: %s", filename, util.format_exc(e), file=sys.stderr)
+
+
 def run(nogui=False):
     """Parses command-line arguments, and runs GUI or a CLI action."""
-    global cli_args, is_gui_possible, logger
+    global cli_args, is_gui_possible, logger, timer
 
     warnings.simplefilter("ignore", UnicodeWarning)
+    multiprocessing.freeze_support() # Binary application spawning worker processes
 
     if (conf.Frozen # Binary application
     or sys.executable.lower().endswith("pythonw.exe")):
@@ -1884,6 +2298,8 @@ def run(nogui=False):
 
     conf.load(arguments.config_file)
     database.register_types()
+    grammar.set_cache_file(conf.ParseCacheFile, conf.MaxParseCacheSize)
+    database.set_count_cache_file(conf.CountCacheFile, conf.MaxCountCacheSize)
     if "gui" == arguments.command and (nogui or not is_gui_possible):
         argparser.print_help()
         status = None
@@ -1927,20 +2343,31 @@ def run(nogui=False):
             sys.exit("Input file and output file are the same file.")
 
     cli_args = argv[:]
-    if "execute" == arguments.command:
-        run_execute(arguments.INFILE, arguments)
-    elif "export" == arguments.command:
-        run_export(arguments.INFILE, arguments)
-    elif "import" == arguments.command:
-        run_import(arguments.INFILE, arguments)
-    elif "parse" == arguments.command:
-        run_parse(arguments.INFILE, arguments)
-    elif "pragma" == arguments.command:
-        run_pragma(arguments.INFILE, arguments)
-    elif "search" == arguments.command:
-        run_search(arguments.INFILE, arguments)
-    elif "stats" == arguments.command:
-        run_stats(arguments.INFILE, arguments)
+    timer = util.PhaseTimer(arguments.command)
+    if arguments.profile: database.PROFILER = database.Profiler()
+    try:
+        if "diff" == arguments.command:
+            run_diff(arguments.INFILE, arguments)
+        elif "execute" == arguments.command:
+            run_execute(arguments.INFILE, arguments)
+        elif "export" == arguments.command:
+            run_export(arguments.INFILE, arguments)
+        elif "import" == arguments.command:
+            run_import(arguments.INFILE, arguments)
+        elif "parse" == arguments.command:
+            run_parse(arguments.INFILE, arguments)
+        elif "pragma" == arguments.command:
+            run_pragma(arguments.INFILE, arguments)
+        elif "search" == arguments.command:
+            run_search(arguments.INFILE, arguments)
+        elif "stats" == arguments.command:
+            run_stats(arguments.INFILE, arguments)
+    finally:
+        if database.PROFILER:
+            report = database.PROFILER.format_report(conf.MaxProfileStatements)
+            output("\n%s", report, file=sys.stderr)
+        if getattr(arguments, "timings", None):
+            write_timings(arguments.timings)
 
 
 
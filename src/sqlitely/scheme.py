@@ -437,7 +437,7 @@ class SchemaPlacement(object):
         @param   opts  diagram display options as returned from GetOptions()
         @return        (whether layout needs full reset, [name of item needing bitmap redraw, ])
         """
-        objs0  = self._objs.values()
+        objs0  = list(self._objs.values())
         sels0  = self._sels.copy()
         lines0 = self._lines.copy()
         rects0 = {o["name"]: self._dc.GetIdBounds(o["id"]) for o in objs0}
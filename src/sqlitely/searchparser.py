@@ -56,6 +56,10 @@ ALLWORDCHARS = re.sub("[\x00-\x1f\x7f-\xa0]", "", u"".join(
 ALLCHARS = ALLWORDCHARS + string.whitespace
 WORDCHARS = ALLWORDCHARS.replace("(", "").replace(")", "").replace("\"", "")
 ESCAPE_LIKE = "\\" # Character used to escape SQLite LIKE special characters _%
+JULIAN_OFFSET = 1721424.5 # Julian day number of proleptic Gregorian ordinal 0
+JULIAN_RANGE = (1721425.5, 5373484.5) # Julian day numbers of years 1..9999
+# Date texts comparable as strings, like "2023-05-07" or "2023-05-07T10:00:00.123Z"
+ISO_DATE_RGX = re.compile(r"^\d{4}-\d\d-\d\d(?:[T ]\d\d:\d\d(?::\d\d(?:\.\d+)?)?Z?)?$")
 
 
 class SearchQueryParser(object):
@@ -67,13 +71,20 @@ class SearchQueryParser(object):
     # For naive identification of "table:xyz", "date:xyz" etc keywords
     PATTERN_KEYWORD = re.compile("^(-?)(%s)\\:([^\\s]+)$" % "|".join(KEYWORDS), re.I)
 
+    # Maximum number of compiled queries to keep cached
+    MAX_CACHE = 100
+
+    # Column types matched by date keywords
+    DATE_TYPES = ("DATE", "DATETIME", "TIMESTAMP")
+
 
     def __init__(self, neg="-"):
         """
         @param   neg  negation character to use in front of texts and keywords
         """
-        if not ParserElement: return
         self.neg = neg
+        self._cache = util.MemoCache(maxsize=self.MAX_CACHE) # {(query, case): SearchQuery}
+        if not ParserElement: return
         with warnings.catch_warnings():
             # In Python 2.6, pyparsing throws warnings on its own code.
             warnings.simplefilter("ignore")
@@ -118,21 +129,47 @@ class SearchQueryParser(object):
             self._grammar = query
 
 
-    def Parse(self, query, case=False, item=None):
+    def Parse(self, query, case=False, item=None, index=None, sample=None):
         """
         Parses the query string and returns (sql, sql params, words).
 
-        @param   case  whether search is case-sensitive
-        @param   item  if set, search is performed on all the fields of this
-                       specific table or view
-                       {"name": "Item name", "columns": [{"name"}, ]}
-        @return        (SQL string, SQL parameter dict, word and phrase list,
-                        keyword map); phrases as tuple-wrapped single strings
+        @param   case   whether search is case-sensitive
+        @param   item   if set, search is performed on all the fields of this
+                        specific table or view
+                        {"name": "Item name", "columns": [{"name"}, ]}
+        @param   index  if set, item rows are narrowed down by full-text index:
+                        to rows with words starting with search words if index
+                        kind is "words", or prefiltered by trigrams if "trigram"
+                        {"table": FTS table name, "schema": index schema name,
+                         "rowid": item ROWID name, "kind": "words" or "trigram"}
+        @param   sample function(table, column) returning sample values from column,
+                        for detecting how item date columns are stored, allowing
+                        date keywords to match by value ranges
+        @return         (SQL string, SQL parameter dict, word and phrase list,
+                         keyword map); phrases as tuple-wrapped single strings
         """
+        compiled = self.Compile(query, case)
+        result, params = compiled.get_sql(item, index, sample)
+        keywords = collections.defaultdict(list, ((k, list(v))
+                                                  for k, v in compiled.keywords.items()))
+        return result, params, list(compiled.words), keywords
+
+
+    def Compile(self, query, case=False):
+        """
+        Parses the query string into a reusable compiled query, for generating
+        SQL for each table and view without parsing again.
+        Compiled queries are cached by query text and case-sensitivity.
+
+        @param   case   whether search is case-sensitive
+        @return         SearchQuery instance
+        """
+        cachekey = (query, bool(case))
+        result = self._cache.get(cachekey)
+        if result is not None: return result
+
         words = [] # All encountered text words and quoted phrases
         keywords = collections.defaultdict(list) # {"table": [], "column": [], ..}
-        params = {} # Parameters for SQL query {"like0": "%word%", ..}
-
         try:
             parse_results = self._grammar.parseString(query, parseAll=True)
         except Exception:
@@ -152,28 +189,9 @@ class SearchQueryParser(object):
                 parse_results = split_words
 
         words, keywords = self._parseWords(parse_results, words, keywords, case)
-        result, params = self._makeSQL(parse_results, params, keywords, case, item)
-        if item:
-            skip_item = False
-            if match_keywords(item["name"], keywords, item["type"], case, self.neg) is False:
-                skip_item = True
-            if not skip_item and item["type"] not in keywords \
-            and any(map(keywords.get, self.ITEM_CATEGORIES)):
-                skip_item = True
-            if skip_item:
-                result = ""
-            else:
-                kw_sql = self._makeKeywordsSQL(keywords, params, item, case)
-                result = "SELECT * FROM %s%s%s%s%s" % (
-                         grammar.quote(item["name"]),
-                         " WHERE " if result else "", result,
-                         " AND " if result and kw_sql else "", kw_sql)
-        else:
-            kw_sql = self._makeKeywordsSQL(keywords, params, item, case)
-        if not item and kw_sql:
-            result = "%s%s" % ("%s AND " % result if result else "", kw_sql)
-
-        return result, params, words, keywords
+        result = SearchQuery(self, query, case, parse_results, words, keywords)
+        self._cache.set(cachekey, result)
+        return result
 
 
     def _parseWords(self, parseresult, words, keywords, case=False, parent_name=None):
@@ -205,13 +223,18 @@ class SearchQueryParser(object):
         return words, keywords
 
 
-    def _makeSQL(self, parseresult, params, keywords, case, item, parent_name=None):
+    def _makeSQL(self, parseresult, params, keywords, case, item, parent_name=None,
+                 columns=None):
         """
         Returns the ParseResults item as an SQL string,
         appending parameter values to params.
+
+        @param   columns  {column name: whether matches column keywords},
+                          populated and reused for column names seen
         """
         result = ""
         if not item: return result, params
+        if columns is None: columns = {}
 
         if isinstance(parseresult, six.string_types):
             op, wild = ("GLOB", "*") if case else ("LIKE", "%")
@@ -219,7 +242,10 @@ class SearchQueryParser(object):
 
             i = len(params)
             for col in item["columns"]:
-                if match_keywords(col["name"], keywords, "column", case, self.neg) is False:
+                if col["name"] not in columns:
+                    columns[col["name"]] = match_keywords(col["name"], keywords, "column",
+                                                          case, self.neg) is not False
+                if not columns[col["name"]]:
                     continue # for col
 
                 cname = grammar.quote(col["name"])
@@ -244,7 +270,7 @@ class SearchQueryParser(object):
                     elements = elements[1:] # Drop the optional "-" in front
             elif "QUOTES" == name:
                 elements = flatten(elements)
-            parseds = [self._makeSQL(x, params, keywords, case, item, name)[0]
+            parseds = [self._makeSQL(x, params, keywords, case, item, name, columns)[0]
                        for x in elements]
             glue = " OR " if name in ("OR_OPERAND", "OR_EXPRESSION") else " AND "
             result, count = join_strings(parseds, glue)
@@ -253,10 +279,61 @@ class SearchQueryParser(object):
         return result, params
 
 
-    def _makeKeywordsSQL(self, keywords, params, item, case):
+    def _makeMatch(self, parseresult, trigram=False, parent_name=None):
+        """
+        Returns the ParseResults item as an FTS5 full-text query, or None if
+        item cannot narrow down the search, like negations.
+
+        For word index, matches words as token prefixes and quoted texts
+        as phrases, skipping words with inner wildcards.
+
+        For trigram index, matches all texts between wildcards at least
+        3 characters long as substrings, giving a superset of rows matched
+        by LIKE and GLOB.
+        """
+        if isinstance(parseresult, six.string_types):
+            exact = "QUOTES" == parent_name
+            if trigram:
+                texts = [parseresult] if exact else parseresult.split("*")
+                matches = ['"%s"' % x.replace('"', '""') for x in texts if len(x) >= 3]
+                if not matches: return None
+                return matches[0] if len(matches) == 1 else "(%s)" % " AND ".join(matches)
+            text = parseresult if exact else parseresult.rstrip("*")
+            if not exact and "*" in text or not re.search(r"[^\W_]", text, re.U):
+                return None
+            return '"%s"%s' % (text.replace('"', '""'), "" if exact else "*")
+
+        elements = parseresult
+        name = hasattr(parseresult, "getName") and parseresult.getName()
+        if name in ("NOT", "KEYWORD"): return None
+        elif "PARENTHESIS" == name:
+            name_elem0 = getattr(elements[0], "getName", lambda: "")()
+            if len(elements) and "NOT_PARENTHESIS" == name_elem0:
+                if elements[0]: return None
+                elements = elements[1:] # Drop the empty negation
+        elif "QUOTES" == name:
+            elements = flatten(elements)
+        matches = [self._makeMatch(x, trigram, name) for x in elements]
+        if name in ("OR_OPERAND", "OR_EXPRESSION"):
+            if None in matches: return None
+            return matches[0] if len(matches) == 1 else "(%s)" % " OR ".join(matches)
+        matches = list(filter(bool, matches))
+        if not matches: return None
+        return matches[0] if len(matches) == 1 else "(%s)" % " AND ".join(matches)
+
+
+    def _makeKeywordsSQL(self, keywords, params, item, case, storages=None):
         """
         Returns the keywords as an SQL string, appending SQL argument values
         to parameters dictionary.
+
+        Date keywords are matched as half-open ranges on column values,
+        usable by column indexes: as ISO-8601 texts, or as Julian day numbers
+        or Unix timestamps if detected so in storages. Single dates not
+        forming a range, like "date:*-*-24", and single dates on columns
+        with unknown storage are matched with STRFTIME instead.
+
+        @param   storages  {column name: "text" or "julian" or "unixepoch" or None}
         """
         result = ""
         kw_sqls  = {} # {"date": [], "-date": []}
@@ -265,30 +342,41 @@ class SearchQueryParser(object):
             if not keyword.endswith("date"): continue # Only dates go into SQL
 
             datecols = [c for c in (item or {}).get("columns", [])
-                if c.get("type") in ("DATE", "DATETIME", "TIMESTAMP")
+                if c.get("type") in self.DATE_TYPES
                 and match_keywords(c["name"], keywords, "column", case, self.neg) is not False
             ]
             if not datecols: return "1 = 0" # Force 0 results from query
 
+            negation = keyword.startswith(self.neg)
             sql, date_words, dates = "", [None] * 2, [None] * 2
             if ".." not in word:
-                # Single date value given: use strftime matching
+                # Single date value given: use range or strftime matching
                 ymd = list(map(util.to_int, word.split("-")[:3]))
                 while len(ymd) < 3: ymd.append(None) # Ensure 3 values
                 if not any(ymd): # No valid values given: skip
                     continue # for word
-                format, value = "", ""
-                for j, (frm, val) in enumerate(zip("Ymd", ymd)):
-                    if val is None: continue # for j, (frm, val)
-                    format += ("-" if format else "") + "%" + frm
-                    value += ("-" if value else "")
-                    value += "%02d" % val if j else "%04d" % val
-                param = "timestamp_%s" % len(params)
-                params[param] = value
+                bounds = make_date_range(*ymd)
+                format, value, param = "", "", None
                 for j, col in enumerate(datecols):
+                    storage = (storages or {}).get(col["name"])
+                    if bounds and storage:
+                        x = self._makeDateRangeSQL(col, bounds, storage, params, negation)
+                        sql += (" OR " if j else "") + x
+                        continue # for j, col
+
+                    if param is None:
+                        for k, (frm, val) in enumerate(zip("Ymd", ymd)):
+                            if val is None: continue # for k, (frm, val)
+                            format += ("-" if format else "") + "%" + frm
+                            value += ("-" if value else "")
+                            value += "%02d" % val if k else "%04d" % val
+                        param = "timestamp_%s" % len(params)
+                        params[param] = value
                     temp = "STRFTIME('%s', %s) = :%s"
                     if "notnull" not in col: temp = "COALESCE(STRFTIME('%s', %s), '') = :%s"
-                    x = temp % (format, grammar.quote(col["name"]), param)
+                    cname = grammar.quote(col["name"])
+                    if "unixepoch" == storage: cname += ", 'unixepoch'"
+                    x = temp % (format, cname, param)
                     sql += (" OR " if j else "") + x
                 if len(datecols) > 1: sql = "(%s)" % sql
 
@@ -315,18 +403,13 @@ class SearchQueryParser(object):
                 else:
                     ymd[2] = max(min(ymd[2], day_max), 1)
                 dates[i] = datetime.date(*ymd)
-            for i, d in ((i, d) for i, d in enumerate(dates) if d):
-                param = "timestamp_%s" % len(params)
-                params[param] = d
-                colsql = ""
-                for j, col in enumerate(datecols):
-                    cname = grammar.quote(col["name"])
-                    if "notnull" not in col: cname = "COALESCE(%s, '')" % cname
-                    colsql += (" OR " if j else "")
-                    colsql += "%s %s :%s" % (
-                              cname, [">=", "<="][i], param)
-                sql += (" AND " if sql else "")
-                sql += "(%s)" % (colsql) if len(datecols) > 1 else colsql
+            if any(dates):
+                bounds = (dates[0], dates[1] and make_date_range(*dates[1].timetuple()[:3])[1])
+                colsqls = [self._makeDateRangeSQL(c, bounds, (storages or {}).get(c["name"])
+                                                  or "text", params, negation)
+                           for c in datecols]
+                sql = " OR ".join(colsqls)
+                if len(datecols) > 1: sql = "(%s)" % sql
 
             if sql: kw_sqls.setdefault(keyword, []).append(sql)
 
@@ -337,6 +420,113 @@ class SearchQueryParser(object):
         return result
 
 
+    def _makeDateRangeSQL(self, col, bounds, storage, params, negation=False):
+        """
+        Returns SQL for matching column values in half-open date range,
+        appending SQL argument values to parameters dictionary.
+
+        @param   col       column data {"name", ?"notnull"}
+        @param   bounds    (start date or None, end date or None), end date excluded
+        @param   storage   column values storage format, "text" or "julian" or "unixepoch"
+        @param   negation  whether SQL will be negated, NULL values then matching as false
+        """
+        cname, sqls = grammar.quote(col["name"]), []
+        for op, date in zip((">=", "<"), bounds):
+            if date is None: continue # for op, date
+            param = "timestamp_%s" % len(params)
+            params[param] = date.toordinal() + JULIAN_OFFSET if "julian" == storage else \
+                            calendar.timegm(date.timetuple()) if "unixepoch" == storage else \
+                            date.isoformat()
+            sqls.append("%s %s :%s" % (cname, op, param))
+        result = " AND ".join(sqls)
+        if negation and "notnull" not in col: result = "COALESCE(%s, 0)" % result
+        elif len(sqls) > 1: result = "(%s)" % result
+        return result
+
+
+class SearchQuery(object):
+    """
+    Search query parsed once by SearchQueryParser.Compile(),
+    generating SQL for any table or view from the parsed query.
+    """
+
+    def __init__(self, parser, text, case, tree, words, keywords):
+        """
+        @param   parser    SearchQueryParser instance
+        @param   text      search query text
+        @param   case      whether search is case-sensitive
+        @param   tree      parsed query as pyparsing.ParseResults, or list of words
+        @param   words     text words and quoted phrases,
+                           phrases as tuple-wrapped single strings
+        @param   keywords  {"table": [], "column": [], ..}
+        """
+        self.parser   = parser
+        self.text     = text
+        self.case     = case
+        self.tree     = tree
+        self.words    = words
+        self.keywords = keywords
+        self._matches = {} # {trigram: FTS5 query}
+        self._columns = {} # {column name: whether matches column keywords}
+
+
+    def get_sql(self, item=None, index=None, sample=None):
+        """
+        Returns (SQL string, SQL parameter dict) for searching query.
+
+        @param   item   if set, search is performed on all the fields of this
+                        specific table or view
+                        {"name": "Item name", "columns": [{"name"}, ]}
+        @param   index  if set, item rows are narrowed down by full-text index,
+                        as in SearchQueryParser.Parse()
+        @param   sample function(table, column) returning sample values from column,
+                        as in SearchQueryParser.Parse()
+        @return         ("SELECT * FROM item WHERE ..", params) if item given,
+                        or ("", {}) if item does not match query keywords;
+                        WHERE-clause of keywords if no item
+        """
+        parser, keywords, case = self.parser, self.keywords, self.case
+        result, params = parser._makeSQL(self.tree, {}, keywords, case, item,
+                                         columns=self._columns)
+        if item:
+            skip_item = False
+            if match_keywords(item["name"], keywords, item["type"], case, parser.neg) is False:
+                skip_item = True
+            if not skip_item and item["type"] not in keywords \
+            and any(map(keywords.get, parser.ITEM_CATEGORIES)):
+                skip_item = True
+            match = None
+            if index and not skip_item:
+                trigram = "trigram" == index.get("kind")
+                if trigram not in self._matches:
+                    self._matches[trigram] = parser._makeMatch(self.tree, trigram)
+                match = self._matches[trigram]
+            if skip_item:
+                result, params = "", {}
+            else:
+                if match and result:
+                    fts = grammar.quote(index["table"], force=True)
+                    params["fts_match"] = match
+                    result = "%s IN (SELECT rowid FROM %s.%s WHERE %s MATCH :fts_match) " \
+                             "AND %s" % (grammar.quote(index["rowid"]),
+                             grammar.quote(index["schema"]), fts, fts, result)
+                storages = None
+                if sample and any(k.endswith("date") for k in keywords):
+                    storages = {c["name"]: detect_date_storage(sample(item["name"], c["name"]))
+                                for c in item["columns"] if c.get("type") in parser.DATE_TYPES}
+                kw_sql = parser._makeKeywordsSQL(keywords, params, item, case, storages)
+                result = "SELECT * FROM %s%s%s%s%s" % (
+                         grammar.quote(item["name"]),
+                         " WHERE " if result or kw_sql else "", result,
+                         " AND " if result and kw_sql else "", kw_sql)
+        else:
+            kw_sql = parser._makeKeywordsSQL(keywords, params, item, case)
+        if not item and kw_sql:
+            result = "%s%s" % ("%s AND " % result if result else "", kw_sql)
+        return result, params
+
+
+
 def flatten(items):
     """
     Flattens the list to a single level, if possible,
@@ -367,6 +557,39 @@ def escape(item, op="LIKE", exact=False):
     return result
 
 
+def make_date_range(year, month=None, day=None):
+    """
+    Returns half-open range of dates covering given year or month or day,
+    as (start date, end date or None if past supported dates),
+    or None if values do not form a valid date.
+    """
+    if year is None or month is None and day is not None: return None
+    try: start = datetime.date(year, month or 1, day or 1)
+    except (ValueError, OverflowError): return None
+    try:
+        if day is not None: end = start + datetime.timedelta(days=1)
+        elif month is not None: end = datetime.date(year + month // 12, month % 12 + 1, 1)
+        else: end = datetime.date(year + 1, 1, 1)
+    except (ValueError, OverflowError): end = None
+    return start, end
+
+
+def detect_date_storage(values):
+    """
+    Returns how date values are stored, as "text" for ISO-8601 texts,
+    "julian" for Julian day numbers, "unixepoch" for Unix timestamps,
+    or None if not recognized or mixed.
+    """
+    if not values: return None
+    if all(isinstance(v, six.string_types) and ISO_DATE_RGX.match(v) for v in values):
+        return "text"
+    if any(isinstance(v, bool) or not isinstance(v, six.integer_types + (float, ))
+           for v in values): return None
+    if all(JULIAN_RANGE[0] <= v <= JULIAN_RANGE[1] for v in values): return "julian"
+    if all(isinstance(v, six.integer_types) for v in values): return "unixepoch"
+    return None
+
+
 def join_strings(strings, glue=" AND "):
     """
     Returns the non-empty strings joined together with the specified glue.
@@ -445,14 +668,15 @@ def test():
     loglines = [] # Cached trace lines
     def makeSQLLogger(func):
         level = [0] # List as workaround: enclosing scope cannot be reassigned
-        def inner(parseresult, params, keywords, case=False, item=None, parent_name=None):
+        def inner(parseresult, params, keywords, case=False, item=None, parent_name=None,
+                  columns=None):
             txt = "%s_makeSQL(<%s> %s, parent_name=%s)" % \
                   ("  " * level[0], parseresult.__class__.__name__, item, parent_name)
             if hasattr(parseresult, "getName"):
                 txt += ", name=%s" % parseresult.getName()
             loglines.append(txt)
             level[0] += 1
-            result = func(parseresult, params, keywords, case, item, parent_name)
+            result = func(parseresult, params, keywords, case, item, parent_name, columns)
             level[0] -= 1
             loglines.append("%s = %s." % (txt, result))
             return result
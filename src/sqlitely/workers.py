@@ -15,6 +15,7 @@ from collections import OrderedDict
 import hashlib
 import locale
 import logging
+import mmap
 import os
 import re
 import sqlite3
@@ -214,9 +215,15 @@ class SearchThread(WorkerThread):
 
 
     def search_data(self, search):
-        """Searches database data, yielding (infotext, result)."""
-        infotext, case = "", search.get("case")
-        _, _, words, kws = self.parser.Parse(search["text"], case)
+        """
+        Searches database data, yielding (infotext, result).
+
+        Tables and views are queried concurrently on a pool of read-only
+        connections, results are output item by item in order of arrival.
+        """
+        infotext, case, db = "", search.get("case"), search["db"]
+        query = self.parser.Compile(search["text"], case)
+        words, kws = query.words, query.keywords
         kws = {k: v for k, v in kws.items() if k in database.Database.DATA_CATEGORIES
                or k.startswith("-") and k[1:] in database.Database.DATA_CATEGORIES}
         pattern_replace = self.make_replacer(words, case)
@@ -224,71 +231,106 @@ class SearchThread(WorkerThread):
         tpl_row  = step.Template(templates.SEARCH_ROW_DATA_HTML, escape=True)
         result = {"output": "", "map": {}, "search": search, "count": 0}
 
+        index, connect = search.get("index"), None
+        if index:
+            tables = [] if "view" in kws and "table" not in kws else \
+                     [n for n in db.schema.get("table", {})
+                      if match_keywords(n, kws, "table", case) is not False]
+            try:
+                connection = index.update(tables, progress=lambda **_: self._is_working) \
+                             and index.connect()
+                if connection: connect = index.connect
+                if connection and connection is not db.connection:
+                    util.try_ignore(connection.close)
+            except Exception:
+                logger.exception("Error updating search index %s.", index.path)
+
+        items = OrderedDict() # {(category, name): item}
+        pool = database.QueryPool(db, chunk=conf.SearchResultsChunk, connect=connect)
+        reader = db.get_reader()
+        sample = lambda table, column: db.get_column_sample(table, column, cursor=reader)
         for category in database.Database.DATA_CATEGORIES:
             if category not in kws \
             and ("table" if "view" == category else "view") in kws \
-            or not search["db"].schema.get(category):
+            or not db.schema.get(category):
                 continue # for category
-
-            mytexts = []
-            for item in search["db"].get_category(category).values():
-                sql, params, _, _ = self.parser.Parse(search["text"], case, item)
+            for item in db.get_category(category).values():
+                match = index.get_match(item["name"]) if connect and "table" == category else None
+                sql, params = query.get_sql(item, match, sample)
                 if not self._is_working: break # for item
                 if not sql: continue # for item
-
-                cursor = None
-                try:
-                    cursor = search["db"].execute(sql, params)
-                    row = cursor.fetchone()
-                    if not row:
-                        mytexts.append(escape_html(util.ellipsize(item["name"])))
-                        continue # for item
-
-                    result["output"] = tpl_item.expand(category=category, item=item)
-                    count = 0
-                    while row:
-                        result["count"], count = result["count"] + 1, count + 1
-
+                items[(category, item["name"])] = item
+                pool.add((category, item["name"]), sql, params)
+
+        pending  = OrderedDict() # {key: [row, ]} for rows not yet output, in order of arrival
+        received = {}            # {key: number of rows received}
+        counts   = {}            # {key: number of rows output}
+        finished = set()         # Keys of completed queries
+        active   = None          # Key of item being output
+        pool.start()
+        try:
+            for event in pool.results(timeout=0.1):
+                if not self._is_working: break # for event
+                if not event: continue # for event
+
+                key, rows = event
+                if rows is None: finished.add(key)
+                elif isinstance(rows, Exception):
+                    finished.add(key)
+                    if not pool.stopped:
+                        logger.error("Error searching %s %s.", key[0],
+                                     grammar.quote(key[1], force=True), exc_info=rows)
+                elif not pool.stopped:
+                    rows = rows[:conf.MaxSearchResults - sum(received.values())]
+                    received[key] = received.get(key, 0) + len(rows)
+                    pending.setdefault(key, []).extend(rows)
+                    if sum(received.values()) >= conf.MaxSearchResults: pool.stop()
+
+                while self._is_working:
+                    if active is None and pending:
+                        active = next(iter(pending))
+                        result["output"] += tpl_item.expand(category=active[0], item=items[active])
+                    if active is None: break # while self._is_working
+
+                    category, item = active[0], items[active]
+                    for row in pending.pop(active, ()):
+                        counts[active] = counts.get(active, 0) + 1
+                        result["count"] += 1
                         ns = dict(category=category, item=item, row=row,
-                                  keywords=kws, count=count, search=search,
+                                  keywords=kws, count=counts[active], search=search,
                                   pattern_replace=pattern_replace)
                         result["output"] += tpl_row.expand(ns)
-                        key = "%s:%s:%s" % (category, item["name"], count)
-                        result["map"][key] = {"category": category,
-                                              "name": item["name"],
-                                              "row": row}
+                        mapkey = "%s:%s:%s" % (category, item["name"], counts[active])
+                        result["map"][mapkey] = {"category": category,
+                                                 "name": item["name"], "row": row}
                         if not result["count"] % conf.SearchResultsChunk:
                             yield "", result
                             result = dict(result, output="", map={})
+                    if active not in finished: break # while self._is_working
 
-                        if not self._is_working \
-                        or result["count"] >= conf.MaxSearchResults:
-                            break # while row
-
-                        row = cursor.fetchone()
-                except Exception:
-                    logger.exception("Error searching %s %s.", category,
-                                     grammar.quote(item["name"], force=True))
-                    continue # for item
-                finally: cursor and util.try_ignore(cursor.close)
-
-                if not self._drop_results:
-                    result["output"] += "</table></font>"
-                    yield "", result
-                    result = dict(result, output="", map={})
+                    if not self._drop_results:
+                        result["output"] += "</table></font>"
+                        yield "", result
+                        result = dict(result, output="", map={})
+                    active = None
+        finally:
+            pool.stop()
 
-                mytexts.append("<b>%s</b> (<a href='#%s'><font color='%s'>%s</font></a>)" % (
-                    escape_html(util.ellipsize(item["name"])), escape_html(item["name"]),
-                    conf.LinkColour, util.plural("result", count).replace(" ", "&nbsp;")
-                ))
-                if not self._is_working \
-                or result["count"] >= conf.MaxSearchResults: break # for item
-
-            infotext += "%s%s: %s" % ("; " if infotext else "",
-                util.plural(category, mytexts, numbers=False),
-                ", ".join(mytexts))
-            if not self._is_working or result["count"] >= conf.MaxSearchResults:
-                break # for category
+        for category in database.Database.DATA_CATEGORIES:
+            mytexts = []
+            for (mycategory, name), item in items.items():
+                if mycategory != category: continue # for (mycategory, name), item
+                if (category, name) in counts:
+                    mytexts.append("<b>%s</b> (<a href='#%s'><font color='%s'>%s</font></a>)" % (
+                        escape_html(util.ellipsize(name)), escape_html(name), conf.LinkColour,
+                        util.plural("result", counts[(category, name)]).replace(" ", "&nbsp;")
+                    ))
+                elif (category, name) in finished:
+                    mytexts.append(escape_html(util.ellipsize(name)))
+            if mytexts:
+                infotext += "%s%s: %s" % ("; " if infotext else "",
+                    util.plural(category, mytexts, numbers=False),
+                    ", ".join(mytexts))
         if infotext:
             infotext += "; %s in total" % util.plural("result", result["count"])
         yield infotext, result
@@ -531,43 +573,171 @@ class AnalyzerThread(WorkerThread):
 
 class ChecksumThread(WorkerThread):
     """
-    Checksum calculator background thread, goes through database file
-    and computes MD5 and SHA-1 hashes.
-
-    @param   path  database file path to analyze
-    @return        {?"error": str, ?"sha1": str, ?"md5": str}
+    Checksum calculator background thread, goes through memory-mapped database
+    file and computes MD5 and SHA-1 hashes concurrently. Optionally computes
+    logical checksums of table contents, see Database.get_checksums().
+
+    @param   data  database file path to analyze,
+                   or {path, ?db: Database to compute logical checksums for}
+    @return        {?"error": str, ?"sha1": str, ?"md5": str,
+                    ?"content": str, ?"tables": {name: str}}
     """
 
-    def run(self):
-        BLOCKSIZE = 1048576
+    """Number of bytes to hash at a time between checking for stop."""
+    BLOCKSIZE = 16 * 1048576
 
+
+    def run(self):
         self._is_running = True
         while self._is_running:
-            path = self._queue.get()
-            if not path: continue # while self._is_running
+            data = self._queue.get()
+            if not data: continue # while self._is_running
 
+            path, db = (data, None) if isinstance(data, six.string_types) \
+                       else (data["path"], data.get("db"))
             self._is_working, self._drop_results = True, False
-            error = ""
-
-            if not error:
-                sha1, md5 = hashlib.sha1(), hashlib.md5()
-                try:
-                    with open(path, "rb") as f:
-                        buf = f.read(BLOCKSIZE)
-                        while len(buf):
-                            sha1.update(buf), md5.update(buf)
-                            buf = f.read(BLOCKSIZE)
-                            if not self._is_working: break # while len
-                    if self._is_working:
-                        logger.info("Finished checksum calculation for %s.", path)
-                except Exception as e:
-                    logger.exception("Error calculating checksum for %s.", path)
-                    error = util.format_exc(e)
+            result = {}
+            try:
+                result.update(self.hash_file(path))
+                if db and self._is_working:
+                    checksums = db.get_checksums(progress=lambda **_: self._is_working)
+                    if checksums:
+                        result.update(content=checksums["database"], tables=checksums["tables"])
+                if self._is_working:
+                    logger.info("Finished checksum calculation for %s.", path)
+            except Exception as e:
+                logger.exception("Error calculating checksum for %s.", path)
+                result = {"error": util.format_exc(e)}
 
             if self._drop_results:
                 self._is_working = False
                 continue # while self._is_running
-            if error: self.postback({"error": error})
-            elif self._is_working:
-                self.postback({"sha1": sha1.hexdigest(), "md5": md5.hexdigest()})
+            if "error" in result or self._is_working: self.postback(result)
+            self._is_working = False
+
+
+    def hash_file(self, path):
+        """Returns {"sha1": str, "md5": str} for file, computed on separate threads."""
+        digests, errors = {"sha1": hashlib.sha1(), "md5": hashlib.md5()}, []
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+            view = memoryview(mapped) if mapped and six.PY3 else mapped # Py2 slices copy
+
+            def process(digest):
+                try:
+                    for i in range(0, size, self.BLOCKSIZE):
+                        if not self._is_working: break # for i
+                        digest.update(view[i:i + self.BLOCKSIZE])
+                except Exception as e: errors.append(e)
+
+            threads = [threading.Thread(target=process, args=(x, )) for x in digests.values()]
+            try:
+                for thread in threads: thread.start()
+                for thread in threads: thread.join()
+            finally:
+                if view is not mapped: view.release()
+                if mapped: mapped.close()
+        if errors: raise errors[0]
+        return {k: v.hexdigest() for k, v in digests.items()}
+
+
+
+class CountThread(WorkerThread):
+    """
+    Row count background thread, runs exact COUNT(*) for tables having
+    estimated counts concurrently on read-only connections, posting back
+    result for each table as completed. Stopping work interrupts ongoing counts.
+
+    @param   dict  {db, tables: [name, ]}
+    @return        {"table": name, "count": int} for each table, or {"done": True} when finished
+    """
+
+    def run(self):
+        self._is_running = True
+        while self._is_running:
+            data = self._queue.get()
+            if not data: continue # while self._is_running
+
+            self._is_working, self._drop_results = True, False
+            def progress(name=None, count=None, done=False, **_):
+                if self._drop_results or not self._is_working: return False
+                if name and count is not None:
+                    self.postback({"table": name, "count": count})
+                return self._is_working
+
+            db = data["db"]
+            if db.is_open(): db.count_tables(data["tables"], progress)
+            if not self._drop_results: self.postback({"done": True})
             self._is_working = False
+
+
+
+class DiffThread(WorkerThread):
+    """
+    Database comparison background thread, compares schema and table data
+    of two databases, posting back results for each table as completed.
+    Can also write SQL patch for a completed comparison.
+
+    @param   dict  {db: Database to compare, filename: database to compare against}
+                   or {diff: DatabaseDiff, patch: path of SQL file to write}
+    @return        {"schema": [{category, name, change}]} first,
+                   {"table": name, ?"count": rows scanned, ?"counts": {"-", "+", "~"},
+                    ?"skipped": True} for each table,
+                   {"done": True, "diff": DatabaseDiff} when finished,
+                   {"patch": path} when patch written, or {"error": str}
+    """
+
+    def run(self):
+        self._is_running = True
+        while self._is_running:
+            data = self._queue.get()
+            if not data: continue # while self._is_running
+
+            self._is_working, self._drop_results = True, False
+            def progress(name=None, count=None, **_):
+                if self._drop_results or not self._is_working: return False
+                if name and count is not None:
+                    self.postback({"table": name, "count": count})
+                return self._is_working
+
+            try:
+                if "patch" in data: self.write_patch(data["diff"], data["patch"])
+                else: self.compare(data["db"], data["filename"], progress)
+            except Exception as e:
+                logger.exception("Error comparing databases.")
+                if not self._drop_results: self.postback({"error": util.format_exc(e)})
+            self._is_working = False
+
+
+    def compare(self, db, filename, progress):
+        """Compares database with database file, posting back results."""
+        db2 = database.Database(filename)
+        try:
+            db2.populate_schema(parse=True)
+            differ = database.DatabaseDiff(db, db2)
+            self.postback({"schema": differ.get_schema_diff()})
+            for name in differ.get_tables():
+                if not self._is_working: break # for name
+                if not differ.get_table_info(name)["keys"]:
+                    self.postback({"table": name, "skipped": True})
+                    continue # for name
+                for _ in differ.diff_table(name, progress): pass
+                if self._is_working:
+                    self.postback({"table": name, "counts": differ.counts[name]})
+            if self._is_working:
+                self.postback({"done": True, "diff": differ})
+                logger.info("Finished comparing %s with %s.", db, filename)
+                db2 = None
+        finally:
+            if db2: util.try_ignore(db2.close)
+
+
+    def write_patch(self, differ, filename):
+        """Writes SQL patch changing first database into second, posting back result."""
+        with open(filename, "wb") as f:
+            for sql in differ.get_patch_sql(lambda **_: self._is_working):
+                if not self._is_working: break # for sql
+                f.write((sql + "\n").encode("utf-8"))
+        if self._is_working: self.postback({"patch": filename})
+        else: util.try_ignore(os.unlink, filename)
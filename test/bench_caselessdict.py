@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark of util.CaselessDict against plain dict,
+run as: python test/bench_caselessdict.py [--items N] [--repeat N].
+
+Plain dict holds lowercase keys and is accessed with lowercased keys,
+the equivalent of what CaselessDict does internally. Lookups should stay
+within a small constant factor of dict (the cost of a Python-level method
+call), iteration should not degrade with size once key order is cached.
+
+------------------------------------------------------------------------------
+This file is part of SQLitely - SQLite database tool.
+Released under the MIT License.
+
+@author      Erki Suurjaak
+@created     16.10.2026
+@modified    16.10.2026
+------------------------------------------------------------------------------
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from sqlitely.lib.util import CaselessDict
+
+
+def run(items=10000, repeat=5):
+    """Runs benchmark and prints timings."""
+    names = ["Table_%s" % i for i in range(items)]
+    lowers = [x.lower() for x in names]
+    plain = {k: i for i, k in enumerate(lowers)}
+    caseless = CaselessDict((k, i) for i, k in enumerate(names))
+    insertorder = CaselessDict(((k, i) for i, k in enumerate(names)), insertorder=True)
+
+    def lookup_dict():     return [plain[k.lower()] for k in names]
+    def lookup_caseless(): return [caseless[k] for k in names]
+    def contains_dict():     return [k.lower() in plain for k in names]
+    def contains_caseless(): return [k in caseless for k in names]
+    def iterate_dict():     return [(k, v) for k, v in plain.items()]
+    def iterate_caseless(): return [(k, v) for k, v in caseless.items()]
+    def iterate_ordered():  return [(k, v) for k, v in insertorder.items()]
+    def churn_caseless():
+        d = CaselessDict(((k, i) for i, k in enumerate(names[:1000])), insertorder=True)
+        for k in names[:1000]: d.pop(k)
+
+    cases = [("lookup", lookup_dict, lookup_caseless),
+             ("contains", contains_dict, contains_caseless),
+             ("items", iterate_dict, iterate_caseless),
+             ("items insertorder", iterate_dict, iterate_ordered),
+             ("insert+pop 1000 insertorder", None, churn_caseless)]
+    print("%s items, best of %s runs:" % (items, repeat))
+    for label, f1, f2 in cases:
+        t1 = min(timeit.repeat(f1, number=1, repeat=repeat)) if f1 else None
+        t2 = min(timeit.repeat(f2, number=1, repeat=repeat))
+        print("  %-28s dict %8s ms   CaselessDict %8.3f ms%s" % (
+            label, "%.3f" % (t1 * 1000) if t1 else "-", t2 * 1000,
+            "   (x%.2f)" % (t2 / t1) if t1 else ""
+        ))
+
+
+if "__main__" == __name__:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--items",  type=int, default=10000, help="number of keys")
+    parser.add_argument("--repeat", type=int, default=5,     help="number of runs")
+    args = parser.parse_args()
+    run(args.items, args.repeat)
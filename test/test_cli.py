@@ -84,6 +84,7 @@ class TestCLI(unittest.TestCase):
         except Exception: pass
         self._proc   = None  # subprocess.Popen instance
         self._dbname = None  # Path to source database
+        self._dbname2 = None  # Path to second database for diff
         self._paths  = []    # [path to temporary test file, ]
 
 
@@ -166,6 +167,26 @@ class TestCLI(unittest.TestCase):
         return self._proc.returncode, out, err
 
 
+    def test_diff(self):
+        """Tests 'diff' command in command-line interface."""
+        logger.info("Testing 'diff' command.")
+        self.populate_db(self._dbname)
+        self._dbname2 = self.mktemp(".db")
+        shutil.copy(self._dbname, self._dbname2)
+        with sqlite3.connect(self._dbname2) as db:
+            db.execute("DELETE FROM parent WHERE id = 1")
+            db.execute("UPDATE parent SET value = 'changed' WHERE id = 2")
+            db.execute("INSERT INTO parent (id, value) VALUES (100, 'new')")
+            db.execute("DROP INDEX parent_idx")
+            db.execute("CREATE TABLE added (id INTEGER PRIMARY KEY, value)")
+            db.execute("INSERT INTO added VALUES (1, 'added')")
+
+        self.verify_diff_summary()
+        self.verify_diff_formats()
+        self.verify_diff_patch()
+        self.verify_diff_nullable_keys()
+
+
     def test_execute(self):
         """Tests 'execute' command in command-line interface."""
         logger.info("Testing 'execute' command.")
@@ -186,6 +207,9 @@ class TestCLI(unittest.TestCase):
         self.verify_export_selections()
         self.verify_export_limits()
         self.verify_export_flags()
+        self.verify_export_copy()
+        self.verify_export_profile()
+        self.verify_export_timings()
 
 
     def test_import(self):
@@ -229,6 +253,8 @@ class TestCLI(unittest.TestCase):
         self.verify_search_formats()
         self.verify_search_limits()
         self.verify_search_filters()
+        self.verify_search_index()
+        self.verify_search_dates()
 
 
     def test_stats(self):
@@ -240,6 +266,104 @@ class TestCLI(unittest.TestCase):
         self.verify_stats_flags()
 
 
+    def verify_diff_summary(self):
+        """Tests 'diff': summary output, --select, --schema-only."""
+        logger.info("Testing diff summary output.")
+
+        res, out, err = self.run_cmd("diff", self._dbname, self._dbname)
+        self.assertTrue(res, "Unexpected success from diff with itself.")
+
+        res, out, err = self.run_cmd("diff", self._dbname, self._dbname2)
+        self.assertFalse(res, "Unexpected failure from diff.")
+        for text in ('Table "added": added', 'Index "parent_idx": removed',
+                     'Table "parent": 1 removed, 1 added, 1 changed rows',
+                     'Table "related": identical'):
+            self.assertIn(text, out, "Unexpected output in diff summary.")
+
+        logger.info("Testing diff summary output with --select.")
+        res, out, err = self.run_cmd("diff", self._dbname, self._dbname2, "--select", "rel*")
+        self.assertFalse(res, "Unexpected failure from diff.")
+        self.assertIn('Table "related": identical', out, "Unexpected output in diff summary.")
+        self.assertNotIn('Table "parent":', out, "Unexpected output in diff summary.")
+
+        logger.info("Testing diff summary output with --schema-only.")
+        res, out, err = self.run_cmd("diff", self._dbname, self._dbname2, "--schema-only")
+        self.assertFalse(res, "Unexpected failure from diff.")
+        self.assertIn('Table "added": added', out, "Unexpected output in diff summary.")
+        self.assertNotIn("Data differences", out, "Unexpected output in diff summary.")
+
+
+    def verify_diff_formats(self):
+        """Tests 'diff': row differences output to console and file in different formats."""
+        logger.info("Testing diff output in all formats.")
+
+        for fmt in (x for x in self.PRINTABLE_FORMATS if x not in ("db", "sql")):
+            logger.info("Testing diff output as %s.", fmt.upper())
+            res, out, err = self.run_cmd("diff", self._dbname, self._dbname2, "-f", fmt)
+            self.assertFalse(res, "Unexpected failure from diff.")
+            self.assertIn("changed", out, "Unexpected output from diff.")
+            self.assertIn("new", out, "Unexpected output from diff.")
+
+        for fmt in (x for x in self.FORMATS if x not in ("db", "sql")):
+            logger.info("Testing diff output to file as %s.", fmt.upper())
+            outfile = self.mktemp("." + fmt)
+            res, out, err = self.run_cmd("diff", self._dbname, self._dbname2, "-o", outfile)
+            self.assertFalse(res, "Unexpected failure from diff.")
+            self.assertTrue(os.path.getsize(outfile), "Output file has no content in diff.")
+
+
+    def verify_diff_patch(self):
+        """Tests 'diff': SQL patch output, applied to database."""
+        logger.info("Testing diff output as SQL patch.")
+
+        outfile = self.mktemp(".sql")
+        res, out, err = self.run_cmd("diff", self._dbname, self._dbname2, "-o", outfile)
+        self.assertFalse(res, "Unexpected failure from diff.")
+        with open(outfile, "r") as f: content = f.read()
+        testfile = self.mktemp(".db")
+        shutil.copy(self._dbname, testfile)
+        with sqlite3.connect(testfile) as db:
+            db.isolation_level = None
+            db.executescript(content)
+
+        res, out, err = self.run_cmd("diff", testfile, self._dbname2)
+        self.assertFalse(res, "Unexpected failure from diff.")
+        self.assertIn("Schema: identical", out, "Unexpected output in diff summary.")
+        for name in self.SCHEMA:
+            self.assertIn('Table "%s": identical' % name, out, "Unexpected output in diff summary.")
+
+
+    def verify_diff_nullable_keys(self):
+        """Tests 'diff': SQL patch for table with NULLs in composite primary key."""
+        logger.info("Testing diff output as SQL patch with nullable primary key.")
+        dbname1, dbname2 = self.mktemp(".db"), self.mktemp(".db")
+        ROWS1 = [(None, 5, "a"), (None, 5, "a"), (None, 5, "b"), ("x", None, "c"), ("x", 1, "d")]
+        ROWS2 = [(None, 5, "a"), (None, 5, "e"), (None, 5, "b"), ("x", None, "f"), ("x", 1, "g"),
+                 (None, None, "h")]
+        for dbname, rows in [(dbname1, ROWS1), (dbname2, ROWS2)]:
+            with sqlite3.connect(dbname) as db:
+                db.execute("CREATE TABLE b (k TEXT, j INTEGER, v, PRIMARY KEY (k, j))")
+                db.executemany("INSERT INTO b VALUES (?, ?, ?)", rows)
+
+        outfile = self.mktemp(".sql")
+        res, out, err = self.run_cmd("diff", dbname1, dbname2, "-o", outfile)
+        self.assertFalse(res, "Unexpected failure from diff.")
+        with open(outfile, "r") as f: content = f.read()
+        testfile = self.mktemp(".db")
+        shutil.copy(dbname1, testfile)
+        with sqlite3.connect(testfile) as db:
+            db.isolation_level = None
+            db.executescript(content)
+        with sqlite3.connect(testfile) as db:
+            rows = db.execute("SELECT k, j, v FROM b").fetchall()
+        self.assertEqual(sorted(rows, key=repr), sorted(ROWS2, key=repr),
+                         "Unexpected table content after applying diff patch.")
+
+        res, out, err = self.run_cmd("diff", testfile, dbname2)
+        self.assertFalse(res, "Unexpected failure from diff.")
+        self.assertIn('Table "b": identical', out, "Unexpected output in diff summary.")
+
+
     def verify_execute_blank(self):
         """Tests 'execute': queries on missing or blank database."""
         logger.info("Testing failure of query on nonexistent file.")
@@ -504,6 +628,102 @@ class TestCLI(unittest.TestCase):
         self.assertFalse(res, "Unexpected failure from export.")
         self.assertGreater(os.path.getsize(outfile), 6, "Output file not overwritten in export.")
 
+        logger.info("Testing export with --snapshot and --immutable.")
+        res, out, err = self.run_cmd("export", self._dbname, "-f", "json")
+        self.assertFalse(res, "Unexpected failure from export.")
+        for flag in ("--snapshot", "--immutable"):
+            res2, out2, err2 = self.run_cmd("export", self._dbname, "-f", "json", flag)
+            self.assertFalse(res2, "Unexpected failure from export with %s." % flag)
+            self.assertEqual(out2, out, "Unexpected output from export with %s." % flag)
+        outfile = self.mktemp(".db")
+        res, out, err = self.run_cmd("export", self._dbname, "-o", outfile, "--snapshot")
+        self.assertTrue(res, "Unexpected success from database export with --snapshot.")
+
+
+    def verify_export_copy(self):
+        """Tests 'export': complete database to new database file, with and without --vacuum."""
+        dbname = self.mktemp(".db")
+        shutil.copy(self._dbname, dbname)
+        with sqlite3.connect(dbname) as db:
+            db.execute("PRAGMA user_version = 3")
+            db.execute("CREATE TABLE counted (id INTEGER PRIMARY KEY AUTOINCREMENT, value)")
+            db.executemany("INSERT INTO counted (value) VALUES (?)", [[x] for x in TEXT_VALUES])
+            db.execute("DELETE FROM counted")
+
+        def get_content(filename):
+            """Returns ([schema rows], {table: [rows]}, user_version) from database."""
+            with sqlite3.connect(filename) as db:
+                schema = db.execute("SELECT type, name, tbl_name, sql FROM sqlite_master "
+                                    "ORDER BY type, name").fetchall()
+                data = {n: db.execute('SELECT * FROM "%s" ORDER BY rowid' % n).fetchall()
+                        for _, n, _, _ in schema if n and "table" == _}
+                version = db.execute("PRAGMA user_version").fetchone()[0]
+            return schema, data, version
+        expected = get_content(dbname)
+
+        for flags in ([], ["--vacuum"]):
+            logger.info("Testing export of complete database to new database%s.",
+                        " with %s" % flags[0] if flags else "")
+            outfile = self.mktemp(".db")
+            res, out, err = self.run_cmd("export", dbname, "-o", outfile, *flags)
+            self.assertFalse(res, "Unexpected failure from database export.")
+            self.assertEqual(get_content(outfile), expected,
+                             "Unexpected content in database export%s." %
+                             (" with %s" % flags[0] if flags else ""))
+
+        logger.info("Testing export with --vacuum and --select.")
+        outfile = self.mktemp(".db")
+        res, out, err = self.run_cmd("export", dbname, "-o", outfile, "--vacuum", "--select", "parent")
+        self.assertTrue(res, "Unexpected success from database export with --vacuum.")
+
+
+    def verify_export_profile(self):
+        """Tests 'export': --profile printing SQL statement timings."""
+        logger.info("Testing export with --profile.")
+        res, out, err = self.run_cmd("export", self._dbname, "-f", "json", "--profile")
+        self.assertFalse(res, "Unexpected failure from export with --profile.")
+        self.assertIn("SQL profile:", err, "Expected SQL profile in export with --profile.")
+        lines = [l for l in err.splitlines() if l.strip().startswith("Calls")]
+        self.assertEqual(len(lines), 1, "Expected profile header in export with --profile.")
+        for column in ("Stmts", "Total ms", "Mean ms", "P95 ms", "Rows", "Written", "SQL"):
+            self.assertIn(column, lines[0], "Expected %r in profile header." % column)
+        for name, rows in self.DATA.items():
+            line = next((l for l in err.splitlines() if l.endswith("FROM %s" % name)), None)
+            self.assertTrue(line, "Expected query on %s in profile." % name)
+            self.assertEqual(int(line.split()[5]), len(rows),
+                             "Unexpected row count for %s in profile." % name)
+
+        res, out, err = self.run_cmd("export", self._dbname, "-f", "json")
+        self.assertNotIn("SQL profile:", err, "Unexpected SQL profile in export.")
+
+
+    def verify_export_timings(self):
+        """Tests 'export': --timings writing phase timings to file."""
+        logger.info("Testing export with --timings.")
+        outfile, timingsfile = self.mktemp(".json"), self.mktemp(".json")
+        res, out, err = self.run_cmd("export", self._dbname, "-o", outfile, "--combine",
+                                     "--timings", timingsfile)
+        self.assertFalse(res, "Unexpected failure from export with --timings.")
+        self.assertTrue(os.path.isfile(timingsfile), "Timings file not created in export.")
+        with open(timingsfile) as f: timings = json.load(f)
+
+        KEYS = ["name", "wall", "cpu", "peak_rss", "rows", "bytes"]
+        for key in KEYS + ["started", "phases", "version", "command"]:
+            self.assertIn(key, timings, "Expected %r in export timings." % key)
+        self.assertEqual(timings["name"], "export", "Unexpected command in export timings.")
+        self.assertTrue(timings["phases"], "Expected phases in export timings.")
+        for phase in timings["phases"]:
+            for key in KEYS:
+                self.assertIn(key, phase, "Expected %r in export timings phase." % key)
+            self.assertGreaterEqual(phase["wall"], 0, "Unexpected phase time in export timings.")
+        self.assertIn("write output", [x["name"] for x in timings["phases"]],
+                      "Expected output phase in export timings.")
+        self.assertEqual(timings["rows"], sum(map(len, self.DATA.values())),
+                         "Unexpected row count in export timings.")
+        self.assertEqual(timings["rows"], sum(x["rows"] for x in timings["phases"]),
+                         "Unexpected phase row counts in export timings.")
+        self.assertGreater(timings["bytes"], 0, "Expected bytes in export timings.")
+
 
     def verify_import_formats(self):
         """Tests 'import': from different formats."""
@@ -1036,6 +1256,16 @@ class TestCLI(unittest.TestCase):
                                            "related": self.DATA["related"][::-1]},
                         "Unexpected output from search.")
 
+        for fmt in self.PRINTABLE_FORMATS:
+            logger.info("Testing search with --jobs as %s.", fmt.upper())
+            res, out1, err = self.run_cmd("search", self._dbname, "-f", fmt, "--limit", 5,
+                                          "--jobs", 1, "*")
+            self.assertFalse(res, "Unexpected failure from search.")
+            res, out2, err = self.run_cmd("search", self._dbname, "-f", fmt, "--limit", 5,
+                                          "--jobs", 3, "*")
+            self.assertFalse(res, "Unexpected failure from search.")
+            self.assertEqual(out1, out2, "Unexpected output from search with --jobs.")
+
 
     def verify_search_filters(self):
         """Tests 'search': filter SQL."""
@@ -1093,6 +1323,121 @@ class TestCLI(unittest.TestCase):
         self.assertEqual(json.loads(out or "{}"), self.DATA, "Unexpected output in search.")
 
 
+    def verify_search_index(self):
+        """Tests 'search': narrowing down via full-text index."""
+        logger.info("Testing search command with full-text index.")
+        indexpath = self._dbname + ".sqlitely-index"
+        self._paths.append(indexpath)
+
+        FILTERS = ["2 b", "this OR these", "~these", '"these two"', "column:fk 2", "thes*"]
+        for i, filterset in enumerate(FILTERS):
+            logger.info("Testing search command with --index %r.", filterset)
+            res, out1, err = self.run_cmd("search", self._dbname, "-f", "json", filterset)
+            self.assertFalse(res, "Unexpected failure from search.")
+            res, out2, err = self.run_cmd("search", self._dbname, "-f", "json",
+                                          "--reindex" if i else "--index", filterset)
+            self.assertFalse(res, "Unexpected failure from search.")
+            self.assertTrue(os.path.isfile(indexpath), "Expected index file to be created.")
+            self.assertEqual(json.loads(out1 or "{}"), json.loads(out2 or "{}"),
+                             "Unexpected output in search for %r with index." % filterset)
+
+        FILTERS = ["2 b", "hes", "~hes", '"se tw"', "column:fk 2", "th*s t*wo", "table:parent is"]
+        for i, filterset in enumerate(FILTERS):
+            logger.info("Testing search command with --trigram %r.", filterset)
+            res, out1, err = self.run_cmd("search", self._dbname, "-f", "json", filterset)
+            self.assertFalse(res, "Unexpected failure from search.")
+            args = ["--trigram", "--reindex"] if i else ["--trigram"]
+            res, out2, err = self.run_cmd("search", self._dbname, "-f", "json", filterset, *args)
+            self.assertFalse(res, "Unexpected failure from search.")
+            self.assertEqual(json.loads(out1 or "{}"), json.loads(out2 or "{}"),
+                             "Unexpected output in search for %r with trigram index." % filterset)
+
+        logger.info("Testing search command with --index output to database.")
+        res, out, err = self.run_cmd("search", self._dbname, "-f", "json", "--no-empty", "these")
+        self.assertFalse(res, "Unexpected failure from search.")
+        expected = json.loads(out or "{}")
+        outfile = self.mktemp(".db")
+        res, out, err = self.run_cmd("search", self._dbname, "-f", "db", "-o", outfile,
+                                     "--no-empty", "--index", "these")
+        self.assertFalse(res, "Unexpected failure from search with index output to database.")
+        with sqlite3.connect(outfile) as db:
+            db.row_factory = sqlite3.Row
+            output = {n: [dict(r) for r in db.execute("SELECT * FROM %s" % n)]
+                      for (n, ) in db.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        self.assertEqual(output, expected, "Unexpected output in search with index to database.")
+        with sqlite3.connect(self._dbname) as db:
+            names = [n for (n, ) in db.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+        self.assertEqual(sorted(names), sorted(self.SCHEMA), "Unexpected change in source schema.")
+
+        logger.info("Testing search command with --index after changes.")
+        with sqlite3.connect(self._dbname) as db:
+            db.execute("INSERT INTO parent (id, value) VALUES (1000, 'newword')")
+        res, out, err = self.run_cmd("search", self._dbname, "-f", "json", "--no-empty",
+                                     "--index", "newwo")
+        self.assertFalse(res, "Unexpected failure from search.")
+        self.assertEqual(list(json.loads(out or "{}")), ["parent"],
+                         "Unexpected output in search with index.")
+        with sqlite3.connect(self._dbname) as db:
+            db.execute("UPDATE parent SET value = 'otherword' WHERE id = 1000")
+        for filterset, expected in [("otherwo", ["parent"]), ("newwo", [])]:
+            res, out, err = self.run_cmd("search", self._dbname, "-f", "json", "--no-empty",
+                                         "--index", filterset)
+            self.assertFalse(res, "Unexpected failure from search.")
+            self.assertEqual(list(json.loads(out or "{}")), expected,
+                             "Unexpected output in search with index after update.")
+        with sqlite3.connect(self._dbname) as db:
+            db.execute("DELETE FROM parent WHERE id = 1000")
+        res, out, err = self.run_cmd("search", self._dbname, "-f", "json", "--no-empty",
+                                     "--index", "otherwo")
+        self.assertFalse(res, "Unexpected failure from search.")
+        self.assertEqual(json.loads(out or "{}"), {}, "Unexpected output in search with index.")
+        res, out, err = self.run_cmd("search", self._dbname, "-f", "json", "--no-empty",
+                                     "--index", "newwo")
+        self.assertFalse(res, "Unexpected failure from search.")
+        self.assertEqual(json.loads(out or "{}"), {}, "Unexpected output in search with index.")
+
+        logger.info("Testing search command with --index in snapshot mode.")
+        res, out, err = self.run_cmd("search", self._dbname, "--index", "--snapshot", "b")
+        self.assertTrue(res, "Unexpected success from search with index in snapshot mode.")
+
+
+    def verify_search_dates(self):
+        """Tests 'search': date keywords on dates stored as text, Julian days and Unix time."""
+        logger.info("Testing search command with date keywords.")
+        dbname = self.mktemp(".db")
+        DATES = ["2019-12-31 23:59:59", "2020-01-01 00:00:00", "2020-02-29T12:00:00",
+                 "2020-03-01", "2021-01-01 00:00:01", None]
+        with sqlite3.connect(dbname) as db:
+            db.execute("CREATE TABLE dates (id INTEGER PRIMARY KEY, iso DATETIME, "
+                       "jd TIMESTAMP, ux DATETIME)")
+            for i, d in enumerate(DATES):
+                db.execute("INSERT INTO dates VALUES (?, ?, JULIANDAY(?), "
+                           "CAST(STRFTIME('%s', ?) AS INTEGER))", [i, d, d, d])
+            db.execute("CREATE INDEX dates_iso ON dates (iso)")
+
+        FILTERS = {
+            "date:2020":              [1, 2, 3],
+            "date:2020-02":           [2],
+            "date:2020-02-29":        [2],
+            "date:2019-12-31":        [0],
+            "date:2020-01..2020-02":  [1, 2],
+            "date:..2019":            [0],
+            "date:2020-03..":         [3, 4],
+            "~date:2020":             [0, 4, 5],
+            "date:*-*-01":            [1, 3, 4],
+        }
+        for filterset, ids in FILTERS.items():
+            for col in ("iso", "jd", "ux"):
+                logger.info("Testing search command with %r on column %s.", filterset, col)
+                res, out, err = self.run_cmd("search", dbname, "-f", "json", "--no-empty",
+                                             "column:%s" % col, filterset)
+                self.assertFalse(res, "Unexpected failure from search.")
+                received = [x["id"] for x in json.loads(out or "{}").get("dates", [])]
+                self.assertEqual(sorted(received), ids,
+                                 "Unexpected output in search for %r on column %s." %
+                                 (filterset, col))
+
+
     def verify_stats_formats(self):
         """Tests 'stats': output to console and file in different formats."""
         logger.info("Testing stats output in all formats.")
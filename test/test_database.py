@@ -0,0 +1,442 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests database module.
+
+------------------------------------------------------------------------------
+This file is part of SQLitely - SQLite database tool.
+Released under the MIT License.
+
+@author      Erki Suurjaak
+@created     17.10.2026
+@modified    17.10.2026
+------------------------------------------------------------------------------
+"""
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from sqlitely import conf
+from sqlitely import database
+from sqlitely import grammar
+from sqlitely.lib import util
+
+
+logger = logging.getLogger()
+
+
+ROWCOUNT = 50000
+
+
+class TestDatabase(unittest.TestCase):
+    """Tests the Database class and its helpers."""
+
+
+    SCHEMA_SQL = ["CREATE TABLE parent (id INTEGER PRIMARY KEY, value)",
+                  "CREATE TABLE child (id INTEGER PRIMARY KEY, value, "
+                  "fk REFERENCES parent (id))",
+                  "CREATE INDEX child_idx ON child (fk)",
+                  "CREATE TABLE grandchild (id INTEGER PRIMARY KEY, "
+                  "fk REFERENCES child (id))"]
+
+
+    def __init__(self, *args, **kwargs):
+        super(TestDatabase, self).__init__(*args, **kwargs)
+        self.maxDiff = None  # Full diff on assert failure
+        self._db     = None  # database.Database instance
+        self._dbname = None  # Path to test database
+        self._paths  = []    # [path to temporary test file, ]
+
+
+    def setUp(self):
+        """Creates and opens test database."""
+        super(TestDatabase, self).setUp()
+        self._dbname = self.mktemp(".db")
+        self.populate_db(self._dbname)
+        self._db = database.Database(self._dbname)
+
+
+    def tearDown(self):
+        """Closes test database, deletes temporary files."""
+        try: self._db and self._db.close()
+        except Exception: pass
+        for path in self._paths:
+            try: (shutil.rmtree if os.path.isdir(path) else os.remove)(path)
+            except Exception: pass
+        super(TestDatabase, self).tearDown()
+
+
+    def populate_db(self, filename):
+        """Populates an SQLite database with schema and data."""
+        with sqlite3.connect(filename) as db:
+            db.executescript(";\n\n".join(self.SCHEMA_SQL))
+            db.executemany("INSERT INTO parent VALUES (?, ?)",
+                           [(i, "parent %s" % i) for i in range(ROWCOUNT)])
+            db.executemany("INSERT INTO child VALUES (?, ?, ?)",
+                           [(i, "child %s" % i, i // 2) for i in range(ROWCOUNT)])
+            db.executemany("INSERT INTO grandchild VALUES (?, ?)",
+                           [(i, i // 2) for i in range(100)])
+
+
+    def test_backup(self):
+        """Tests copying complete database to another file."""
+        logger.info("Testing database backup.")
+
+        self.verify_backup_online()
+        self.verify_backup_vacuum()
+        self.verify_backup_cancel()
+        self.verify_backup_copy()
+
+
+    def test_readers(self):
+        """Tests read-only connection pool, used only in WAL mode."""
+        logger.info("Testing read connections.")
+        if sys.version_info < (3, 4): return
+        self.assertIs(self._db.get_reader(), self._db.connection,
+                      "Expected main connection outside WAL mode.")
+
+        self._db.execute("PRAGMA journal_mode = WAL")
+        reader = self._db.get_reader()
+        self.assertIsNot(reader, self._db.connection, "Expected separate connection in WAL mode.")
+        self.assertIs(self._db.get_reader(), reader, "Expected same connection in same thread.")
+        with self.assertRaises(sqlite3.OperationalError):
+            reader.execute("DELETE FROM parent")
+
+        others = []
+        thread = threading.Thread(target=lambda: others.append(self._db.get_reader()))
+        thread.start(), thread.join()
+        self.assertNotIn(others[0], (reader, self._db.connection),
+                         "Expected separate connection in other thread.")
+
+        self._db.execute("INSERT INTO parent VALUES (?, ?)", [ROWCOUNT, "new"])
+        row = reader.execute("SELECT value FROM parent WHERE id = ?", [ROWCOUNT]).fetchone()
+        self.assertEqual(row, {"value": "new"}, "Expected committed write visible to reader.")
+
+        self._db.release_reader()
+        self.assertNotIn(threading.current_thread(), self._db.readers,
+                         "Expected reader released.")
+        self._db.execute("PRAGMA journal_mode = DELETE")
+        self.assertIs(self._db.get_reader(), self._db.connection,
+                      "Expected main connection after leaving WAL mode.")
+        self.assertFalse(self._db.readers, "Expected readers closed after leaving WAL mode.")
+
+
+    def test_counts(self):
+        """Tests exact and estimated table row counts."""
+        logger.info("Testing table row counts.")
+        self._db.execute("DELETE FROM parent WHERE id < 10")
+        self._db.populate_schema()
+
+        result = self._db.get_count("parent")
+        self.assertEqual(result, {"count": ROWCOUNT - 10}, "Unexpected count for small file.")
+
+        limits = conf.MaxDBSizeForFullCount, conf.MaxTableRowIDForFullCount
+        conf.MaxDBSizeForFullCount, conf.MaxTableRowIDForFullCount = 0, 0
+        try:
+            result = self._db.get_count("parent")
+            self.assertEqual(result, {"count": ROWCOUNT, "is_count_estimated": True},
+                             "Unexpected estimated count.")
+            result = self._db.get_count("parent", exact=True)
+            self.assertEqual(result, {"count": ROWCOUNT - 10}, "Unexpected exact count.")
+        finally:
+            conf.MaxDBSizeForFullCount, conf.MaxTableRowIDForFullCount = limits
+
+        for wal in (False, True):
+            if wal: self._db.execute("PRAGMA journal_mode = WAL")
+            logger.info("Testing counting tables%s.", " in WAL mode" if wal else "")
+            for table in self._db.schema["table"].values(): table["count"] = None
+            calls = []
+            result = self._db.count_tables(progress=lambda **kw: calls.append(kw) or True)
+            self.assertEqual(result, {"parent": ROWCOUNT - 10, "child": ROWCOUNT,
+                                      "grandchild": 100}, "Unexpected table counts.")
+            self.assertEqual({k: v["count"] for k, v in self._db.schema["table"].items()},
+                             result, "Unexpected counts in schema.")
+            self.assertEqual(calls[-1], {"done": True}, "Expected final progress.")
+            self.assertEqual(sorted(x["name"] for x in calls if "name" in x), sorted(result),
+                             "Unexpected progress.")
+
+
+    def test_parse_processes(self):
+        """Tests parsing schema SQL in worker processes."""
+        logger.info("Testing parsing in worker processes.")
+        make = lambda prefix: ["CREATE TABLE %s_%s (id INTEGER PRIMARY KEY, value%s TEXT)" %
+                               (prefix, i, i) for i in range(20)]
+        texts = make("parse")
+        cache = util.memoize.get_cache(grammar.parse)
+        processes = conf.MaxParseProcesses
+        conf.MaxParseProcesses = 2
+        try:
+            result = database.parse_in_processes(make("cancel"), progress=lambda **_: False)
+            if result is None: return # Single CPU
+            self.assertFalse(result, "Unexpected result from cancelled parse.")
+
+            calls = []
+            progress = lambda **kw: calls.append(kw) or True
+            result = database.parse_in_processes(texts, progress=progress)
+        finally:
+            conf.MaxParseProcesses = processes
+        self.assertTrue(result, "Unexpected result from parse.")
+        self.assertEqual(calls[-1], {"index": len(texts), "total": len(texts)},
+                         "Unexpected final progress.")
+        for i, sql in enumerate(texts):
+            self.assertIn((sql, ), cache, "Expected parse result cached.")
+            meta, error = cache[(sql, )]
+            self.assertIsNone(error, "Unexpected parse error.")
+            self.assertEqual((meta["name"], [x["name"] for x in meta["columns"]]),
+                             ("parse_%s" % i, ["id", "value%s" % i]), "Unexpected parse result.")
+            self.assertEqual(cache[(sql, )], grammar.parse(sql), "Unexpected parse result.")
+
+
+    def test_introspection(self):
+        """Tests retrieving schema columns and PRAGMA values in batched queries."""
+        logger.info("Testing schema introspection.")
+        if not self._db.has_feature("pragma_functions"): return
+        self._db.execute("CREATE VIEW parent_view AS SELECT id, value AS v FROM parent")
+        self._db.execute("CREATE TABLE dropped (id)")
+        self._db.execute("CREATE VIEW invalid_view AS SELECT id FROM dropped")
+        self._db.execute("DROP TABLE dropped")
+
+        result = self._db.get_column_rows(["table", "index", "view"])
+        self.assertNotIn("view", result, "Unexpected view columns with invalid view.")
+        self._db.execute("DROP VIEW invalid_view")
+        result = self._db.get_column_rows(["table", "index", "view"])
+        expected = {c: {n: self._db.execute("PRAGMA %s(%s)" % (p, n)).fetchall() for n in ns}
+                    for c, p, ns in [("table", "table_info", ["child", "grandchild", "parent"]),
+                                     ("index", "index_info", ["child_idx"]),
+                                     ("view",  "table_info", ["parent_view"])]}
+        self.assertEqual(result, expected, "Unexpected columns from batched query.")
+
+        self._db.execute("CREATE TABLE dropped (id)")
+        self._db.execute("CREATE VIEW invalid_view AS SELECT id FROM dropped")
+        self._db.execute("DROP TABLE dropped")
+        self._db.populate_schema()
+        columns = lambda c, n: [x["name"] for x in self._db.schema[c][n]["columns"]]
+        self.assertEqual(columns("table", "parent"), ["id", "value"], "Unexpected table columns.")
+        self.assertEqual(columns("view", "parent_view"), ["id", "v"], "Unexpected view columns.")
+        self.assertEqual(columns("index", "child_idx"), ["fk"], "Unexpected index columns.")
+
+        logger.info("Testing retrieving PRAGMA values.")
+        self._db.execute("PRAGMA user_version = 7")
+        result = self._db.get_pragma_values()
+        self.assertEqual(result["user_version"], 7, "Unexpected PRAGMA value.")
+        support = database.Database.FEATURE_SUPPORT
+        database.Database.FEATURE_SUPPORT = dict(support, pragma_functions=(sys.maxsize, ))
+        try: expected = self._db.get_pragma_values()
+        finally: database.Database.FEATURE_SUPPORT = support
+        self.assertEqual(result, expected, "Unexpected PRAGMA values from batched query.")
+
+
+    def test_save_rows(self):
+        """Tests saving row changes in one transaction, rolled back on error."""
+        logger.info("Testing saving table rows.")
+        self._db.populate_schema(parse=True)
+        get = lambda id: self._db.execute("SELECT * FROM parent WHERE id = ?", [id]).fetchone()
+        row1, row2 = get(1), get(2)
+
+        logger.info("Testing saving rows with a failing insert.")
+        updates = [(dict(row1, value="changed"), row1, None)]
+        inserts = [{"id": ROWCOUNT, "value": "new"}, {"id": 2, "value": "duplicate"}]
+        deletes = [(row2, None)]
+        with self.assertRaises(sqlite3.IntegrityError):
+            self._db.save_rows("parent", updates, inserts, deletes)
+        self.assertEqual(get(1), row1, "Unexpected update after rollback.")
+        self.assertEqual(get(2), row2, "Unexpected delete after rollback.")
+        self.assertIsNone(get(ROWCOUNT), "Unexpected insert after rollback.")
+
+        logger.info("Testing saving rows successfully.")
+        result = self._db.save_rows("parent", updates, inserts[:1], deletes)
+        self.assertEqual(result, [ROWCOUNT], "Unexpected result from saving rows.")
+        self.assertEqual(get(1), dict(row1, value="changed"), "Unexpected update.")
+        self.assertIsNone(get(2), "Unexpected row after delete.")
+        self.assertEqual(get(ROWCOUNT), inserts[0], "Unexpected insert.")
+
+
+    def test_delete_cascade(self):
+        """Tests deleting rows with cascade to related rows over several levels."""
+        logger.info("Testing cascading delete.")
+        self._db.populate_schema(parse=True)
+        ids = lambda table: [x["id"] for x in self._db.execute(
+            "SELECT id FROM %s WHERE id < 13 ORDER BY id" % table
+        ).fetchall()]
+
+        result = self._db.delete_cascade("parent", [{"id": 1}, {"id": 2}])
+        deleted = [(t, sorted(list(x.values())[0] for x in rows)) for t, rows in result]
+        self.assertEqual(deleted, [("parent", [1, 2]), ("child", [2, 3, 4, 5]),
+                                   ("grandchild", [4, 5, 6, 7, 8, 9, 10, 11])],
+                         "Unexpected result from cascading delete.")
+        self.assertEqual(ids("parent"), [0] + list(range(3, 13)), "Unexpected parent rows.")
+        self.assertEqual(ids("child"), [0, 1] + list(range(6, 13)), "Unexpected child rows.")
+        self.assertEqual(ids("grandchild"), [0, 1, 2, 3, 12], "Unexpected grandchild rows.")
+
+        temps = self._db.execute("SELECT name FROM sqlite_temp_master").fetchall()
+        self.assertFalse(temps, "Temporary tables left after cascading delete.")
+
+        logger.info("Testing cascading delete by ROWID.")
+        result = self._db.delete_cascade("parent", [{}], rowids=[3])
+        deleted = [(t, sorted(list(x.values())[0] for x in rows)) for t, rows in result]
+        self.assertEqual(deleted, [("parent", [3]), ("child", [6, 7]),
+                                   ("grandchild", [12, 13, 14, 15])],
+                         "Unexpected result from cascading delete by ROWID.")
+
+
+    def test_datarow(self):
+        """Tests lazy resultset rows: equality with dictionaries and JSON round-trip."""
+        logger.info("Testing lazy resultset rows.")
+        sql = "SELECT id, value, id / 2.0 AS half, NULL AS empty, " \
+              "CAST(value AS BLOB) AS blob, 'õ' AS value FROM parent WHERE id < 3 ORDER BY id"
+        rows = self._db.execute(sql).fetchall()
+        lazyrows = self._db.execute(sql, lazy=True).fetchall()
+
+        self.assertTrue(all(isinstance(x, database.DataRow) for x in lazyrows),
+                        "Unexpected row type for lazy query.")
+        self.assertEqual(lazyrows, rows, "Unexpected lazy rows.")
+        self.assertEqual(rows, lazyrows, "Unexpected lazy rows in reverse comparison.")
+        self.assertNotEqual(lazyrows[0], lazyrows[1], "Unexpected equality of different rows.")
+        self.assertNotEqual(lazyrows[0], dict(rows[0], id=-1), "Unexpected equality.")
+
+        row, lazyrow = rows[1], lazyrows[1]
+        self.assertEqual(lazyrow.keys(), ["id", "value", "half", "empty", "blob"],
+                         "Unexpected lazy row columns.")
+        self.assertEqual((len(lazyrow), list(lazyrow)), (5, lazyrow.keys()),
+                         "Unexpected lazy row length or iteration.")
+        self.assertEqual(lazyrow["blob"], "parent 1", "Unexpected BLOB value in lazy row.")
+        self.assertEqual(lazyrow["value"], u"õ", "Unexpected duplicate column value.")
+        self.assertIn("empty", lazyrow, "Expected column in lazy row.")
+        self.assertNotIn("missing", lazyrow, "Unexpected column in lazy row.")
+        with self.assertRaises(KeyError): lazyrow["missing"]
+        self.assertEqual(lazyrow.copy(), row, "Unexpected copy of lazy row.")
+        self.assertIsNot(lazyrow.copy(), lazyrow.copy(), "Expected fresh copies of lazy row.")
+
+        text = json.dumps(lazyrow.copy(), sort_keys=True)
+        self.assertEqual(text, json.dumps(row, sort_keys=True), "Unexpected JSON of lazy row.")
+        self.assertEqual(json.loads(text), lazyrow, "Unexpected lazy row after JSON round-trip.")
+
+
+    def test_actionlog(self):
+        """Tests action log: spilling older entries to file and reading them back in pages."""
+        logger.info("Testing action log.")
+        make = lambda i: {"action": "SQL", "sql": "SELECT %s" % i, "params": [i]}
+
+        log = database.ActionLog(maxsize=10, spill=True)
+        log.PAGE_SIZE = 3
+        for i in range(25): log.append(make(i))
+        log.append(make(24)); log.append(make(24))
+        log.append(dict(make(25), params=[threading.Lock()])) # Unpicklable
+        for i in range(26, 40): log.append(make(i))
+        path = log._path
+        self.assertTrue(path and os.path.isfile(path), "Expected spill file.")
+        self.assertTrue(log.spilled, "Expected entries spilled to file.")
+        self.assertLessEqual(len(log.entries), log.maxsize, "Too many entries in memory.")
+        self.assertEqual((len(log), log.dropped), (40, 0), "Unexpected log size.")
+
+        entries = list(log)
+        self.assertEqual([x["sql"] for x in entries], ["SELECT %s" % i for i in range(40)],
+                         "Unexpected entries from paged iteration.")
+        self.assertEqual(entries[24].get("count"), 3, "Expected identical entries summarized.")
+        self.assertIsInstance(entries[25]["params"], str, "Expected unpicklable value as text.")
+        self.assertEqual(entries[:25], [dict(make(i), **{"count": 3} if i == 24 else {})
+                                        for i in range(25)], "Unexpected spilled entries.")
+
+        start = log.spilled - 2 # Page spanning spill file and memory
+        self.assertEqual(log.get(start, 4), entries[start:start + 4], "Unexpected page.")
+        self.assertEqual(log.get(38), entries[38:], "Unexpected last page.")
+        self.assertEqual(log.get(50, 10), [], "Unexpected page past end.")
+
+        log.clear()
+        self.assertFalse(os.path.exists(path), "Expected spill file deleted on clear.")
+        self.assertEqual((len(log), list(log)), (0, []), "Unexpected entries after clear.")
+
+        logger.info("Testing action log without spill.")
+        log = database.ActionLog(maxsize=10, spill=False)
+        for i in range(25): log.append(make(i))
+        self.assertIsNone(log._path, "Unexpected spill file.")
+        self.assertEqual(len(log) + log.dropped, 25, "Unexpected log size.")
+        self.assertEqual([x["sql"] for x in log], ["SELECT %s" % i for i in range(log.dropped, 25)],
+                         "Unexpected entries retained without spill.")
+
+
+    def verify_backup_online(self):
+        """Tests backup(): online backup with progress."""
+        if not hasattr(self._db.connection, "backup"): return
+        logger.info("Testing backup via online backup API.")
+        filename, calls = self.mktemp(".db"), []
+        result = self._db.backup(filename, progress=lambda **kw: calls.append(kw) or True)
+        self.assertTrue(result, "Unexpected result from backup.")
+        self.assertTrue(calls, "Expected progress to be reported.")
+        self.assertEqual(calls[-1]["index"], calls[-1]["total"], "Unexpected final progress.")
+        self.assertEqual(self.dump(filename), self.dump(self._dbname),
+                         "Unexpected content in backup.")
+
+
+    def verify_backup_vacuum(self):
+        """Tests backup(): VACUUM INTO, and error if not supported."""
+        if self._db.has_feature("vacuum_into"):
+            logger.info("Testing backup via VACUUM INTO.")
+            filename = self.mktemp(".db")
+            self.assertTrue(self._db.backup(filename, vacuum=True),
+                            "Unexpected result from backup with vacuum.")
+            self.assertEqual(self.dump(filename), self.dump(self._dbname),
+                             "Unexpected content in backup with vacuum.")
+
+        logger.info("Testing backup via VACUUM INTO if not supported.")
+        support = database.Database.FEATURE_SUPPORT
+        database.Database.FEATURE_SUPPORT = dict(support, vacuum_into=(sys.maxsize, ))
+        try:
+            with self.assertRaises(Exception) as ctx:
+                self._db.backup(self.mktemp(".db"), vacuum=True)
+            self.assertIn("VACUUM INTO", str(ctx.exception), "Unexpected error from backup.")
+        finally:
+            database.Database.FEATURE_SUPPORT = support
+
+
+    def verify_backup_cancel(self):
+        """Tests backup(): cancelling from progress callback."""
+        logger.info("Testing backup cancel.")
+        for vacuum in (False, True):
+            if vacuum and not self._db.has_feature("vacuum_into"): continue # for vacuum
+            result = self._db.backup(self.mktemp(".db"), vacuum=vacuum, progress=lambda **_: False)
+            self.assertIsNone(result, "Unexpected result from cancelled backup.")
+        self.assertTrue(self._db.execute("SELECT 1").fetchone(), "Database unusable after cancel.")
+
+
+    def verify_backup_copy(self):
+        """Tests backup(): file copy fallback, including uncheckpointed WAL content."""
+        logger.info("Testing backup via file copy.")
+        self._db.execute("PRAGMA journal_mode = WAL")
+        self._db.execute("INSERT INTO parent VALUES (?, ?)", [ROWCOUNT, "in WAL"])
+        filename, calls = self.mktemp(".db"), []
+        result = self._db._copy_file(filename, progress=lambda **kw: calls.append(kw) or True)
+        self.assertTrue(result, "Unexpected result from file copy.")
+        self.assertEqual(calls[-1]["index"], calls[-1]["total"], "Unexpected final progress.")
+        self.assertEqual(self.dump(filename), self.dump(self._dbname),
+                         "Unexpected content in file copy.")
+
+        result = self._db._copy_file(self.mktemp(".db"), progress=lambda **_: False)
+        self.assertIsNone(result, "Unexpected result from cancelled file copy.")
+
+
+    def dump(self, filename):
+        """Returns database schema and content as SQL statements."""
+        with sqlite3.connect(filename) as db:
+            return list(db.iterdump())
+
+
+    def mktemp(self, suffix=None):
+        """Returns path of a new temporary file, deleted at teardown."""
+        fh, path = tempfile.mkstemp(suffix)
+        os.close(fh), os.remove(path)
+        self._paths.extend([path, path + "-wal", path + "-shm"])
+        return path
+
+
+if "__main__" == __name__:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s\t[%(levelname)s]\t%(message)s")
+    unittest.main()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests utility module.
+
+------------------------------------------------------------------------------
+This file is part of SQLitely - SQLite database tool.
+Released under the MIT License.
+
+@author      Erki Suurjaak
+@created     17.10.2026
+@modified    17.10.2026
+------------------------------------------------------------------------------
+"""
+import datetime
+import logging
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from sqlitely import conf
+from sqlitely import grammar
+from sqlitely.lib import util
+
+
+logger = logging.getLogger()
+
+
+class TestUtil(unittest.TestCase):
+    """Tests utility functions and classes."""
+
+
+    def __init__(self, *args, **kwargs):
+        super(TestUtil, self).__init__(*args, **kwargs)
+        self.maxDiff = None # Full diff on assert failure
+        self._paths  = []   # [path to temporary test file, ]
+
+
+    def tearDown(self):
+        """Deletes temporary files."""
+        for path in self._paths:
+            try: os.remove(path)
+            except Exception: pass
+        super(TestUtil, self).tearDown()
+
+
+    def test_diskcache(self):
+        """Tests DiskCache persistence, eviction and failure handling."""
+        logger.info("Testing DiskCache.")
+        path = self.mktemp(".db")
+        cache = util.DiskCache(path, maxsize=1000)
+        key = cache.make_key("a", 1, [None])
+        self.assertEqual(key, util.DiskCache.make_key("a", 1, [None]), "Unexpected key.")
+        self.assertNotEqual(key, cache.make_key("a", 1, [0]), "Unexpected key for other args.")
+        with self.assertRaises(Exception): cache.make_key(object())
+
+        self.assertIsNone(cache.get(key), "Unexpected value for missing key.")
+        self.assertTrue(cache.set(key, {"x": [1, "y"]}), "Expected value stored.")
+        self.assertFalse(cache.set("other", object()), "Unexpected unserializable value stored.")
+        cache2 = util.DiskCache(path, maxsize=1000)
+        self.assertEqual(cache2.get(key), {"x": [1, "y"]}, "Expected value shared via file.")
+
+        logger.info("Testing DiskCache eviction.")
+        for i in range(20): cache.set("key%s" % i, "x" * 98) # 100 bytes in JSON
+        cache.prune()
+        keys = [k for k in ["key%s" % i for i in range(20)] if cache.get(k) is not None]
+        self.assertTrue(keys and len(keys) <= 9, "Unexpected entries retained after prune.")
+        self.assertEqual(keys, ["key%s" % i for i in range(20 - len(keys), 20)],
+                         "Expected least recently used entries evicted.")
+        cache.clear()
+        self.assertIsNone(cache2.get("key19"), "Unexpected value after clear.")
+        cache.close(), cache2.close()
+
+        logger.info("Testing DiskCache with unusable file.")
+        cache = util.DiskCache(os.path.join(path, "sub", "cache.db"), maxsize=1000)
+        self.assertFalse(cache.set(key, 1), "Unexpected value stored in unusable cache.")
+        self.assertEqual(cache.get(key, "default"), "default", "Unexpected value.")
+
+
+    def test_parse_cache(self):
+        """Tests parse results stored in persistent file cache."""
+        logger.info("Testing persistent parse cache.")
+        path, sql = self.mktemp(".db"), "CREATE TABLE parse_cache (id INTEGER PRIMARY KEY)"
+        grammar.set_cache_file(path, 1e6)
+        try:
+            result = grammar.parse(sql)
+            self.assertIsNone(result[1], "Unexpected parse error.")
+            key = util.DiskCache.make_key("parse", conf.Version, conf.VersionDate, [sql], {})
+            cached = util.DiskCache(path, 1e6).get(key)
+            self.assertEqual(tuple(cached or ()), result, "Expected parse result in file cache.")
+            self.assertIsNone(grammar.parse("CREATE TABLE parse_cache (")[0],
+                              "Unexpected result from invalid SQL.")
+        finally:
+            grammar.set_cache_file(None, None)
+
+
+    def test_memocache(self):
+        """Tests MemoCache bounds and copying."""
+        logger.info("Testing MemoCache.")
+
+        self.verify_memocache_maxsize()
+        self.verify_memocache_maxbytes()
+        self.verify_memocache_copies()
+        self.verify_memoize()
+
+
+    def verify_memocache_maxsize(self):
+        """Tests MemoCache: least recently used entries evicted over maxsize."""
+        logger.info("Testing MemoCache eviction by entry count.")
+        cache = util.MemoCache(maxsize=3)
+        for i in range(3): cache[i] = "value %s" % i
+        self.assertEqual(cache.get(0), "value 0", "Unexpected cached value.")
+        cache[3] = "value 3" # Evicts 1 as least recently used
+        self.assertEqual(len(cache), 3, "Unexpected cache size.")
+        self.assertNotIn(1, cache, "Expected least recently used entry evicted.")
+        for key in (0, 2, 3): self.assertIn(key, cache, "Expected entry %r retained." % key)
+        self.assertIsNone(cache.get(1), "Unexpected value for evicted entry.")
+        cache[2] = "value 2b" # Overwriting does not evict
+        self.assertEqual(len(cache), 3, "Unexpected cache size after overwrite.")
+        self.assertEqual(cache[2], "value 2b", "Unexpected overwritten value.")
+
+        stats = cache.stats()
+        self.assertEqual((stats["size"], stats["hits"], stats["misses"], stats["evictions"]),
+                         (3, 1, 1, 1), "Unexpected cache statistics.")
+
+
+    def verify_memocache_maxbytes(self):
+        """Tests MemoCache: least recently used entries evicted over maxbytes."""
+        logger.info("Testing MemoCache eviction by size.")
+        value = "x" * 1000
+        cache = util.MemoCache(maxsize=None, maxbytes=sys.getsizeof(value) * 2.5)
+        for i in range(5): cache[i] = value
+        self.assertEqual(sorted(cache._items), [3, 4], "Unexpected retained entries.")
+        self.assertLessEqual(cache.bytes, cache.maxbytes, "Cache size over budget.")
+        self.assertEqual(cache.stats()["evictions"], 3, "Unexpected eviction count.")
+
+        cache[5] = "y" * 10000 # Single entry over budget is retained
+        self.assertEqual(list(cache._items), [5], "Unexpected retained entries.")
+        cache.clear()
+        self.assertEqual((len(cache), cache.bytes), (0, 0), "Unexpected size after clear.")
+
+
+    def verify_memocache_copies(self):
+        """Tests MemoCache: container values returned as fresh copies."""
+        logger.info("Testing MemoCache copies.")
+        cache = util.MemoCache()
+        frozen, other = {"a": [1, 2], "b": None}, [{"a": 1}, datetime.date(2026, 10, 17)]
+        for key, value in (("frozen", frozen), ("other", other)):
+            result = cache.set(key, value)
+            self.assertEqual(result, value, "Unexpected result from setting %r." % key)
+            cached1, cached2 = cache.get(key), cache[key]
+            self.assertEqual(cached1, value, "Unexpected cached %r." % key)
+            self.assertIsNot(cached1, cached2, "Expected fresh copies of %r." % key)
+            cached1[0 if isinstance(value, list) else "a"] = "changed"
+            self.assertEqual(cache.get(key), value, "Cached %r modified via copy." % key)
+        self.assertTrue(cache._items["frozen"][1], "Expected plain value stored frozen.")
+        self.assertFalse(cache._items["other"][1], "Expected non-builtin value stored as is.")
+
+
+    def verify_memoize(self):
+        """Tests memoize(): results cached in bounded cache per function."""
+        logger.info("Testing memoize.")
+        calls = []
+        @util.memoize(__maxsize__=2)
+        def double(x):
+            calls.append(x)
+            return x * 2
+
+        results = [double(x) for x in (1, 2, 1, 3, 1, 2)]
+        self.assertEqual(results, [2, 4, 2, 6, 2, 4], "Unexpected memoized results.")
+        self.assertEqual(calls, [1, 2, 3, 2], "Unexpected calls to memoized function.")
+        stats = util.memoize.get_cache(double).stats()
+        self.assertEqual((stats["size"], stats["maxsize"]), (2, 2), "Unexpected cache size.")
+
+
+    def mktemp(self, suffix=None):
+        """Returns path of a new temporary file, deleted at teardown."""
+        fh, path = tempfile.mkstemp(suffix)
+        os.close(fh), os.remove(path)
+        self._paths.extend([path, path + "-wal", path + "-shm"])
+        return path
+
+
+if "__main__" == __name__:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s\t[%(levelname)s]\t%(message)s")
+    unittest.main()